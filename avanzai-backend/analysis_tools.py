@@ -7,6 +7,12 @@ from agents import function_tool
 from pathlib import Path
 from io import BytesIO
 from dotenv import load_dotenv
+from pricing_catalog import ANALYSIS, snapshot_cache_for
+from pricing_dataset import read_long_pricing, read_wide_pricing
+from returns_engine import PriceMatrix, compute_returns
+from correlation_engine import corr_frame, regime_corr, rolling_corr, top_pairs
+from returns_store import snapshot_returns
+from period_returns import HORIZONS, YTD, horizon_returns, window_returns
 load_dotenv()
 
 # ------------------ in-memory hand-off store ------------------
@@ -18,32 +24,77 @@ def _save(df: pd.DataFrame) -> str:
 def _fetch(df_id: str) -> pd.DataFrame: return _DF_STORE[df_id]
 
 # ------------------ loader stubs (price + macro) ---------------
-def load_price_s3(ticker: str) -> str:
-    """Read one column from your az_pricing_*.parquet in S3, return df_id.
+def load_price_s3(ticker: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
+    """Read one column from the 'analysis' pricing snapshot in S3, return df_id.
+
+    The snapshot is resolved through the pricing catalog and served from the
+    shared in-memory cache of that version, so repeated tool calls only
+    project a column instead of re-downloading it.
+    When ``PRICING_DATASET_URI`` is set the long-format pricing dataset is used instead.
     
     Args:
         ticker: The ticker symbol to load
+        start_date: Optional inclusive start date (YYYY-MM-DD), pushed down to the reader
+        end_date: Optional inclusive end date (YYYY-MM-DD), pushed down to the reader
     """
-    # Get environment variables with defaults
-    AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
-    AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     AWS_S3_BUCKET = os.getenv('AWS_S3_BUCKET', 'avanzaidata')
-    if not all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_S3_BUCKET]):
-        raise ValueError("Missing required AWS credentials")
-
-    s3 = boto3.client("s3",
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name="us-east-1")
-    
-    obj = s3.get_object(Bucket=AWS_S3_BUCKET,
-                       Key="az_pricing_04112025.parquet")
-    pf = pq.ParquetFile(BytesIO(obj["Body"].read()))
-    df = pf.read(columns=["date", ticker]).to_pandas()
+    PRICING_DATASET_URI = os.getenv('PRICING_DATASET_URI')
+    if PRICING_DATASET_URI:
+        # Long-format dataset: only the ticker's partition and row groups are read
+        df = read_long_pricing(PRICING_DATASET_URI, [ticker], start_date, end_date).select(["date", "close"]).to_pandas()
+        df = df.rename(columns={"close": ticker})
+    else:
+        _, cache = snapshot_cache_for(ANALYSIS, AWS_S3_BUCKET)
+        df = cache.select(["date", ticker], start_date, end_date).to_pandas()
     df["date"] = pd.to_datetime(df["date"])
     df = df.set_index("date")
     df = df.rename(columns={ticker: "value"})
     return _save(df)
+def load_prices_s3(tickers: List[str], start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
+    """Read several tickers into one date-aligned frame (one column per ticker), return df_id.
+
+    Same sources as :func:`load_price_s3`; use it to feed multi-ticker
+    analyses such as :func:`correlation_matrix` with a single load.
+
+    Args:
+        tickers: The ticker symbols to load
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+    """
+    AWS_S3_BUCKET = os.getenv('AWS_S3_BUCKET', 'avanzaidata')
+    PRICING_DATASET_URI = os.getenv('PRICING_DATASET_URI')
+    if PRICING_DATASET_URI:
+        df = read_wide_pricing(PRICING_DATASET_URI, tickers, start_date, end_date).to_pandas()
+    else:
+        _, cache = snapshot_cache_for(ANALYSIS, AWS_S3_BUCKET)
+        df = cache.select(["date"] + tickers, start_date, end_date).to_pandas()
+    df["date"] = pd.to_datetime(df["date"])
+    return _save(df.set_index("date"))
+
+def load_returns_s3(tickers: List[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    log: bool = False) -> str:
+    """Daily returns of several tickers from the 'analysis' snapshot, return df_id.
+
+    Returns are precomputed once per snapshot version (see ``returns_store``)
+    and memory-mapped, so no prices are loaded and no pct_change is run.
+
+    Args:
+        tickers: The ticker symbols to load
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+        log: Log returns instead of simple returns
+    """
+    return _save(_snapshot_returns_frame(tickers, start_date, end_date, log))
+
+def _snapshot_returns_frame(tickers: List[str], start_date: Optional[str], end_date: Optional[str],
+                            log: bool = False) -> pd.DataFrame:
+    return _analysis_returns().frame(tickers, start_date, end_date, log)
+
+def _analysis_returns():
+    AWS_S3_BUCKET = os.getenv('AWS_S3_BUCKET', 'avanzaidata')
+    _, cache = snapshot_cache_for(ANALYSIS, AWS_S3_BUCKET)
+    return snapshot_returns(cache.get())
+
 def get_macro_config() -> Dict[str, Any]:
     """
     Load macro configuration from JSON file when needed.
@@ -178,17 +229,133 @@ def cumulative_performance(
 
     return {"df_id": new_id, "tail5": _tail5(cum)}
 
+@function_tool
+def period_returns(
+    tickers: List[str],
+    horizons: Optional[List[str]] = None,
+    windows: Optional[List[List[str]]] = None,
+    as_of: Optional[str] = None
+) -> dict:
+    """
+    Simple returns of many tickers over many periods in one lookup, e.g. every sector ETF over 1w/1m/3m/ytd/1y.
+
+    Read from the 'analysis' snapshot's cumulative log-return index, so no
+    prices are loaded and the cost does not depend on the period length.
+
+    Args:
+        tickers: The ticker symbols
+        horizons: Standard look-backs ending on ``as_of``: 1d, 1w, 1m, 3m, 6m, ytd, 1y, 5y
+        windows: Explicit [start_date, end_date] pairs (YYYY-MM-DD), close to close
+        as_of: End date of the horizons (default: the last snapshot date)
+
+    Returns:
+        {"df_id": ..., "returns": {ticker: {period: return}}} (None where the ticker has no price at the period start)
+    """
+    store = _analysis_returns()
+    frames = []
+    if horizons:
+        frames.append(horizon_returns(store, tickers, horizons, as_of))
+    if windows:
+        values = window_returns(store, tickers, [w[0] for w in windows], [w[1] for w in windows])
+        frames.append(pd.DataFrame(values.T, index=pd.Index(tickers, name="ticker"),
+                                   columns=[f"{w[0]}:{w[1]}" for w in windows]))
+    if not frames:
+        raise ValueError(f"Pass horizons ({', '.join(list(HORIZONS) + [YTD])}) and/or windows")
+    result = pd.concat(frames, axis=1)
+    preview = result.round(4).astype(object).where(result.notna(), None).to_dict("index")
+    return {"df_id": _save(result), "returns": preview}
+
 # ------------------ analysis ----------------------------------
 @function_tool
 def correlation(x_id: str, y_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
     x = _fetch(x_id).rename(columns={"value":"x"})
     y = _fetch(y_id).rename(columns={"value":"y"})
     df = x.join(y, how="inner")
-    print(df)
     if start_date:
         df = df[df.index >= pd.to_datetime(start_date)]
     if end_date:
         df = df[df.index <= pd.to_datetime(end_date)]
         
-    r = df["x"].corr(df["y"])
+    r = corr_frame(df[["x", "y"]], min_periods=2).iat[0, 1]
     return f"{r:.2%}"
+
+def _returns_frame(price_ids: List[str], tickers: List[str], start_date: Optional[str],
+                   end_date: Optional[str]) -> pd.DataFrame:
+    """
+    Daily returns aligned on date: ``tickers`` come precomputed from the snapshot
+    returns store; ``price_ids`` (multi-ticker frames or single ``value``
+    series) are outer-joined and turned into returns once.
+    """
+    frames = [_snapshot_returns_frame(tickers, start_date, end_date)] if tickers else []
+    prices = []
+    for df_id in price_ids:
+        df = _fetch(df_id)
+        prices.append(df.rename(columns={"value": df_id}) if list(df.columns) == ["value"] else df)
+    if prices:
+        joined = pd.concat(prices, axis=1, join="outer").sort_index()
+        matrix = PriceMatrix.from_frame(joined).window(start_date, end_date)
+        frames.append(pd.DataFrame(compute_returns(matrix).daily,
+                                   index=pd.DatetimeIndex(matrix.dates, name="date"), columns=matrix.tickers))
+    if not frames:
+        raise ValueError("Pass tickers and/or price_ids")
+    return pd.concat(frames, axis=1, join="outer").sort_index()
+
+@function_tool
+def correlation_matrix(
+    price_ids: Optional[List[str]] = None,
+    tickers: Optional[List[str]] = None,
+    mode: Literal["full", "rolling", "regime"] = "full",
+    window: int = 63,
+    step: int = 21,
+    driver_id: Optional[str] = None,
+    regime_bounds: Optional[List[float]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    """
+    N×N correlation of daily returns for every ticker in ``price_ids``, stored as one df_id.
+
+    Args:
+        price_ids: df_ids from load_prices_s3 (many tickers) and/or load_price_s3 / load_macro_fred (one series each)
+        tickers: Tickers whose precomputed returns are read from the 'analysis' snapshot (no price load needed)
+        mode: "full" for one matrix over the period, "rolling" for a matrix every ``step`` days over
+            trailing ``window``-day windows, "regime" for one matrix per regime bucket of the driver
+        window: Rolling window in trading days (mode="rolling")
+        step: Days between rolling matrices (mode="rolling")
+        driver_id: df_id of the series that defines the regimes, e.g. VIX levels (mode="regime")
+        regime_bounds: Bucket edges on the driver, e.g. [15, 25] for <15, 15-25, >=25 (mode="regime")
+        start_date: Optional inclusive start date (YYYY-MM-DD)
+        end_date: Optional inclusive end date (YYYY-MM-DD)
+
+    Returns:
+        {"df_id": ..., "shape": [rows, cols], "preview": ...}: the full matrix (small N) or its
+        most and least correlated pairs, the last rolling matrix's pairs, or per-regime pairs.
+    """
+    returns = _returns_frame(price_ids or [], tickers or [], start_date, end_date)
+
+    if mode == "full":
+        result = corr_frame(returns)
+        preview = (result.round(3).to_dict() if len(result) <= 6
+                   else {"most": top_pairs(result), "least": top_pairs(result, ascending=True)})
+    elif mode == "rolling":
+        result = rolling_corr(returns, window, step)
+        if result.empty:
+            raise ValueError(f"Not enough data for a {window}-day window")
+        last_date = result.index.get_level_values("date")[-1]
+        preview = {"last_date": last_date.strftime("%Y-%m-%d"),
+                   "most": top_pairs(result.loc[last_date]),
+                   "matrices": int(len(result) / len(returns.columns))}
+    elif mode == "regime":
+        if driver_id is None or not regime_bounds:
+            raise ValueError("mode='regime' needs driver_id and regime_bounds")
+        driver = _fetch(driver_id)["value"]
+        result = regime_corr(returns, driver, sorted(regime_bounds))
+        preview = {}
+        for regime in result.index.get_level_values("regime").unique():
+            block = result.loc[regime]
+            preview[regime] = {"observations": int(block["observations"].iloc[0]),
+                               "most": top_pairs(block.drop(columns="observations"), n=3)}
+    else:
+        raise ValueError(f"Unknown correlation mode: {mode}")
+
+    return {"df_id": _save(result), "shape": list(result.shape), "preview": preview}
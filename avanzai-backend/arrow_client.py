@@ -0,0 +1,68 @@
+"""
+arrow_client.py
+
+Small client helpers for reading Arrow IPC stream responses and artifacts
+(``application/vnd.apache.arrow.stream``) produced by the API, e.g. from the
+screener notebooks or other internal services.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import requests
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def read_arrow_stream(source: Union[bytes, pa.Buffer, "requests.Response"]) -> pd.DataFrame:
+    """
+    Read an Arrow IPC stream into a DataFrame without copying numeric columns.
+
+    Parameters:
+        source: Raw bytes, an Arrow buffer, or a ``requests`` response.
+
+    Returns:
+        A DataFrame indexed by ``date`` when that column is present. Float
+        columns without nulls are views over the received buffer.
+    """
+    if isinstance(source, requests.Response):
+        source.raise_for_status()
+        source = source.content
+    table = pa.ipc.open_stream(pa.py_buffer(source)).read_all()
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    if "date" in df.columns:
+        df = df.set_index("date")
+    return df
+
+
+def read_arrow_metadata(source: Union[bytes, pa.Buffer]) -> Optional[Dict[str, Any]]:
+    """Return the JSON metadata the API attaches to Arrow artifacts, if any."""
+    reader = pa.ipc.open_stream(pa.py_buffer(source))
+    metadata = reader.schema.metadata or {}
+    return json.loads(metadata[b"avanzai"]) if b"avanzai" in metadata else None
+
+
+def fetch_pricing_arrow(
+    base_url: str,
+    tickers: List[str],
+    mode: str = "default",
+    user_id: Optional[str] = None,
+    data_id: Optional[str] = None,
+    timeout: int = 60
+) -> pd.DataFrame:
+    """
+    Fetch ``/get_pricing_data2`` as an Arrow stream and return a date-indexed DataFrame.
+
+    Example:
+        >>> df = fetch_pricing_arrow("http://localhost:8000", ["AAPL", "MSFT"])
+    """
+    response = requests.post(
+        f"{base_url.rstrip('/')}/get_pricing_data2",
+        json={"mode": mode, "tickers": tickers, "user_id": user_id, "data_id": data_id},
+        headers={"Accept": ARROW_STREAM_MEDIA_TYPE},
+        timeout=timeout
+    )
+    return read_arrow_stream(response)
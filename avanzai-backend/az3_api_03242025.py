@@ -2,19 +2,23 @@
 import os
 import json
 import uuid
+import dataclasses
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Tuple, List, Optional, Union, Literal
+from typing import Dict, Any, Iterable, Iterator, Tuple, List, Optional, Union, Literal
 import re
 import asyncio
 from io import BytesIO
+import itertools
+import threading
 from itertools import accumulate
 from uuid import UUID
 from pathlib import Path
 from pydantic import BaseModel, validator
 from typing import List, Any, Union
 # Core web framework
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 from pydantic import BaseModel, Field
 
@@ -28,11 +32,32 @@ import requests
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import boto3
+import pyarrow as pa
 import pyarrow.parquet as pq
 import numpy as np
 import gc
 import pandas as pd
 
+from pricing_snapshot import peek_snapshot_cache, stop_all_snapshot_refreshers
+from pricing_catalog import ANALYSIS, LATEST, resolve_snapshot, snapshot_cache_for
+from s3_range_reader import get_range_reader
+from row_group_decoder import RowGroupDecodeError
+from pricing_dataset import iter_wide_pricing, read_wide_pricing
+from session_io import SessionDocuments, atomic_write_bytes
+from session_store import SQLiteSessionDocuments
+from session_cache import SessionFrameCache
+from session_reference import PricingReference
+from returns_engine import PriceMatrix, compute_returns, performance_report
+from returns_store import enable_returns_materialization, load_returns, snapshot_returns
+from period_returns import HORIZONS, YTD, horizon_windows, window_returns
+from leaderboard import enable_leaderboard_materialization, get_leaderboard, rank_leaderboard
+from transforms import (DEFAULT_BENCHMARK, DEFAULT_WINDOW, TRANSFORMS, TransformParams, describe_transforms,
+                        run_transform)
+from session_pricing import SessionPricingStore
+from pricing_encoding import (ARROW_STREAM_MEDIA_TYPE, accepts_arrow, dumps, iter_arrow_stream,
+                              iter_columnar_chunks, iter_ndjson, json_response,
+                              table_to_arrow_stream, table_to_columnar)
+
 # Import search agent components
 from agents import Agent, WebSearchTool, Runner
 from agents.model_settings import ModelSettings
@@ -50,6 +75,25 @@ AWS_S3_BUCKET = os.getenv('AWS_S3_BUCKET', 'avanzaidata')  # Default to 'avanzai
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# Pricing snapshot aliases, resolved to a concrete version through the snapshot catalog
+PRICING_LATEST = LATEST
+PRICING_ANALYSIS = ANALYSIS
+# Optional long-format ticker-partitioned dataset (local dir or s3:// URI)
+PRICING_DATASET_URI = os.getenv('PRICING_DATASET_URI')
+# How often session storage counters are reconciled against the filesystem
+SESSION_RECONCILE_SECONDS = int(os.getenv('SESSION_RECONCILE_SECONDS', '3600'))
+# Session eviction: idle TTL, per-session quota, quota for the whole sessions directory
+SESSION_CLEANUP_SECONDS = int(os.getenv('SESSION_CLEANUP_SECONDS', '900'))
+SESSION_TTL_HOURS = float(os.getenv('SESSION_TTL_HOURS', '72'))
+SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', str(512 * 1024 ** 2)))
+SESSIONS_MAX_BYTES = int(os.getenv('SESSIONS_MAX_BYTES', str(10 * 1024 ** 3)))
+# A session's last_accessed is only rewritten once it is this stale (well below the TTL)
+SESSION_TOUCH_SECONDS = int(os.getenv('SESSION_TOUCH_SECONDS', '300'))
+# Where session metadata/summaries live: "sqlite" (indexed, WAL mode) or "json" (files per session)
+SESSION_METADATA_BACKEND = os.getenv('SESSION_METADATA_BACKEND', 'sqlite')
+# SQLite database for the "sqlite" backend (default: <sessions dir>/sessions.db)
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH')
+
 # Set environment variables
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
@@ -532,6 +576,32 @@ sql_query_agent = create_agent(sql_query_prompt,
                                default_tool_choice="get_universe_sql_query")
 
 
+async def reconcile_session_storage_loop():
+    """Reconcile every session's storage counters every ``SESSION_RECONCILE_SECONDS``."""
+    while True:
+        await asyncio.sleep(SESSION_RECONCILE_SECONDS)
+        try:
+            await asyncio.to_thread(session_manager.reconcile_all_storage)
+        except Exception as e:
+            print(f"Error reconciling session storage: {str(e)}")
+
+
+async def session_cleanup_loop():
+    """Evict idle sessions and enforce storage quotas every ``SESSION_CLEANUP_SECONDS``."""
+    while True:
+        # Wait first: a pass at startup would evict sessions idle only because the server was down
+        await asyncio.sleep(SESSION_CLEANUP_SECONDS)
+        try:
+            await asyncio.to_thread(
+                session_manager.cleanup_sessions,
+                ttl=timedelta(hours=SESSION_TTL_HOURS),
+                session_max_bytes=SESSION_MAX_BYTES,
+                total_max_bytes=SESSIONS_MAX_BYTES
+            )
+        except Exception as e:
+            print(f"Error cleaning up sessions: {str(e)}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for FastAPI application."""
@@ -546,12 +616,33 @@ async def lifespan(app: FastAPI):
     # Ensure sessions directory exists
     Path("sessions").mkdir(parents=True, exist_ok=True)
     
+    # Materialize daily returns once per loaded snapshot version (memory-mapped by every worker)
+    enable_returns_materialization()
+    # ...and the market leaderboard from them
+    enable_leaderboard_materialization()
+    
+    # Resolve the pricing snapshots and keep them warm in the background
+    for snapshot in (PRICING_LATEST, PRICING_ANALYSIS):
+        try:
+            snapshot_cache_for(snapshot, AWS_S3_BUCKET)
+        except Exception as e:
+            print(f"Warning: could not resolve pricing snapshot '{snapshot}': {e}")
+    
+    # Periodically correct drift in the incremental session storage counters
+    reconcile_task = asyncio.create_task(reconcile_session_storage_loop())
+    # Evict idle sessions and keep session storage under quota
+    cleanup_task = asyncio.create_task(session_cleanup_loop())
+    
     # Initialize any other components
     print("Server initializing...")
     
     yield  # Server is running
     
     # Cleanup (if needed)
+    reconcile_task.cancel()
+    cleanup_task.cancel()
+    session_manager.flush_pending_writes()
+    stop_all_snapshot_refreshers()
     print("Server shutting down...")
 
 
@@ -593,6 +684,10 @@ class PricingRequest(BaseModel):
     tickers: List[str] = Field(..., description="List of ticker symbols to fetch data for")
     user_id: Optional[str] = Field(default=None, description="User ID for custom data")
     data_id: Optional[str] = Field(default=None, description="Data ID for custom data")
+    start_date: Optional[str] = Field(default=None, description="Inclusive start date (YYYY-MM-DD); defaults to full history")
+    end_date: Optional[str] = Field(default=None, description="Inclusive end date (YYYY-MM-DD); defaults to latest")
+    format: Literal["records", "columnar"] = Field(default="records", description="Response shape ('records' or 'columnar')")
+    stream: bool = Field(default=False, description="Stream the response batch by batch (NDJSON rows or columnar chunks)")
 
 class DataRequest(BaseModel):
     """Request model for data operations."""
@@ -616,67 +711,113 @@ class SessionResponse(BaseModel):
     session_id: str
     expires_at: str
 
-async def get_pricing_data(request: PricingRequest) -> List[Dict]:
+def pricing_table_to_records(table: pa.Table) -> List[Dict]:
+    """Convert a projected pricing table into JSON-safe records keyed by date."""
+    df = table.to_pandas()
+
+    # Convert timestamps to string format if needed
+    if len(df) and isinstance(df['date'].iloc[0], (pd.Timestamp, datetime)):
+        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+
+    # Replace invalid values
+    df = df.replace([np.inf, -np.inf, np.nan], None)
+    return df.to_dict(orient='records')
+
+def load_pricing_table(request: PricingRequest, snapshot: str) -> pa.Table:
     """
-    Get pricing data from S3 for the requested tickers.
-    Data is in column format where each ticker is a column header.
+    Load the ``date`` column plus the requested tickers as an Arrow table.
+
+    Default-mode requests resolve ``snapshot`` (an alias such as ``'latest'`` or
+    a version) through the snapshot catalog. They are served from the
+    long-format pricing dataset when ``PRICING_DATASET_URI`` is configured,
+    otherwise from the process-wide cache of that snapshot version once it is
+    warm. Until then, and for custom user files, only the footer and the
+    projected column chunks are fetched with S3 Range GETs.
+
+    ``start_date``/``end_date`` are pushed down: row groups outside the window
+    are skipped via the ``date`` statistics and the rest is cut by binary search.
     """
+    columns = ['date'] + request.tickers
+    print(f"Reading columns: {columns}")
+
+    if request.mode == 'default' and PRICING_DATASET_URI:
+        return read_wide_pricing(PRICING_DATASET_URI, request.tickers, request.start_date, request.end_date)
+
+    if request.mode == 'default':
+        ref, cache = snapshot_cache_for(snapshot, AWS_S3_BUCKET)
+        if cache.is_loaded:
+            return cache.select(columns, request.start_date, request.end_date)
+        file_path = ref.key
+    else:
+        file_path = f'users/{request.user_id}/{request.data_id}.parquet'
+
+    print(f"Fetching data from S3: {file_path}")
+    reader = get_range_reader(file_path, AWS_S3_BUCKET)
     try:
-        print(f"Fetching pricing data for tickers: {request.tickers}")
-        access_key = os.getenv('AWS_ACCESS_KEY')
-        secret_key = os.getenv('AWS_SECRET_KEY')
-        s3_client = boto3.client('s3',
-                                region_name='us-east-1',
-                                aws_access_key_id=access_key,
-                                aws_secret_access_key=secret_key)
-        bucket_name = 'avanzaidata'
-        
-        # Determine file path based on mode
-        if request.mode == 'default':
-            file_path = 'az_pricing_latest.parquet'
-        else:
-            file_path = f'users/{request.user_id}/{request.data_id}.parquet'
+        reader.index(refresh=True)
+    except Exception as e:
+        print(f"Error fetching from S3: {str(e)}")
+        raise ValueError(f"Failed to fetch data from S3: {str(e)}")
+    return reader.read(columns, start_date=request.start_date, end_date=request.end_date)
 
-        print(f"Fetching data from S3: {file_path}")
-        
-        try:
-            # Get the parquet file metadata first
-            response = s3_client.get_object(Bucket=bucket_name, Key=file_path)
-        except Exception as e:
-            print(f"Error fetching from S3: {str(e)}")
-            raise ValueError(f"Failed to fetch data from S3: {str(e)}")
+STREAM_BATCH_ROWS = 1024
+# Row groups decoded ahead of the one being streamed (one in flight, one ready)
+STREAM_DECODE_WINDOW = 2
 
-        # Create a ParquetFile object to enable reading in pieces
-        parquet_file = pq.ParquetFile(BytesIO(response['Body'].read()))
+def iter_pricing_batches(request: PricingRequest, snapshot: str,
+                         batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Yield the ``date`` + ticker columns as Arrow record batches of at most ``batch_rows`` rows.
 
-        # Read only the columns we need
-        columns = ['date'] + request.tickers
-        print(f"Reading columns: {columns}")
+    Data already held in memory (snapshot cache) is sliced without copying;
+    the pricing dataset is scanned and pivoted one block of dates at a time,
+    and remote files are fetched and decoded one row group at a time with
+    ``STREAM_DECODE_WINDOW`` groups read ahead, so peak memory stays bounded
+    by a few batches.
+    """
+    columns = ['date'] + request.tickers
+    if request.mode == 'default':
+        if PRICING_DATASET_URI:
+            for table in iter_wide_pricing(PRICING_DATASET_URI, request.tickers, request.start_date,
+                                           request.end_date, batch_rows=batch_rows):
+                yield from table.to_batches(max_chunksize=batch_rows)
+            return
+        ref, cache = snapshot_cache_for(snapshot, AWS_S3_BUCKET)
+        if cache.is_loaded:
+            table = cache.select(columns, request.start_date, request.end_date)
+            yield from table.to_batches(max_chunksize=batch_rows)
+            return
+        file_path = ref.key
+    else:
+        file_path = f'users/{request.user_id}/{request.data_id}.parquet'
 
-        # Process in chunks
-        result = []
-        for batch in range(parquet_file.num_row_groups):
-            try:
-                # Read one row group at a time
-                df_chunk = parquet_file.read_row_group(batch, columns=columns).to_pandas()
-                
-                # Convert timestamps to string format if needed
-                if isinstance(df_chunk['date'].iloc[0], (pd.Timestamp, datetime)):
-                    df_chunk['date'] = df_chunk['date'].dt.strftime('%Y-%m-%d')
-                
-                # Replace invalid values
-                df_chunk = df_chunk.replace([np.inf, -np.inf, np.nan], None)
-                
-                # Convert to records
-                records = df_chunk.to_dict(orient='records')
-                result.extend(records)
-
-                # Clear chunk from memory
-                del df_chunk
-                gc.collect()
-            except Exception as e:
-                print(f"Error processing batch {batch}: {str(e)}")
-                continue
+    print(f"Streaming data from S3: {file_path}")
+    reader = get_range_reader(file_path, AWS_S3_BUCKET)
+    reader.index(refresh=True)
+    for table in reader.iter_row_groups(columns, request.start_date, request.end_date,
+                                        window=STREAM_DECODE_WINDOW):
+        yield from table.to_batches(max_chunksize=batch_rows)
+
+def checked_pricing_batches(request: PricingRequest, snapshot: str) -> Iterator[pa.RecordBatch]:
+    """
+    Same as :func:`iter_pricing_batches`, but pulls the first batch eagerly so a
+    bad request fails before a streaming response has started.
+    """
+    batches = iter_pricing_batches(request, snapshot)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError(f"No valid records found for tickers: {request.tickers}")
+    return itertools.chain([first], batches)
+
+async def get_pricing_data(request: PricingRequest) -> List[Dict]:
+    """
+    Get pricing data from S3 for the requested tickers.
+    Data is in column format where each ticker is a column header.
+    """
+    try:
+        print(f"Fetching pricing data for tickers: {request.tickers}")
+        table = load_pricing_table(request, snapshot=PRICING_LATEST)
+        result = pricing_table_to_records(table)
 
         print(f"Total records fetched: {len(result)}")
         if result:
@@ -692,27 +833,65 @@ async def get_pricing_data(request: PricingRequest) -> List[Dict]:
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
         raise ValueError(f"Failed to load pricing data: {str(e)}")
-    finally:
-        gc.collect()
+
+# Session files never removed by per-session quota trimming
+PROTECTED_SESSION_FILES = {"metadata.json", "session_summary.json"}
+# Result copies that may be trimmed when a session is over quota
+ARTIFACT_SUFFIXES = {".json", ".arrow"}
 
 class SessionManager:
     """Manage file sessions and maintain session summaries."""
 
-    def __init__(self, base_path="./sessions"):
+    def __init__(self, base_path="./sessions", backend: str = SESSION_METADATA_BACKEND,
+                 db_path: Optional[str] = SESSION_DB_PATH):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # Per-session {relative path: size} ledger behind the storage counters
+        self._storage_ledgers: Dict[str, Dict[str, int]] = {}
+        self._storage_lock = threading.Lock()
+        if backend == "sqlite":
+            # Metadata, summaries, ticker holdings and artifact records in one indexed store
+            self._docs = SQLiteSessionDocuments(Path(db_path) if db_path else self.base_path / "sessions.db",
+                                                dump_kwargs={"default": self._datetime_handler})
+            self.store: Optional[SQLiteSessionDocuments] = self._docs
+        elif backend == "json":
+            # Per-session locks and coalesced atomic writes for metadata/summary JSON
+            self._docs = SessionDocuments(on_write=self.record_file_write,
+                                          dump_kwargs={"default": self._datetime_handler})
+            self.store = None
+        else:
+            raise ValueError(f"Unknown session metadata backend: {backend}")
+        # Decoded session frames, invalidated through a per-file save counter
+        self.frame_cache = SessionFrameCache()
+        self._frame_saves: Dict[Tuple[str, str], int] = {}
+        # Cumulative counters reported by /sessions/cleanup_stats
+        self.cleanup_stats = {
+            "runs": 0,
+            "sessions_evicted": 0,
+            "artifacts_evicted": 0,
+            "bytes_reclaimed": 0,
+            "last_run": None
+        }
 
     async def initialize_session(self, session_id: UUID) -> Path:
         """Initialize or get existing session folder."""
         session_path = self.base_path / str(session_id)
         
-        if not session_path.exists():
-            session_path.mkdir(parents=True, exist_ok=True)
+        if not await asyncio.to_thread(session_path.exists):
+            await asyncio.to_thread(session_path.mkdir, parents=True, exist_ok=True)
             # Initialize empty session summary
             await self.update_session_summary(session_id)
         
+        # Mark the session as used for TTL/LRU eviction, at most once per SESSION_TOUCH_SECONDS
+        await asyncio.to_thread(self.touch_session, session_id)
         return session_path
 
+    def touch_session(self, session_id: UUID):
+        """Persist ``last_accessed`` unless the stored access time is recent enough."""
+        now = datetime.now(timezone.utc)
+        if now - self.last_accessed(str(session_id)) >= timedelta(seconds=SESSION_TOUCH_SECONDS):
+            self.update_session_metadata(session_id, {"last_accessed": now.isoformat()})
+
     async def update_session_summary(
         self, 
         session_id: UUID, 
@@ -721,14 +900,38 @@ class SessionManager:
         metrics: List[str] = None,
         time_range: str = None
     ) -> Dict:
-        """Update session summary with new information."""
+        """Update session summary with new information (disk work runs off the event loop)."""
+        return await asyncio.to_thread(
+            self._update_session_summary, session_id, ticker, operation_type, metrics, time_range
+        )
+
+    def _update_session_summary(
+        self,
+        session_id: UUID,
+        ticker: Optional[str],
+        operation_type: Optional[str],
+        metrics: Optional[List[str]],
+        time_range: Optional[str]
+    ) -> Dict:
         summary_path = self.base_path / str(session_id) / "session_summary.json"
-        
-        # Load existing summary or create new
-        if summary_path.exists():
-            with open(summary_path, 'r') as f:
-                summary = json.load(f)
-        else:
+        return self._docs.update(
+            session_id, summary_path,
+            lambda summary: self._apply_summary_update(
+                summary, session_id, ticker, operation_type, metrics, time_range
+            )
+        )
+
+    def _apply_summary_update(
+        self,
+        summary: Optional[Dict],
+        session_id: UUID,
+        ticker: Optional[str],
+        operation_type: Optional[str],
+        metrics: Optional[List[str]],
+        time_range: Optional[str]
+    ) -> Dict:
+        # Start a new summary if there is none yet
+        if summary is None:
             summary = {
                 "session_id": str(session_id),
                 "created_at": datetime.now(timezone.utc).isoformat(),
@@ -777,86 +980,37 @@ class SessionManager:
                 summary["statistics"]["requests_by_type"].get(operation_type, 0) + 1
             )
         
-        # Update storage information
-        session_path = self.base_path / str(session_id)
-        total_size = sum(f.stat().st_size for f in session_path.rglob('*') if f.is_file())
-        total_files = sum(1 for _ in session_path.rglob('*') if _.is_file())
+        # Update storage information from the incrementally maintained counters
+        total_files, total_size = self.storage_totals(session_id)
         summary["storage"].update({
             "total_files": total_files,
             "total_size_bytes": total_size
         })
         
-        # Save updated summary
-        with open(summary_path, 'w') as f:
-            json.dump(summary, f, indent=2)
-        
         return summary
 
     async def get_session_summary(self, session_id: UUID) -> Dict:
         """Get the current session summary."""
         summary_path = self.base_path / str(session_id) / "session_summary.json"
-        if not summary_path.exists():
+        summary = await asyncio.to_thread(self._docs.read, session_id, summary_path)
+        if summary is None:
             raise FileNotFoundError(f"No summary found for session {session_id}")
-        
-        with open(summary_path, 'r') as f:
-            return json.load(f)
+        return summary
+
+    async def get_or_update_pricing_data(self, session_id: UUID, ticker: str) -> pd.DataFrame:
+        """
+        Get the session's prices for ``ticker``, fetching and storing them on first use.
+
+        The session only records the ticker in its reference to the shared
+        analysis snapshot (see ``session_reference``); prices are resolved from
+        the snapshot on read. Tickers stored by older sessions in the columnar
+        session store (``session_pricing``) are still read from there.
 
-    async def get_or_update_pricing_data(self, session_id: UUID, ticker: str) -> Dict:
-        """Get pricing data for ticker, updating session data if needed."""
+        Returns:
+            A date-indexed frame with a single ``ticker`` column.
+        """
         try:
-            session_path = self.base_path / str(session_id)
-            pricing_data_path = session_path / "pricing_data.json"
-            
-            # Load existing data if available
-            existing_data = {}
-            if pricing_data_path.exists():
-                with open(pricing_data_path, 'r') as f:
-                    existing_data = json.load(f)
-            
-            # Check if we already have data for this ticker
-            if ticker not in existing_data.get('tickers', []):
-                print(f"Fetching new data for ticker: {ticker}")
-                
-                # Get pricing data using get_pricing_data2
-                pricing_response = await get_pricing_data2(
-                    PricingRequest(mode='default', tickers=[ticker])
-                )
-                
-                if not pricing_response or 'data' not in pricing_response:
-                    raise ValueError(f"Failed to fetch data for ticker {ticker}")
-                
-                new_data = pricing_response['data']
-                
-                # Merge with existing data
-                if existing_data and 'data' in existing_data:
-                    print(f"Merging new data with existing data for {ticker}")
-                    existing_data['tickers'].append(ticker)
-                    for day in new_data:
-                        matching_day = next((d for d in existing_data['data'] if d['date'] == day['date']), None)
-                        if matching_day:
-                            matching_day.update({k: v for k, v in day.items() if k != 'date'})
-                        else:
-                            existing_data['data'].append(day)
-                else:
-                    print(f"Creating new data structure for {ticker}")
-                    existing_data = {
-                        'tickers': [ticker],
-                        'data': new_data
-                    }
-                
-                # Save updated data
-                with open(pricing_data_path, 'w') as f:
-                    json.dump(existing_data, f)
-                
-                print(f"Updated session data saved for {ticker}")
-            else:
-                print(f"Using cached data for {ticker}")
-            
-            if not existing_data.get('data'):
-                raise ValueError(f"No data available for ticker {ticker}")
-            
-            return existing_data
-            
+            return await asyncio.to_thread(self._get_or_update_pricing_data, session_id, ticker)
         except Exception as e:
             print(f"Error in get_or_update_pricing_data: {str(e)}")
             print(f"Error type: {type(e)}")
@@ -864,6 +1018,135 @@ class SessionManager:
             print(f"Traceback: {traceback.format_exc()}")
             raise ValueError(f"Failed to get or update pricing data: {str(e)}")
 
+    def _get_or_update_pricing_data(self, session_id: UUID, ticker: str) -> pd.DataFrame:
+        # One update per session at a time, so concurrent requests don't both add the ticker
+        with self._docs.lock(session_id, "pricing"):
+            store = SessionPricingStore(self.base_path / str(session_id))
+            if store.has(ticker):
+                print(f"Using stored data for {ticker}")
+                frame = store.load([ticker])
+            else:
+                reference = self.load_reference(session_id, "session_pricing")
+                if reference is None:
+                    reference = PricingReference.from_snapshot(
+                        resolve_snapshot(PRICING_ANALYSIS, AWS_S3_BUCKET), []
+                    )
+                table = reference.with_tickers([ticker]).resolve([ticker])
+                if table.num_rows == 0:
+                    raise ValueError(f"Failed to fetch data for ticker {ticker}")
+                if ticker not in reference.tickers:
+                    self.save_reference(session_id, "session_pricing", reference.with_tickers([ticker]))
+                    print(f"Added {ticker} to the session's pricing reference")
+                frame = table.to_pandas().set_index('date')
+        if frame.empty:
+            raise ValueError(f"No data available for ticker {ticker}")
+        return frame
+
+    # ------------------ storage accounting ------------------
+    def _ledger(self, session_id: str) -> Dict[str, int]:
+        """Return the session's size ledger, building it with one directory walk on first use."""
+        session_id = str(session_id)
+        with self._storage_lock:
+            ledger = self._storage_ledgers.get(session_id)
+        if ledger is None:
+            ledger = self._scan_storage(session_id)
+            with self._storage_lock:
+                ledger = self._storage_ledgers.setdefault(session_id, ledger)
+        return ledger
+
+    def _scan_storage(self, session_id: str) -> Dict[str, int]:
+        session_path = self.base_path / str(session_id)
+        if not session_path.exists():
+            return {}
+        return {
+            str(f.relative_to(session_path)): f.stat().st_size
+            for f in session_path.rglob('*')
+            if f.is_file()
+        }
+
+    def record_file_write(self, session_id: str, filepath: Path):
+        """Account for a file written (or overwritten) inside a session directory."""
+        filepath = Path(filepath)
+        relative = str(filepath.relative_to(self.base_path / str(session_id)))
+        size = filepath.stat().st_size if filepath.exists() else 0
+        ledger = self._ledger(session_id)
+        with self._storage_lock:
+            ledger[relative] = size
+        if self.store is not None:
+            self.store.record_artifact(session_id, relative, size)
+
+    def record_file_delete(self, session_id: str, filepath: Path):
+        """Account for a file removed from a session directory."""
+        relative = str(Path(filepath).relative_to(self.base_path / str(session_id)))
+        ledger = self._ledger(session_id)
+        with self._storage_lock:
+            ledger.pop(relative, None)
+        if self.store is not None:
+            self.store.delete_artifact(session_id, relative)
+
+    def storage_totals(self, session_id: str) -> Tuple[int, int]:
+        """Return ``(total_files, total_size_bytes)`` for a session without walking its directory."""
+        ledger = self._ledger(session_id)
+        with self._storage_lock:
+            return len(ledger), sum(ledger.values())
+
+    def reconcile_storage(self, session_id: str) -> Dict[str, int]:
+        """
+        Re-walk a session directory, replace its ledger and fix the stored summary.
+
+        Corrects drift from files written outside the SessionManager or by
+        another worker process.
+
+        Returns:
+            ``{"files_drift": ..., "bytes_drift": ...}`` (actual minus previously counted).
+        """
+        session_id = str(session_id)
+        before_files, before_bytes = self.storage_totals(session_id)
+        ledger = self._scan_storage(session_id)
+        with self._storage_lock:
+            self._storage_ledgers[session_id] = ledger
+        if self.store is not None:
+            self.store.replace_artifacts(session_id, ledger)
+        drift = {
+            "files_drift": len(ledger) - before_files,
+            "bytes_drift": sum(ledger.values()) - before_bytes
+        }
+
+        summary_path = self.base_path / session_id / "session_summary.json"
+
+        def apply(summary: Optional[Dict]) -> Optional[Dict]:
+            if summary is not None:
+                summary["storage"].update({
+                    "total_files": len(ledger),
+                    "total_size_bytes": sum(ledger.values()),
+                    "last_reconciled": datetime.now(timezone.utc).isoformat()
+                })
+            return summary
+
+        if self._docs.read(session_id, summary_path) is not None:
+            self._docs.update(session_id, summary_path, apply)
+
+        if drift["files_drift"] or drift["bytes_drift"]:
+            print(f"Reconciled storage for session {session_id}: {drift}")
+        return drift
+
+    def reconcile_all_storage(self) -> Dict[str, Dict[str, int]]:
+        """Reconcile every session directory; returns the drift found per session."""
+        return {
+            path.name: self.reconcile_storage(path.name)
+            for path in self.base_path.iterdir()
+            if path.is_dir()
+        }
+
+    def save_artifact(self, session_id: str, filename: str, body: bytes) -> Path:
+        """Write a result artifact (JSON, Arrow, ...) into the session directory and account for it."""
+        session_path = self.base_path / str(session_id)
+        session_path.mkdir(parents=True, exist_ok=True)
+        filepath = session_path / filename
+        atomic_write_bytes(filepath, body)
+        self.record_file_write(session_id, filepath)
+        return filepath
+
     def save_dataframe(self, df: pd.DataFrame, session_id: str, data_type: str) -> bool:
         """Save DataFrame to parquet file in session directory."""
         try:
@@ -871,31 +1154,124 @@ class SessionManager:
             session_path = self.base_path / str(session_id)
             session_path.mkdir(parents=True, exist_ok=True)
             
-            # Save DataFrame as parquet
+            # Save DataFrame as parquet (temp file + rename so readers never see a partial file)
             filepath = session_path / f"{data_type}.parquet"
-            df.to_parquet(filepath)
-            
-            # Update session metadata
-            metadata = self.load_session_metadata(session_id) or {}
-            metadata.update({
-                "last_updated": datetime.now(timezone.utc).isoformat(),
-                f"{data_type}_saved": True,
-                f"{data_type}_path": str(filepath)
-            })
-            self.save_session_metadata(session_id, metadata)
+            tmp_path = session_path / f".{data_type}.parquet.tmp"
+            with self._docs.lock(session_id, data_type):
+                df.to_parquet(tmp_path)
+                os.replace(tmp_path, filepath)
             
+            self._record_saved(session_id, data_type, filepath)
             return True
         except Exception as e:
             print(f"Error saving dataframe: {str(e)}")
             return False
 
+    def save_record_batches(self, batches: Iterable[pa.RecordBatch], session_id: str, data_type: str) -> bool:
+        """Stream Arrow record batches into a parquet file in the session directory, one batch at a time."""
+        try:
+            session_path = self.base_path / str(session_id)
+            session_path.mkdir(parents=True, exist_ok=True)
+            filepath = session_path / f"{data_type}.parquet"
+            tmp_path = session_path / f".{data_type}.parquet.tmp"
+
+            writer = None
+            with self._docs.lock(session_id, data_type):
+                try:
+                    for batch in batches:
+                        if writer is None:
+                            writer = pq.ParquetWriter(tmp_path, batch.schema)
+                        writer.write_batch(batch)
+                finally:
+                    if writer is not None:
+                        writer.close()
+
+                if writer is None:
+                    print(f"No record batches to save for {data_type}")
+                    return False
+                os.replace(tmp_path, filepath)
+
+            self._record_saved(session_id, data_type, filepath)
+            return True
+        except Exception as e:
+            print(f"Error saving record batches: {str(e)}")
+            return False
+
+    def _record_saved(self, session_id: str, data_type: str, filepath: Path):
+        """Update storage counters, the frame cache and session metadata after a data file was written."""
+        self._bump_frame_version(session_id, data_type)
+        self.record_file_write(session_id, filepath)
+        self.update_session_metadata(session_id, {
+            f"{data_type}_saved": True,
+            f"{data_type}_path": str(filepath),
+            f"{data_type}_ref": None
+        })
+
+    def _bump_frame_version(self, session_id: str, data_type: str):
+        key = (str(session_id), data_type)
+        with self._storage_lock:
+            self._frame_saves[key] = self._frame_saves.get(key, 0) + 1
+        self.frame_cache.invalidate(session_id, data_type)
+
+    def save_reference(self, session_id: str, data_type: str, reference: PricingReference) -> bool:
+        """
+        Point ``data_type`` at a slice of a shared snapshot instead of a file of copied prices.
+
+        A previously materialized ``<data_type>.parquet`` is removed so reads
+        resolve the reference.
+        """
+        try:
+            filepath = self.base_path / str(session_id) / f"{data_type}.parquet"
+            with self._docs.lock(session_id, data_type):
+                if filepath.exists():
+                    filepath.unlink()
+                    self.record_file_delete(session_id, filepath)
+                self._bump_frame_version(session_id, data_type)
+                self.update_session_metadata(session_id, {
+                    f"{data_type}_saved": True,
+                    f"{data_type}_path": None,
+                    f"{data_type}_ref": reference.to_dict()
+                })
+            return True
+        except Exception as e:
+            print(f"Error saving reference: {str(e)}")
+            return False
+
+    def load_reference(self, session_id: str, data_type: str) -> Optional[PricingReference]:
+        """Return the snapshot reference stored for ``data_type`` (None if it is materialized or absent)."""
+        metadata = self.load_session_metadata(session_id) or {}
+        reference = metadata.get(f"{data_type}_ref")
+        return PricingReference.from_dict(reference) if reference else None
+
     def load_dataframe(self, session_id: str, data_type: str) -> Optional[pd.DataFrame]:
-        """Load DataFrame from parquet file in session directory."""
+        """
+        Load DataFrame from parquet file in session directory.
+
+        Without a file, a snapshot reference stored by :meth:`save_reference`
+        is resolved instead. Frames are served from ``frame_cache`` while the
+        file (or reference) is unchanged; the returned frame is shared and must
+        not be modified in place.
+        """
         try:
             filepath = self.base_path / str(session_id) / f"{data_type}.parquet"
-            if filepath.exists():
-                return pd.read_parquet(filepath)
-            return None
+            with self._storage_lock:
+                saves = self._frame_saves.get((str(session_id), data_type), 0)
+            reference = None
+            try:
+                stat = filepath.stat()
+                # mtime/size catch files replaced by another worker process
+                version = (saves, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                reference = self.load_reference(session_id, data_type)
+                if reference is None:
+                    return None
+                # The ETag of a mutable legacy key invalidates frames cached before an overwrite
+                version = (saves, reference, reference.tag())
+            df = self.frame_cache.get(session_id, data_type, version)
+            if df is None:
+                df = reference.resolve().to_pandas() if reference else pd.read_parquet(filepath)
+                self.frame_cache.put(session_id, data_type, version, df)
+            return df
         except Exception as e:
             print(f"Error loading dataframe: {str(e)}")
             return None
@@ -906,9 +1282,7 @@ class SessionManager:
             session_path = self.base_path / str(session_id)
             session_path.mkdir(parents=True, exist_ok=True)
             
-            metadata_path = session_path / "metadata.json"
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, default=self._datetime_handler)
+            self._docs.update(session_id, session_path / "metadata.json", lambda _: dict(metadata))
             return True
         except Exception as e:
             print(f"Error saving metadata: {str(e)}")
@@ -917,33 +1291,177 @@ class SessionManager:
     def load_session_metadata(self, session_id: str) -> Optional[dict]:
         """Load session metadata from JSON file."""
         try:
-            metadata_path = self.base_path / str(session_id) / "metadata.json"
-            if not metadata_path.exists():
-                return None
-            with open(metadata_path, 'r') as f:
-                return json.load(f)
+            return self._docs.read(session_id, self.base_path / str(session_id) / "metadata.json")
         except Exception as e:
             print(f"Error loading metadata: {str(e)}")
             return None
 
     def update_session_metadata(self, session_id: str, updates: dict) -> bool:
-        """Update existing session metadata with new values."""
+        """Update existing session metadata with new values (atomic read-modify-write per session)."""
         try:
-            metadata = self.load_session_metadata(session_id) or {}
-            metadata.update(updates)
-            metadata["last_updated"] = datetime.now(timezone.utc).isoformat()
-            return self.save_session_metadata(session_id, metadata)
+            session_path = self.base_path / str(session_id)
+            session_path.mkdir(parents=True, exist_ok=True)
+
+            def apply(metadata: Optional[dict]) -> dict:
+                metadata = metadata or {}
+                metadata.update(updates)
+                metadata["last_updated"] = datetime.now(timezone.utc).isoformat()
+                return metadata
+
+            self._docs.update(session_id, session_path / "metadata.json", apply)
+            return True
         except Exception as e:
             print(f"Error updating metadata: {str(e)}")
             return False
 
+    # ------------------ eviction ------------------
+    def last_accessed(self, session_id: str) -> datetime:
+        """When a session was last used: ``last_accessed``/``last_updated`` in its metadata, else the folder mtime."""
+        metadata = self.load_session_metadata(session_id) or {}
+        stamps = [metadata.get("last_accessed"), metadata.get("last_updated")]
+        parsed = []
+        for stamp in stamps:
+            if stamp:
+                try:
+                    value = datetime.fromisoformat(stamp)
+                    parsed.append(value if value.tzinfo else value.replace(tzinfo=timezone.utc))
+                except ValueError:
+                    pass
+        if parsed:
+            return max(parsed)
+        mtime = (self.base_path / str(session_id)).stat().st_mtime
+        return datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+    def _trim_session_artifacts(self, session_id: str, max_bytes: int) -> Tuple[int, int]:
+        """Delete a session's oldest result artifacts until it fits ``max_bytes``; returns (files, bytes) removed."""
+        _, total = self.storage_totals(session_id)
+        if total <= max_bytes:
+            return 0, 0
+        session_path = self.base_path / str(session_id)
+        ledger = self._ledger(session_id)
+        with self._storage_lock:
+            artifacts = [
+                (session_path / relative, size)
+                for relative, size in ledger.items()
+                if Path(relative).parent == Path(".")
+                and Path(relative).suffix in ARTIFACT_SUFFIXES
+                and relative not in PROTECTED_SESSION_FILES
+            ]
+        artifacts.sort(key=lambda item: item[0].stat().st_mtime if item[0].exists() else 0)
+
+        removed_files = removed_bytes = 0
+        for path, size in artifacts:
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.record_file_delete(session_id, path)
+            total -= size
+            removed_files += 1
+            removed_bytes += size
+        return removed_files, removed_bytes
+
+    def cleanup_sessions(
+        self,
+        ttl: timedelta,
+        session_max_bytes: int,
+        total_max_bytes: int,
+        now: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Evict sessions and artifacts so storage stays bounded.
+
+        1. Sessions idle for longer than ``ttl`` are deleted.
+        2. Sessions above ``session_max_bytes`` lose their oldest result artifacts
+           (metadata, summary and stored pricing are kept).
+        3. While the whole directory is above ``total_max_bytes``, the least
+           recently accessed sessions are deleted.
+
+        ``storage.last_cleanup`` is updated on every trimmed session and the
+        cumulative counters in ``cleanup_stats`` are advanced.
+
+        Returns:
+            What this run removed.
+        """
+        now = now or datetime.now(timezone.utc)
+        run = {"sessions_evicted": 0, "artifacts_evicted": 0, "bytes_reclaimed": 0}
+
+        sessions = []
+        for path in self.base_path.iterdir():
+            if path.is_dir():
+                sessions.append((self.last_accessed(path.name), path.name))
+        sessions.sort()  # least recently accessed first
+
+        def evict(session_id: str):
+            _, size = self.storage_totals(session_id)
+            if self.delete_session(session_id):
+                run["sessions_evicted"] += 1
+                run["bytes_reclaimed"] += size
+
+        # 1. Idle TTL
+        survivors = []
+        for accessed, session_id in sessions:
+            if now - accessed > ttl:
+                print(f"Evicting idle session {session_id} (last accessed {accessed.isoformat()})")
+                evict(session_id)
+            else:
+                survivors.append((accessed, session_id))
+
+        # 2. Per-session quota
+        for _, session_id in survivors:
+            files, reclaimed = self._trim_session_artifacts(session_id, session_max_bytes)
+            if files:
+                run["artifacts_evicted"] += files
+                run["bytes_reclaimed"] += reclaimed
+                self._mark_cleaned(session_id, now)
+
+        # 3. Global quota, LRU order
+        total = sum(self.storage_totals(session_id)[1] for _, session_id in survivors)
+        for _, session_id in survivors:
+            if total <= total_max_bytes:
+                break
+            _, size = self.storage_totals(session_id)
+            print(f"Evicting session {session_id} to stay under the sessions disk quota")
+            evict(session_id)
+            total -= size
+
+        with self._storage_lock:
+            for key, value in run.items():
+                self.cleanup_stats[key] += value
+            self.cleanup_stats["runs"] += 1
+            self.cleanup_stats["last_run"] = now.isoformat()
+        if any(run.values()):
+            print(f"Session cleanup: {run}")
+        return run
+
+    def _mark_cleaned(self, session_id: str, when: datetime):
+        summary_path = self.base_path / str(session_id) / "session_summary.json"
+
+        def apply(summary: Optional[Dict]) -> Optional[Dict]:
+            if summary is not None:
+                summary["storage"]["last_cleanup"] = when.isoformat()
+                summary["storage"]["total_files"], summary["storage"]["total_size_bytes"] = (
+                    self.storage_totals(session_id)
+                )
+            return summary
+
+        if self._docs.read(session_id, summary_path) is not None:
+            self._docs.update(session_id, summary_path, apply)
+
+    def flush_pending_writes(self):
+        """Write any coalesced metadata/summary updates to disk now (e.g. on shutdown)."""
+        self._docs.flush()
+
     def delete_session(self, session_id: str) -> bool:
         """Delete all session data and metadata."""
         try:
             session_path = self.base_path / str(session_id)
+            self._docs.discard(session_id)
+            self.frame_cache.invalidate(session_id)
             if session_path.exists():
                 import shutil
                 shutil.rmtree(session_path)
+            with self._storage_lock:
+                self._storage_ledgers.pop(str(session_id), None)
             return True
         except Exception as e:
             print(f"Error deleting session: {str(e)}")
@@ -959,16 +1477,7 @@ class SessionManager:
     @staticmethod
     def _get_timedelta(time_range: str) -> timedelta:
         """Convert time range string to timedelta."""
-        mapping = {
-            "1d": timedelta(days=1),
-            "1w": timedelta(weeks=1),
-            "1m": timedelta(days=30),
-            "3m": timedelta(days=90),
-            "6m": timedelta(days=180),
-            "1y": timedelta(days=365),
-            "5y": timedelta(days=365*5)
-        }
-        return mapping.get(time_range, timedelta(days=365))  # Default to 1y
+        return HORIZONS.get(time_range, HORIZONS["1y"])  # Default to 1y
 
 # Initialize session manager globally
 session_manager = SessionManager()
@@ -1036,78 +1545,10 @@ async def get_latest_pricing_data(user_id: str) -> Tuple[List[Dict], Path]:
                           detail=f"Failed to load pricing data: {str(e)}")
 
 def calculate_returns_metrics(price_data: List[Dict], ticker: str, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
-    """Calculate returns metrics from column-based price data."""
-    # Debug print
-    print(f"Calculating returns for {ticker}")
-    print(f"Date range: {start_date} to {end_date}")
-    print(f"First few records before filtering: {price_data[:2]}")
-    
-    # First convert all dates to datetime for proper comparison
-    prices_data = []
-    for day in price_data:
-        if day.get(ticker) is not None and str(day[ticker]).strip() and float(day[ticker]) > 0:
-            try:
-                date_str = day['date']
-                # Convert to datetime for comparison
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                prices_data.append({
-                    'date': date_str,
-                    'price': float(day[ticker])
-                })
-            except (ValueError, TypeError) as e:
-                print(f"Error processing date {day.get('date')}: {e}")
-                continue
-    
-    print(f"Valid price records before date filtering: {len(prices_data)}")
-    if prices_data:
-        print(f"Date range in data: {prices_data[0]['date']} to {prices_data[-1]['date']}")
-    
-    # Filter by date range if specified
-    if start_date or end_date:
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
-        
-        filtered_data = []
-        for record in prices_data:
-            record_dt = datetime.strptime(record['date'], '%Y-%m-%d')
-            if start_dt and record_dt < start_dt:
-                continue
-            if end_dt and record_dt > end_dt:
-                continue
-            filtered_data.append(record)
-        prices_data = filtered_data
-    
-    print(f"Records after date filtering: {len(prices_data)}")
-    if prices_data:
-        print(f"First record after filtering: {prices_data[0]}")
-        print(f"Last record after filtering: {prices_data[-1]}")
-
-    if len(prices_data) < 2:
-        print(f"Insufficient data after filtering. Records: {len(prices_data)}")
-        raise ValueError("Insufficient data after filtering.")
-
-    # Sort by date to ensure proper order
-    prices_data.sort(key=lambda x: x['date'])
-    
-    dates = [d['date'] for d in prices_data]
-    prices = [d['price'] for d in prices_data]
-
-    # Calculate returns
-    daily_returns = [prices[i] / prices[i - 1] - 1 for i in range(1, len(prices))]
-    cum_returns = list(accumulate(daily_returns, lambda acc, r: acc * (1 + r), initial=1.0))
-    cum_returns = [r - 1 for r in cum_returns]
-
-    cumulative_series = [{'date': date, 'value': ret} for date, ret in zip(dates, cum_returns)]
-
-    return {
-        "ticker": ticker,
-        "period_start": dates[0],
-        "period_end": dates[-1],
-        "cumulative_performance": float(cum_returns[-1]),
-        "cumulative_series": cumulative_series,
-        "cumulative_series_length": len(cumulative_series),
-        "calculated_at": datetime.now().isoformat()
-    }
+    """Calculate returns metrics for ``ticker`` from column-based price data (see ``returns_engine``)."""
+    print(f"Calculating returns for {ticker} from {start_date} to {end_date}")
+    matrix = PriceMatrix.from_records(price_data, [ticker]).window(start_date, end_date)
+    return performance_report(compute_returns(matrix), ticker)
 
 async def calculate_stock_performance(ticker: str, user_id: str, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
     """
@@ -1223,60 +1664,8 @@ async def get_pricing_data(request: PricingRequest):
         data_dir = Path("data")
         data_dir.mkdir(exist_ok=True)
         
-        # Initialize S3 client with environment variables
-        s3_client = boto3.client('s3',
-                                region_name='us-east-1',
-                                aws_access_key_id=AWS_ACCESS_KEY_ID,
-                                aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
-        
-        bucket_name = 'avanzaidata'
-        
-        # Determine file path based on mode
-        if request.mode == 'default':
-            file_path = 'az_pricing_latest.parquet'
-        else:
-            file_path = f'users/{request.user_id}/{request.data_id}.parquet'
-
-        print(f"Fetching data from S3: {file_path}")
-        
-        try:
-            # Get the parquet file metadata first
-            response = s3_client.get_object(Bucket=bucket_name, Key=file_path)
-        except Exception as e:
-            print(f"Error fetching from S3: {str(e)}")
-            raise ValueError(f"Failed to fetch data from S3: {str(e)}")
-
-        # Create a ParquetFile object to enable reading in pieces
-        parquet_file = pq.ParquetFile(BytesIO(response['Body'].read()))
-
-        # Read only the columns we need
-        columns = ['date'] + request.tickers
-        print(f"Reading columns: {columns}")
-
-        # Process in chunks
-        result = []
-        for batch in range(parquet_file.num_row_groups):
-            try:
-                # Read one row group at a time
-                df_chunk = parquet_file.read_row_group(batch, columns=columns).to_pandas()
-                
-                # Convert timestamps to string format if needed
-                if isinstance(df_chunk['date'].iloc[0], (pd.Timestamp, datetime)):
-                    df_chunk['date'] = df_chunk['date'].dt.strftime('%Y-%m-%d')
-                
-                # Replace invalid values
-                df_chunk = df_chunk.replace([np.inf, -np.inf, np.nan], None)
-                
-                # Convert to records
-                records = df_chunk.to_dict(orient='records')
-                result.extend(records)
-
-                # Clear chunk from memory
-                del df_chunk
-                gc.collect()
-            except Exception as e:
-                print(f"Error processing batch {batch}: {str(e)}")
-                continue
+        table = load_pricing_table(request, snapshot=PRICING_LATEST)
+        result = pricing_table_to_records(table)
 
         print(f"Total records fetched: {len(result)}")
         if result:
@@ -1355,19 +1744,21 @@ async def run_calc(request: StockCalcRequest):
             }
             
         # Verify ticker exists in the data
-        if not any(ticker in day for day in price_data):
+        try:
+            matrix = PriceMatrix.from_records(price_data, [ticker])
+        except KeyError:
             return {
                 "status": "error",
                 "message": f"Ticker {ticker} not found in loaded pricing data. Please load it using /get_pricing_data endpoint first."
             }
         
         # Calculate stock performance using actual pricing data
-        performance = calculate_returns_metrics(price_data, ticker, static_start_date, static_end_date)
+        result = compute_returns(matrix.window(static_start_date, static_end_date))
+        performance = performance_report(result, ticker)
         
         # Save calculation results
-        results_path = Path("sessions") / static_user_id / f"{ticker}_performance.json"
-        with open(results_path, 'w') as f:
-            json.dump(performance, f, indent=2)
+        session_manager.save_artifact(static_user_id, f"{ticker}_performance.json",
+                                      json.dumps(performance, indent=2).encode())
         
         # Upload performance to S3
         filename = f"{ticker}_performance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
@@ -1389,6 +1780,8 @@ async def run_calc(request: StockCalcRequest):
             "period_start": performance.get("period_start"),
             "period_end": performance.get("period_end"),
             "cumulative_performance": performance.get("cumulative_performance"),
+            "annualized_volatility": performance.get("annualized_volatility"),
+            "max_drawdown": performance.get("max_drawdown"),
             "cumulative_return_series": performance.get("cumulative_series"),
             "performance_shape": performance_shape,
             "calculated_at": performance.get("calculated_at"),
@@ -1489,6 +1882,113 @@ async def get_session_summary(session_id: UUID):
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Session not found")
 
+@app.get("/sessions/cleanup_stats")
+async def get_session_cleanup_stats():
+    """Counters of the session cleanup daemon (runs, sessions/artifacts evicted, bytes reclaimed)."""
+    return {"status": "success", "stats": dict(session_manager.cleanup_stats)}
+
+def require_session_store() -> SQLiteSessionDocuments:
+    if session_manager.store is None:
+        raise HTTPException(status_code=400, detail="Session queries require SESSION_METADATA_BACKEND=sqlite")
+    return session_manager.store
+
+@app.get("/sessions/cache_stats")
+async def get_session_cache_stats():
+    """Hit, miss and eviction counters and memory use of the session frame cache."""
+    return {"status": "success", "stats": session_manager.frame_cache.stats()}
+
+@app.get("/sessions/by_ticker/{ticker}")
+async def get_sessions_by_ticker(ticker: str):
+    """Sessions holding ``ticker`` in their pricing data or metadata."""
+    store = require_session_store()
+    sessions = await asyncio.to_thread(store.sessions_holding, ticker)
+    return {"status": "success", "ticker": ticker, "sessions": sessions}
+
+@app.get("/sessions/largest")
+async def get_largest_sessions(limit: int = 10):
+    """Sessions with the most stored bytes, largest first."""
+    store = require_session_store()
+    sessions = await asyncio.to_thread(store.largest_sessions, limit)
+    return {"status": "success", "sessions": sessions}
+
+class PeriodReturnsRequest(BaseModel):
+    """Request model for batch period returns."""
+    tickers: List[str] = Field(..., description="Ticker symbols")
+    horizons: List[str] = Field(default=[], description="Look-backs ending on as_of: 1d, 1w, 1m, 3m, 6m, ytd, 1y, 5y")
+    windows: List[Tuple[str, str]] = Field(default=[], description="Explicit (start_date, end_date) pairs, close to close")
+    as_of: Optional[str] = Field(default=None, description="End date of the horizons (default: last snapshot date)")
+    snapshot: str = Field(default=PRICING_ANALYSIS, description="Snapshot alias or version")
+
+def compute_period_returns(request: PeriodReturnsRequest) -> Dict[str, Any]:
+    """
+    Returns of every ticker over every horizon and window from the snapshot's
+    cumulative log-return index: one gather for the whole request.
+    """
+    _, cache = snapshot_cache_for(request.snapshot, AWS_S3_BUCKET)
+    store = snapshot_returns(cache.get())
+    end, starts = horizon_windows(store, request.horizons, request.as_of)
+    labels = list(request.horizons) + [f"{start}:{end_date}" for start, end_date in request.windows]
+    all_starts = np.concatenate([starts, np.array([w[0] for w in request.windows], dtype='datetime64[D]')])
+    all_ends = np.concatenate([np.full(len(starts), end),
+                               np.array([w[1] for w in request.windows], dtype='datetime64[D]')])
+    values = window_returns(store, request.tickers, all_starts, all_ends)
+    returns = {
+        ticker: {label: None if np.isnan(v) else round(float(v), 6) for label, v in zip(labels, values[:, i])}
+        for i, ticker in enumerate(request.tickers)
+    }
+    return {"snapshot_version": store.version, "as_of": str(end), "returns": returns}
+
+@app.post("/period_returns")
+async def get_period_returns(request: PeriodReturnsRequest):
+    """
+    Simple returns of many tickers over many periods, e.g. sector ETFs over 1w/1m/3m/ytd/1y.
+
+    Served from the materialized returns of the snapshot; no prices are loaded.
+    """
+    if not request.horizons and not request.windows:
+        raise HTTPException(status_code=400,
+                            detail=f"Pass horizons ({', '.join(list(HORIZONS) + [YTD])}) and/or windows")
+    try:
+        result = await asyncio.to_thread(compute_period_returns, request)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", **result}
+
+def load_leaderboard(snapshot: str) -> pd.DataFrame:
+    _, cache = snapshot_cache_for(snapshot, AWS_S3_BUCKET)
+    return get_leaderboard(snapshot_returns(cache.get()))
+
+@app.get("/leaderboard")
+async def get_market_leaderboard(
+    horizon: str = "1m",
+    asset_class: Optional[str] = None,
+    metric: Literal["return", "volatility", "max_drawdown"] = "return",
+    n: int = 10,
+    order: Literal["top", "bottom"] = "top",
+    snapshot: str = PRICING_ANALYSIS
+):
+    """
+    Top (or bottom) ``n`` universe tickers by ``metric`` over ``horizon``, per asset class.
+
+    Served from the leaderboard materialized once per snapshot version; no
+    prices are loaded and no model is called.
+    """
+    try:
+        table = await asyncio.to_thread(load_leaderboard, snapshot)
+        ranking = rank_leaderboard(table, horizon, asset_class, metric, max(n, 1), bottom=(order == "bottom"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = table[table["horizon"] == horizon]
+    return {
+        "status": "success",
+        "horizon": horizon,
+        "metric": metric,
+        "order": order,
+        "start_date": rows["start_date"].iloc[0] if len(rows) else None,
+        "end_date": rows["end_date"].iloc[0] if len(rows) else None,
+        "leaderboard": ranking
+    }
+
 @app.post("/process_financial_data")
 async def process_financial_data(request: FinancialDataRequest):
     """
@@ -1514,7 +2014,7 @@ async def process_financial_data(request: FinancialDataRequest):
         # Get pricing data for this ticker using session manager
         pricing_data = await session_manager.get_or_update_pricing_data(request.session_id, ticker)
         
-        if not pricing_data or 'data' not in pricing_data:
+        if pricing_data is None or pricing_data.empty:
             return {
                 "status": "error",
                 "error": {
@@ -1526,15 +2026,10 @@ async def process_financial_data(request: FinancialDataRequest):
         # Generate data ID
         data_id = f"fin-{uuid.uuid4()}"
         
-        # Filter data for just this ticker's info
-        ticker_data = []
-        for record in pricing_data['data']:
-            if ticker in record:
-                filtered_record = {
-                    'date': record['date'],
-                    ticker: record[ticker]
-                }
-                ticker_data.append(filtered_record)
+        # Records for just this ticker's column
+        ticker_frame = pricing_data.reset_index()
+        ticker_frame['date'] = ticker_frame['date'].dt.strftime('%Y-%m-%d')
+        ticker_data = ticker_frame.replace([np.inf, -np.inf, np.nan], None).to_dict(orient='records')
         
         # Prepare response data
         processed_data = {
@@ -1574,64 +2069,35 @@ async def process_financial_data(request: FinancialDataRequest):
         }
 
 @app.post("/get_pricing_data2")
-async def get_pricing_data2(request: PricingRequest):
+async def get_pricing_data2(request: PricingRequest, http_request: Request = None):
     """
     Get pricing data from S3 for the requested tickers.
     Supports both default and custom data modes.
+
+    With ``format="columnar"`` the response is ``{"dates": [...], "series": {ticker: [...]}}``
+    encoded straight from the Arrow columns and compressed per Accept-Encoding.
+    With ``stream=True`` rows (or columnar chunks) are streamed as NDJSON as
+    each record batch is decoded. Clients sending
+    ``Accept: application/vnd.apache.arrow.stream`` get the Arrow batches
+    themselves as an IPC stream.
     """
     try:
-        # Initialize S3 client with environment variables
-        s3_client = boto3.client('s3',
-                                region_name='us-east-1',
-                                aws_access_key_id=AWS_ACCESS_KEY_ID,
-                                aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
-        
-        # Determine file path based on mode
-        if request.mode == 'default':
-            file_path = 'az_pricing_04112025.parquet'
-        else:
-            file_path = f'users/{request.user_id}/{request.data_id}.parquet'
+        if accepts_arrow(http_request):
+            batches = checked_pricing_batches(request, snapshot=PRICING_ANALYSIS)
+            return StreamingResponse(iter_arrow_stream(batches), media_type=ARROW_STREAM_MEDIA_TYPE)
 
-        print(f"Fetching data from S3: {file_path}")
-        
-        try:
-            # Get the parquet file metadata first
-            response = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=file_path)
-        except Exception as e:
-            print(f"Error fetching from S3: {str(e)}")
-            raise ValueError(f"Failed to fetch data from S3: {str(e)}")
+        if request.stream:
+            batches = checked_pricing_batches(request, snapshot=PRICING_ANALYSIS)
+            encode = iter_columnar_chunks if request.format == 'columnar' else iter_ndjson
+            return StreamingResponse(encode(batches), media_type="application/x-ndjson")
 
-        # Create a ParquetFile object to enable reading in pieces
-        parquet_file = pq.ParquetFile(BytesIO(response['Body'].read()))
+        table = load_pricing_table(request, snapshot=PRICING_ANALYSIS)
+        if request.format == 'columnar':
+            if table.num_rows == 0:
+                raise ValueError(f"No valid records found for tickers: {request.tickers}")
+            return json_response(table_to_columnar(table), http_request)
 
-        # Read only the columns we need
-        columns = ['date'] + request.tickers
-        print(f"Reading columns: {columns}")
-
-        # Process in chunks
-        result = []
-        for batch in range(parquet_file.num_row_groups):
-            try:
-                # Read one row group at a time
-                df_chunk = parquet_file.read_row_group(batch, columns=columns).to_pandas()
-                
-                # Convert timestamps to string format if needed
-                if isinstance(df_chunk['date'].iloc[0], (pd.Timestamp, datetime)):
-                    df_chunk['date'] = df_chunk['date'].dt.strftime('%Y-%m-%d')
-                
-                # Replace invalid values
-                df_chunk = df_chunk.replace([np.inf, -np.inf, np.nan], None)
-                
-                # Convert to records
-                records = df_chunk.to_dict(orient='records')
-                result.extend(records)
-
-                # Clear chunk from memory
-                del df_chunk
-                gc.collect()
-            except Exception as e:
-                print(f"Error processing batch {batch}: {str(e)}")
-                continue
+        result = pricing_table_to_records(table)
 
         print(f"Total records fetched: {len(result)}")
         if result:
@@ -1641,12 +2107,12 @@ async def get_pricing_data2(request: PricingRequest):
 
         return {"data": result}
 
+    except RowGroupDecodeError as e:
+        print(f"Error decoding pricing data: {str(e)}")
+        raise HTTPException(status_code=500, detail=e.to_dict())
     except Exception as e:
         print(f"Error loading pricing data: {str(e)}")
         raise
-    finally:
-        # Final cleanup
-        gc.collect()
 
 def make_dataframe_json_serializable(df: pd.DataFrame) -> dict:
     """Convert DataFrame to JSON serializable format."""
@@ -1658,36 +2124,98 @@ def make_dataframe_json_serializable(df: pd.DataFrame) -> dict:
         print(f"Error converting DataFrame to JSON: {str(e)}")
         return {}
 
+def save_pricing_reference(session_id: str, tickers: List[str], benchmark: Optional[str] = None) -> bool:
+    """
+    Point the session's ``pricing_data`` at ``tickers`` in the current analysis snapshot.
+
+    ``benchmark`` is referenced as well when the snapshot has it, so benchmark
+    transforms (rolling_beta) work without another load.
+    """
+    ref = resolve_snapshot(PRICING_ANALYSIS, AWS_S3_BUCKET)
+    if benchmark and benchmark not in tickers and (ref.tickers is None or benchmark in ref.tickers):
+        tickers = list(tickers) + [benchmark]
+    reference = PricingReference.from_snapshot(ref, tickers)
+    return session_manager.save_reference(session_id, "pricing_data", reference)
+
+def add_pricing_reference_tickers(session_id: str, tickers: List[str]) -> bool:
+    """
+    Add ``tickers`` to the session's ``pricing_data`` reference (same snapshot version).
+
+    Returns False when the session holds materialized data or the snapshot lacks a ticker.
+    """
+    reference = session_manager.load_reference(session_id, "pricing_data")
+    if reference is None:
+        return False
+    extended = reference.with_tickers(tickers)
+    try:
+        extended.resolve(list(tickers))
+    except Exception as e:
+        print(f"Cannot add {tickers} to the pricing reference of session {session_id}: {str(e)}")
+        return False
+    return session_manager.save_reference(session_id, "pricing_data", extended)
+
+def load_session_pricing_table(session_id: str) -> pa.Table:
+    """The session's ``pricing_data`` as Arrow: the materialized file, or its resolved reference."""
+    filepath = session_manager.base_path / session_id / "pricing_data.parquet"
+    if filepath.exists():
+        return pq.read_table(filepath)
+    reference = session_manager.load_reference(session_id, "pricing_data")
+    if reference is None:
+        raise ValueError(f"No pricing data found for session {session_id}")
+    return reference.resolve()
+
+def attach_snapshot_returns(session_id: str, matrix: PriceMatrix) -> PriceMatrix:
+    """
+    Attach the materialized daily returns of the snapshot the session references to ``matrix``.
+
+    ``matrix`` is returned unchanged when the session holds its own copy of
+    the prices, the snapshot is not loaded in this worker, or its returns are
+    not materialized yet.
+    """
+    reference = session_manager.load_reference(session_id, "pricing_data")
+    if reference is None:
+        return matrix
+    cache = peek_snapshot_cache(reference.key, reference.bucket)
+    if cache is None or not cache.is_loaded:
+        return matrix
+    snapshot = cache.get()
+    if not reference.immutable and snapshot.etag != reference.tag():
+        return matrix
+    store = load_returns(snapshot.key, snapshot.version)
+    daily = store.aligned(matrix.dates, matrix.tickers) if store is not None else None
+    return matrix if daily is None else dataclasses.replace(matrix, daily=daily)
+
 @app.post("/store_pricing_data/{session_id}")
 async def store_pricing_data(session_id: str,
-                             request: DataRequest) -> DataResponse:
-    """Store pricing data for analysis"""
+                             request: DataRequest,
+                             http_request: Request = None) -> DataResponse:
+    """
+    Store pricing data for analysis.
+
+    Default-mode sessions only store a reference to the shared analysis
+    snapshot; custom (user-uploaded) data is copied into the session.
+
+    Clients sending ``Accept: application/vnd.apache.arrow.stream`` also get the
+    stored table back as an Arrow IPC stream (session id in ``X-Session-Id``).
+    """
     try:
-        # Get pricing data using the existing endpoint functionality
         if request.mode == 'custom':
-            pricing_response = await get_pricing_data2(
-                PricingRequest(
-                    mode='custom',
-                    tickers=request.tickers,
-                    user_id=request.user_id,
-                    data_id=request.data_id
-                ))
+            # Stream the user's file straight into the session's parquet file
+            pricing_request = PricingRequest(
+                mode='custom',
+                tickers=request.tickers,
+                user_id=request.user_id,
+                data_id=request.data_id
+            )
+            batches = iter_pricing_batches(pricing_request, snapshot=PRICING_ANALYSIS)
+            saved = await asyncio.to_thread(
+                session_manager.save_record_batches, batches, session_id, "pricing_data"
+            )
         else:
-            pricing_response = await get_pricing_data2(
-                PricingRequest(
-                    mode='default',
-                    tickers=request.tickers
-                ))
-
-        if not pricing_response or "data" not in pricing_response:
-            raise HTTPException(status_code=500,
-                                detail="Failed to fetch pricing data")
-        
-        # Convert the response data to a DataFrame
-        df = pd.DataFrame(pricing_response["data"])
-        
-        # Save the DataFrame using the session manager
-        if not session_manager.save_dataframe(df, session_id, "pricing_data"):
+            saved = await asyncio.to_thread(
+                save_pricing_reference, session_id, request.tickers
+            )
+        if not saved:
             raise HTTPException(
                 status_code=500,
                 detail="Failed to save pricing data to session storage"
@@ -1700,7 +2228,15 @@ async def store_pricing_data(session_id: str,
             "tickers": request.tickers,
             "fields": request.fields
         }
-        session_manager.update_session_metadata(session_id, metadata_updates)
+        await asyncio.to_thread(session_manager.update_session_metadata, session_id, metadata_updates)
+
+        if accepts_arrow(http_request):
+            stored = await asyncio.to_thread(load_session_pricing_table, session_id)
+            return StreamingResponse(
+                iter_arrow_stream(stored.to_batches()),
+                media_type=ARROW_STREAM_MEDIA_TYPE,
+                headers={"X-Session-Id": session_id}
+            )
 
         return DataResponse(
             session_id=session_id,
@@ -1771,7 +2307,10 @@ class DataProcessRequest(BaseModel):
     start_date: str  # ISO format date string
     end_date: str    # ISO format date string
     session_id: str  # Session ID for retrieving stored data
-    transformation_type: str  # Type of transformation to apply (e.g., 'cumulative_performance')
+    transformation_type: str  # Registered transform (see transforms.TRANSFORMS), e.g. 'cumulative_performance'
+    window: Optional[int] = None  # Rolling window in trading days (rolling transforms only)
+    benchmark: Optional[str] = None  # Benchmark ticker for rolling_beta (default SPY)
+    output_format: Literal["json", "arrow"] = "json"  # Artifact type ('arrow': application/vnd.apache.arrow.stream)
 
 class ProcessDataResponse(BaseModel):
     """Response model for data processing."""
@@ -1787,6 +2326,8 @@ class ProcessDataResponse(BaseModel):
 async def process_stock_data(request: DataProcessRequest) -> ProcessDataResponse:
     """
     Process stock data based on the request parameters and save results to a JSON file in S3.
+    transformation_type is any registered transform: cumulative_performance, drawdown,
+    rolling_volatility, rolling_sharpe, rolling_beta (against benchmark) or zscore.
     Now includes summary statistics in the response.
     """
     from pathlib import Path
@@ -1816,101 +2357,56 @@ async def process_stock_data(request: DataProcessRequest) -> ProcessDataResponse
     # 1. Load data from session storage
     session_id = request.session_id
     
-    # Create path to session's pricing data
-    session_path = Path("sessions") / session_id
-    pricing_data_path = session_path / "pricing_data.parquet"
-    
-    if not pricing_data_path.exists():
+    # Load the session's pricing data (decoded once, then served from the frame cache)
+    df = await asyncio.to_thread(session_manager.load_dataframe, session_id, "pricing_data")
+    if df is None:
         raise ValueError(f"No pricing data found for session {session_id}. Please load data first.")
     
-    # Load the stored parquet file
-    df = pd.read_parquet(pricing_data_path)
-    
-    # 2. Filter for our tickers of interest
-    tickers = request.tickers
-    available_columns = df.columns.tolist()
-    
-    # Make sure we have the date column
-    if "date" not in available_columns:
+    # 2. Identify which requested tickers are available
+    if "date" not in df.columns:
         raise ValueError("Date column not found in the pricing data")
-    
-    # Identify which requested tickers are available
-    available_tickers = [ticker for ticker in tickers if ticker in available_columns]
-    
+    available_columns = df.columns.tolist()
+    available_tickers = [ticker for ticker in request.tickers if ticker in available_columns]
     if not available_tickers:
-        raise ValueError(f"None of the requested tickers {tickers} found in data. Available columns: {available_columns}")
-    
-    # Keep only the date and available tickers
-    df = df[["date"] + available_tickers]
-    
-    # 3. Filter by date range
-    # Ensure date is in datetime format
-    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
-        df["date"] = pd.to_datetime(df["date"])
-    
-    # Filter by date range if specified
-    start_date = request.start_date
-    end_date = request.end_date
-    
-    if start_date:
-        start_date = pd.to_datetime(start_date)
-        df = df[df["date"] >= start_date]
-    
-    if end_date:
-        end_date = pd.to_datetime(end_date)
-        df = df[df["date"] <= end_date]
-    
-    # Check if we have enough data after filtering
-    if len(df) < 2:
-        raise ValueError("Insufficient data after date filtering. Need at least two data points.")
-    
-    # Sort by date to ensure proper order
-    df = df.sort_values("date")
-    print(f"Filtered df: {df.head()}")
-    # 4. Apply the specified transformation
+        raise ValueError(f"None of the requested tickers {request.tickers} found in data. Available columns: {available_columns}")
+
+    # 3. Apply the transformation to all tickers at once (see ``transforms``);
+    # the benchmark column and earlier rows are only used as inputs
     transformation_type = request.transformation_type
-    
-    if transformation_type == "cumulative_performance":
-        # Create a results dataframe with date column
-        result_df = pd.DataFrame({"date": df["date"].dt.strftime('%Y-%m-%d')})
-        
-        # Initialize summary dictionary
-        summary = {
-            "start_date": df["date"].min().strftime('%Y-%m-%d'),
-            "end_date": df["date"].max().strftime('%Y-%m-%d'),
-            "cumulative_returns": {}
-        }
-        
-        for ticker in available_tickers:
-            # Create a clean series of the price data, removing NaN values
-            price_series = df[ticker].dropna()
-            
-            # Skip tickers with insufficient data
-            if len(price_series) < 2:
-                continue
-                
-            # Calculate daily returns
-            daily_returns = price_series.pct_change().fillna(0)
-            
-            # Calculate cumulative returns (starting at 100)
-            cumulative_returns = 100 * (1 + daily_returns).cumprod()
-            
-            # Round to 2 decimal places and add to result dataframe
-            result_df[ticker] = cumulative_returns.values.round(2)
-            
-            # Store the final cumulative return in the summary, rounded to 2 decimals
-            summary["cumulative_returns"][ticker] = round(float(cumulative_returns.iloc[-1]), 2)
+    extra = [request.benchmark or DEFAULT_BENCHMARK]
+    spec = TRANSFORMS.get(transformation_type)
+    if spec is not None and spec.needs_benchmark and extra[0] not in available_columns:
+        # Reference the benchmark from the shared snapshot if the session does not have it yet
+        if await asyncio.to_thread(add_pricing_reference_tickers, session_id, extra):
+            df = await asyncio.to_thread(session_manager.load_dataframe, session_id, "pricing_data")
+            available_columns = df.columns.tolist()
+    matrix = PriceMatrix.from_frame(
+        df, available_tickers + [c for c in extra if c in available_columns and c not in available_tickers]
+    )
+    # Returns-based transforms use the snapshot's precomputed returns instead of recomputing them
+    matrix = await asyncio.to_thread(attach_snapshot_returns, session_id, matrix)
+    params = TransformParams(window=request.window or DEFAULT_WINDOW, benchmark=request.benchmark)
+    result = run_transform(transformation_type, matrix, available_tickers,
+                           request.start_date, request.end_date, params)
+
+    decimals = TRANSFORMS[transformation_type].decimals
+    result_df = pd.DataFrame(np.round(result.values, decimals), columns=result.tickers)
+    result_df.insert(0, "date", np.datetime_as_string(result.dates, unit='D'))
+    summary = {
+        "start_date": str(result_df["date"].iloc[0]),
+        "end_date": str(result_df["date"].iloc[-1]),
+        result.summary_label: {ticker: round(value, decimals) for ticker, value in result.summary.items()}
+    }
 
-        # Automatically sample the data if we have too many points
-        result_df = sample_timeseries_data(result_df)
-        print(f"Sampled df: {result_df.head()}")
-    else:
-        raise ValueError(f"Transformation type '{transformation_type}' not supported. Supported types: cumulative_performance")
+    # 4. Automatically sample the data if we have too many points
+    result_df = sample_timeseries_data(result_df)
+    print(f"Sampled df: {result_df.head()}")
     
-    # 5. Save the processed data to S3 as JSON
+    # 5. Save the processed data to S3 as JSON (or an Arrow IPC stream)
     # Create a filename based on the transformation type and date
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    result_filename = f"{transformation_type}_{timestamp}.json"
+    as_arrow = request.output_format == "arrow"
+    result_filename = f"{transformation_type}_{timestamp}.{'arrow' if as_arrow else 'json'}"
     
     # Set up S3 client with environment variables
     s3_client = boto3.client('s3',
@@ -1921,35 +2417,40 @@ async def process_stock_data(request: DataProcessRequest) -> ProcessDataResponse
     # Create S3 path
     s3_path = f"users/{session_id}/processed/{result_filename}"
     
-    # Convert DataFrame to JSON
-    # Replace NaN values with None for JSON serialization
-    result_df = result_df.replace({np.nan: None})
-    result_json = {
-        "data": result_df.to_dict(orient="records"),
-        "metadata": {
-            "transformation_type": transformation_type,
-            "tickers": available_tickers,
-            "start_date": start_date.strftime('%Y-%m-%d') if start_date else None,
-            "end_date": end_date.strftime('%Y-%m-%d') if end_date else None,
-            "generated_at": datetime.now().isoformat(),
-            "row_count": len(result_df),
-            "session_id": session_id
-        }
+    result_metadata = {
+        "transformation_type": transformation_type,
+        "tickers": available_tickers,
+        "start_date": summary["start_date"],
+        "end_date": summary["end_date"],
+        "generated_at": datetime.now().isoformat(),
+        "row_count": len(result_df),
+        "session_id": session_id
     }
     
+    if as_arrow:
+        # Metadata travels on the Arrow schema
+        result_body = table_to_arrow_stream(
+            pa.Table.from_pandas(result_df, preserve_index=False), result_metadata
+        )
+        content_type = ARROW_STREAM_MEDIA_TYPE
+    else:
+        # Convert DataFrame to JSON (NaN/inf are written as null by dumps)
+        result_body = dumps({
+            "data": result_df.to_dict(orient="records"),
+            "metadata": result_metadata
+        })
+        content_type = 'application/json'
+
     # Save to S3
     s3_client.put_object(
         Bucket=AWS_S3_BUCKET,
         Key=s3_path,
-        Body=json.dumps(result_json, default=str),
-        ContentType='application/json'
+        Body=result_body,
+        ContentType=content_type
     )
     
     # Also save a local copy for reference (optional)
-    session_path.mkdir(parents=True, exist_ok=True)
-    local_path = session_path / result_filename
-    with open(local_path, 'w') as f:
-        json.dump(result_json, f, default=str)
+    session_manager.save_artifact(session_id, result_filename, result_body)
     
     # Return response with status, path, and summary
     return ProcessDataResponse(
@@ -1967,6 +2468,11 @@ class AgentStockResponse(BaseModel):
         None, 
         description="Dictionary mapping ticker symbols to their cumulative returns"
     )
+    transformation_type: Optional[str] = Field(None, description="Transform that was applied")
+    values: Optional[Dict[str, float]] = Field(
+        None,
+        description="Dictionary mapping ticker symbols to the transform's summary value (e.g. max drawdown, latest volatility)"
+    )
 
 @app.post("/process_query")
 async def process_query(request: ProcessQueryRequest):
@@ -1988,23 +2494,10 @@ async def process_query(request: ProcessQueryRequest):
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
 
-        # 2. Get pricing data
-        pricing_response = await get_pricing_data2(
-            PricingRequest(mode="default", tickers=tickers)
-        )
-
-        if not pricing_response or "data" not in pricing_response:
-            raise HTTPException(status_code=500, detail="Failed to fetch pricing data")
-
-        # 3. Convert to DataFrame for analysis
-        df = pd.DataFrame(pricing_response["data"])
-        
-        # 4. Save the processed data in the provided session
+        # 2. Point the session at the tickers in the shared analysis snapshot
         await session_manager.initialize_session(request.session_id)
-        session_path = Path("sessions") / str(request.session_id)
-        pricing_data_path = session_path / "pricing_data.parquet"
         
-        if not session_manager.save_dataframe(df, str(request.session_id), "pricing_data"):
+        if not await asyncio.to_thread(save_pricing_reference, str(request.session_id), tickers, DEFAULT_BENCHMARK):
             raise HTTPException(
                 status_code=500,
                 detail="Failed to save pricing data to session storage"
@@ -2013,6 +2506,7 @@ async def process_query(request: ProcessQueryRequest):
         enable_verbose_stdout_logging()
         # 5. Create the agent with the function tool
         today = datetime.today().strftime('%Y-%m-%d')
+        transform_list = "\n".join(f"   - {name}: {description}" for name, description in describe_transforms().items())
         agent = Agent(
             name="Stock Data Processor",
             tools=[process_stock_data],
@@ -2029,13 +2523,17 @@ When you receive a query:
    - For relative dates like "last 3 months", calculate the actual date range
    - For specific dates like "from January to March 2023", use those exact dates
 3. Identify the session ID if provided, or use {request.session_id}
-4. Determine the transformation type requested (currently only 'cumulative_performance' is supported)
+4. Determine the transformation type requested, one of:
+{transform_list}
+   For rolling transforms you may set window (trading days, default {DEFAULT_WINDOW});
+   for rolling_beta set benchmark (default {DEFAULT_BENCHMARK})
 5. Format these as parameters for the process_stock_data function
 6. Call the function with these parameters
 7. Return the complete ProcessDataResponse, which includes:
    - status: The processing status
    - path: The path to the saved data
-   - summary: The summary statistics including start_date, end_date, and cumulative_returns
+   - summary: The summary statistics including start_date, end_date and the per-ticker
+     values of the transform (cumulative_returns, max_drawdown, latest_volatility, ...)
 
 Examples:
 - "Show me cumulative performance for AAPL and MSFT over the last 6 months in session abc-123"
@@ -2075,6 +2573,8 @@ Do not explain what you're doing, just call the function with the correct parame
         start_date = None
         end_date = None
         cumulative_returns = None
+        transformation_type = None
+        values = None
         
         if hasattr(result, "function_results") and result.function_results:
             print("\nDebug: Found function_results")
@@ -2083,12 +2583,16 @@ Do not explain what you're doing, just call the function with the correct parame
             start_date = func_result.start_date
             end_date = func_result.end_date
             cumulative_returns = func_result.cumulative_returns
+            transformation_type = getattr(func_result, "transformation_type", None)
+            values = getattr(func_result, "values", None)
         elif hasattr(result, "final_output"):
             print("\nDebug: Found final_output")
             s3_path = result.final_output.path
             start_date = result.final_output.start_date
             end_date = result.final_output.end_date
             cumulative_returns = result.final_output.cumulative_returns
+            transformation_type = result.final_output.transformation_type
+            values = result.final_output.values
         
         # Generate presigned URL if needed
         presigned_url = None
@@ -2109,7 +2613,9 @@ Do not explain what you're doing, just call the function with the correct parame
             "presigned_url": presigned_url,
             "start_date": start_date,
             "end_date": end_date,
-            "cumulative_returns": cumulative_returns
+            "cumulative_returns": cumulative_returns,
+            "transformation_type": transformation_type,
+            "values": values
         }
         
         print("\nDebug: Final response")
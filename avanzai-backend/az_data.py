@@ -8,16 +8,26 @@ from __future__ import annotations
 import pandas as pd
 import sqlite3
 import os
+import shutil
 from typing import *
 import yfinance as yf
 from datetime import datetime
 from agents import *
 from pydantic import *
 from pathlib import Path
-import gc
+import pyarrow as pa
+import pyarrow.feather as feather
 import pyarrow.parquet as pq
 import numpy as np
 
+from pricing_catalog import LATEST, get_catalog, resolve_local_snapshot
+from pricing_dataset import write_long_pricing_dataset
+from pricing_download import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, ChunkDownloadError,
+                              assemble_wide_pricing, download_universe_chunks)
+from pricing_refresh import DEFAULT_BATCH_SIZE, PriceSource, refresh_pricing
+from pricing_snapshot import slice_date_range
+from row_group_decoder import decode_row_groups
+
 class TickerRequest(BaseModel):
     """Request model for fetching macro data."""
     tickers: List[str]
@@ -152,9 +162,18 @@ def query_az_universe(
     return df
 
 def download_pricing(
-    csv_path: str = 'az_universe_01262025.csv',
+    csv_path: str = 'az_universe_05012025.csv',
     start: str = '2010-01-01',
-    parquet_path: str = 'az_pricing_latest.parquet'
+    parquet_path: str = 'az_pricing_latest.parquet',
+    dataset_root: Optional[str] = None,
+    partition_by: str = 'asset_class',
+    incremental: bool = False,
+    source: Optional[PriceSource] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    work_dir: Optional[str] = None,
+    publish_aliases: Optional[List[str]] = None
 ) -> str:
     """
     Download historical close prices for all tickers in a CSV universe and save to Parquet.
@@ -163,24 +182,62 @@ def download_pricing(
         csv_path: Path to CSV with columns ['ticker', 'name', 'asset_class'].
         start: Start date (YYYY-MM-DD) for price download.
         parquet_path: Output Parquet file path.
+        dataset_root: If given, also write the long-format partitioned dataset
+            (see ``pricing_dataset``) to this directory or ``s3://`` URI.
+        partition_by: Partition column for the long-format dataset ('asset_class' or 'ticker').
+        incremental: If True and ``parquet_path`` exists, only fetch closes after
+            each ticker's last stored date plus the history of new tickers
+            (see ``pricing_refresh.refresh_pricing``); the dataset is appended to.
+        source: Price source; defaults to yfinance.
+        batch_size: Tickers per source request in incremental mode.
+        chunk_size: Tickers per chunk for a full download (see ``pricing_download``).
+        max_workers: Chunks downloaded concurrently.
+        work_dir: Where finished chunks are kept until the file is assembled;
+            defaults to ``<parquet_path>.chunks``. Rerunning after a failure
+            only downloads the chunks that are missing.
+        publish_aliases: If given (e.g. ``['latest']``), upload the file as a new
+            snapshot version in the pricing catalog and point these aliases at it.
 
     Returns:
         The path to the saved Parquet file.
+
+    Raises:
+        ChunkDownloadError: If some chunks still failed after retrying, or some
+            incremental batches failed (nothing is published in either case).
     """
     # Load universe
     df = pd.read_csv(csv_path)[['ticker', 'name', 'asset_class']]
     tickers = df['ticker'].tolist()
 
-    # Download price data
+    if incremental and os.path.exists(parquet_path):
+        refresh = refresh_pricing(df, parquet_path, source=source, start=start,
+                                  batch_size=batch_size, dataset_root=dataset_root)
+        if refresh.failed_batches:
+            # Never publish a partially refreshed file; a rerun fetches the missing tails
+            raise ChunkDownloadError(refresh.failed_batches)
+        if publish_aliases:
+            get_catalog().publish(parquet_path, aliases=publish_aliases)
+        return parquet_path
+
+    # Download price data chunk by chunk, resuming any previous partial run
     end = datetime.now().strftime('%Y-%m-%d')
-    price_data = yf.download(tickers, start=start, end=end)['Close']
+    work_dir = work_dir or f"{parquet_path}.chunks"
+    result = download_universe_chunks(tickers, work_dir, source=source, start=start, end=end,
+                                      chunk_size=chunk_size, max_workers=max_workers)
+    if result.failures:
+        raise ChunkDownloadError(result.failures)
 
-    # Transform
-    price_data.reset_index(inplace=True)
-    price_data.rename(columns={'Date': 'date'}, inplace=True)
+    # Assemble the wide file (written to a temp file and renamed into place)
+    assemble_wide_pricing(tickers, work_dir, parquet_path, start, chunk_size=chunk_size)
+    shutil.rmtree(work_dir, ignore_errors=True)
 
-    # Save
-    price_data.to_parquet(parquet_path, index=False)
+    if dataset_root:
+        # The long-format writer works on the whole frame; only load it when asked for
+        write_long_pricing_dataset(pd.read_parquet(parquet_path), dataset_root, universe=df,
+                                   partition_by=partition_by)
+
+    if publish_aliases:
+        get_catalog().publish(parquet_path, aliases=publish_aliases)
 
     return parquet_path
 
@@ -541,69 +598,168 @@ class PricingRequest(BaseModel):
     tickers: List[str] = Field(..., description="List of ticker symbols to fetch data for")
     user_id: Optional[str] = Field(default=None, description="User ID for custom data")
     data_id: Optional[str] = Field(default=None, description="Data ID for custom data")
+    start_date: Optional[str] = Field(default=None, description="Inclusive start date (YYYY-MM-DD); defaults to full history")
+    end_date: Optional[str] = Field(default=None, description="Inclusive end date (YYYY-MM-DD); defaults to latest")
+
+def export_pricing_ipc(
+    parquet_path: str = 'az_pricing_latest.parquet',
+    ipc_path: Optional[str] = None
+) -> str:
+    """
+    Write an uncompressed Arrow IPC (Feather v2) copy of a pricing Parquet file.
+
+    The IPC copy can be memory-mapped and projected without decoding or copying,
+    so every worker on the box shares the same page cache.
+
+    Parameters:
+        parquet_path: Source Parquet file.
+        ipc_path: Output path; defaults to ``parquet_path`` with an ``.arrow`` suffix.
+
+    Returns:
+        The path to the written IPC file.
+    """
+    ipc_path = ipc_path or str(Path(parquet_path).with_suffix('.arrow'))
+    table = pq.read_table(parquet_path)
+
+    # Write next to the target and rename so readers never map a partial file
+    tmp_path = f"{ipc_path}.tmp"
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, ipc_path)
+
+    return ipc_path
+
+
+def read_pricing_local(
+    parquet_path: Union[str, Path],
+    columns: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> pa.Table:
+    """
+    Memory-map a local pricing file and project ``columns`` out of it.
+
+    If an up-to-date ``.arrow`` IPC copy sits next to the Parquet file (see
+    :func:`export_pricing_ipc`) the projection is zero-copy over the mapped
+    pages; otherwise the Parquet file itself is memory-mapped and only the
+    requested column chunks are decoded. A date window skips row groups via
+    the ``date`` statistics and is then cut by binary search.
+
+    Parameters:
+        parquet_path: Path to the Parquet file.
+        columns: Columns to return, e.g. ``['date', 'AAPL']``.
+        start_date: Optional inclusive start date (YYYY-MM-DD).
+        end_date: Optional inclusive end date (YYYY-MM-DD).
 
-def get_pricing_data_local(request: PricingRequest):
+    Returns:
+        An Arrow table with ``columns`` in the requested order.
+    """
+    parquet_path = Path(parquet_path)
+    ipc_path = parquet_path.with_suffix('.arrow')
+
+    if ipc_path.exists() and ipc_path.stat().st_mtime >= parquet_path.stat().st_mtime:
+        table = pa.ipc.open_file(pa.memory_map(str(ipc_path), 'r')).read_all()
+    else:
+        table = _decode_local_row_groups(parquet_path, columns, start_date, end_date)
+
+    missing = [c for c in columns if c not in table.column_names]
+    if missing:
+        raise ValueError(f"Columns not found in {parquet_path}: {missing}")
+    return slice_date_range(table.select(columns), start_date, end_date)
+
+
+def _decode_local_row_groups(
+    parquet_path: Path,
+    columns: List[str],
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> pa.Table:
+    """
+    Decode the row groups of a mapped local file that overlap the date window, in parallel.
+
+    Row groups go through the shared decode pool like the S3 reader's, each
+    thread reading from its own mapping of the file (the footer is parsed once).
+
+    Raises:
+        RowGroupDecodeError: If any row group failed to decode.
+    """
+    parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+    metadata = parquet_file.metadata
+    present = [c for c in columns if c in parquet_file.schema_arrow.names]
+
+    start = pd.Timestamp(start_date) if start_date else None
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1) if end_date else None
+    date_index = parquet_file.schema_arrow.get_field_index('date')
+    row_groups = []
+    for rg in range(metadata.num_row_groups):
+        stats = metadata.row_group(rg).column(date_index).statistics if date_index >= 0 else None
+        if stats is not None and stats.has_min_max:
+            if (start is not None and pd.Timestamp(stats.max) < start) or \
+                    (end is not None and pd.Timestamp(stats.min) >= end):
+                continue
+        row_groups.append(rg)
+
+    if not row_groups:
+        return parquet_file.schema_arrow.empty_table().select(present)
+    return decode_row_groups(
+        lambda rg: pq.ParquetFile(parquet_path, memory_map=True, metadata=metadata).read_row_group(rg, columns=present),
+        row_groups,
+        source=str(parquet_path)
+    )
+
+
+def get_pricing_data_local(request: PricingRequest, as_arrow: bool = False):
     """
     Load pricing data from a **local Parquet** file for the requested tickers.
 
-    - `mode="default"` → reads the project-level file `az_pricing_latest.parquet`
+    - `mode="default"` → reads the local 'latest' snapshot resolved through the
+      pricing catalog in the working directory (`az_pricing_latest.parquet`
+      until a catalog has been published)
     - `mode="custom"`  → reads `<data_dir>/<user_id>/<data_id>.parquet`
 
+    The file is memory-mapped (see :func:`read_pricing_local`). With
+    ``as_arrow=True`` the projected Arrow table is returned as-is so callers can
+    work on the shared buffers; JSON conversion only happens for the default
+    records output.
+
     Returns
     -------
     dict
         {"data": [ { "date": "...", "AAPL": 123.45, ... }, ... ]}
+        or a ``pyarrow.Table`` when ``as_arrow`` is True
     """
-    try:
-        # ------------------------------------------------------------------
-        # 1) Resolve the Parquet file path
-        # ------------------------------------------------------------------
-        DATA_DIR = Path("data")          # put custom files under ./data/…
-        if request.mode == "default":
-            parquet_path = Path("az_pricing_latest.parquet")
-        else:
-            parquet_path = DATA_DIR / str(request.user_id) / f"{request.data_id}.parquet"
-
-        if not parquet_path.exists():
-            raise FileNotFoundError(f"Pricing file not found: {parquet_path}")
-
-        # ------------------------------------------------------------------
-        # 2) Read only the columns we need
-        # ------------------------------------------------------------------
-        columns = ["date"] + request.tickers
-        result   = []
-
-        parquet_file = pq.ParquetFile(parquet_path)
-
-        for rg in range(parquet_file.num_row_groups):
-            try:
-                df_chunk = parquet_file.read_row_group(rg, columns=columns).to_pandas()
-
-                # Arrow returns date-typed column → keep it consistent as str
-                if isinstance(df_chunk["date"].iloc[0], (pd.Timestamp, datetime)):
-                    df_chunk["date"] = df_chunk["date"].dt.strftime("%Y-%m-%d")
-
-                # Clean non-finite values so they JSON-serialize nicely
-                df_chunk = df_chunk.replace([np.inf, -np.inf, np.nan], None)
-
-                result.extend(df_chunk.to_dict(orient="records"))
-
-                del df_chunk
-                gc.collect()
-
-            except Exception as e:
-                # log & skip bad row groups instead of failing the whole request
-                print(f"Row-group {rg} failed: {e}")
-                continue
+    # ------------------------------------------------------------------
+    # 1) Resolve the Parquet file path
+    # ------------------------------------------------------------------
+    DATA_DIR = Path("data")          # put custom files under ./data/…
+    if request.mode == "default":
+        parquet_path = Path(resolve_local_snapshot(LATEST).key)
+    else:
+        parquet_path = DATA_DIR / str(request.user_id) / f"{request.data_id}.parquet"
+
+    if not parquet_path.exists():
+        raise FileNotFoundError(f"Pricing file not found: {parquet_path}")
+
+    # ------------------------------------------------------------------
+    # 2) Project only the columns we need from the mapped file
+    # ------------------------------------------------------------------
+    table = read_pricing_local(parquet_path, ["date"] + request.tickers,
+                               request.start_date, request.end_date)
+    if table.num_rows == 0:
+        raise ValueError(f"No records found for tickers {request.tickers}")
+
+    if as_arrow:
+        return table
 
-        if not result:
-            raise ValueError(f"No records found for tickers {request.tickers}")
+    # ------------------------------------------------------------------
+    # 3) Edge conversion to JSON-friendly records
+    # ------------------------------------------------------------------
+    df = table.to_pandas()
 
-        return {"data": result}
+    # Arrow returns date-typed column → keep it consistent as str
+    if isinstance(df["date"].iloc[0], (pd.Timestamp, datetime)):
+        df["date"] = df["date"].dt.strftime("%Y-%m-%d")
 
-    except Exception as e:
-        # Let FastAPI's exception handling return 422/500 as appropriate
-        raise e
+    # Clean non-finite values so they JSON-serialize nicely
+    df = df.replace([np.inf, -np.inf, np.nan], None)
 
-    finally:
-        gc.collect()
+    return {"data": df.to_dict(orient="records")}
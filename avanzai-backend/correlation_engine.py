@@ -0,0 +1,136 @@
+"""
+correlation_engine.py
+
+N×N correlation matrices from one aligned returns matrix.
+
+All pairs are computed together from a handful of matrix products over the
+``(dates, tickers)`` returns matrix, with pairwise-complete observations
+(a date counts for a pair when both tickers have a return that day, as
+``DataFrame.corr`` does). On top of the full-period matrix there are
+rolling-window matrices and matrices conditioned on regime buckets of a
+driver series, e.g. VIX below 15, between 15 and 25, and above 25.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MIN_PERIODS = 20
+
+
+def pairwise_corr(returns: np.ndarray, min_periods: int = DEFAULT_MIN_PERIODS) -> np.ndarray:
+    """
+    Correlation of every column pair of ``returns`` (NaN = missing).
+
+    Pairs with fewer than ``min_periods`` common observations are NaN.
+    """
+    valid = ~np.isnan(returns)
+    mask = valid.astype(np.float64)
+    x = np.where(valid, returns, 0.0)
+
+    # n[i, j]: common observations; sx[i, j]: sum of column i over them; sxx likewise for squares
+    n = mask.T @ mask
+    sx = x.T @ mask
+    sxx = (x * x).T @ mask
+    sxy = x.T @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx * sx / n
+        var_y = var_x.T
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < min_periods) | ~np.isfinite(corr)] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    diagonal = np.diag(n) >= min_periods
+    corr[np.diag_indices_from(corr)] = np.where(diagonal, 1.0, np.nan)
+    return corr
+
+
+def corr_frame(returns: pd.DataFrame, min_periods: int = DEFAULT_MIN_PERIODS) -> pd.DataFrame:
+    """Full-period N×N correlation matrix of a returns frame."""
+    values = pairwise_corr(returns.to_numpy(dtype=np.float64), min_periods)
+    return pd.DataFrame(values, index=returns.columns, columns=returns.columns)
+
+
+def rolling_corr(
+    returns: pd.DataFrame,
+    window: int,
+    step: int = 1,
+    min_periods: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Correlation matrices over trailing ``window``-row windows, one every ``step`` rows.
+
+    Returns:
+        A frame indexed by ``(date, ticker)`` with one column per ticker; each
+        date's block is the N×N matrix of the window ending on that date.
+    """
+    min_periods = window // 2 if min_periods is None else min_periods
+    values = returns.to_numpy(dtype=np.float64)
+    ends = np.arange(window, len(values) + 1, step)
+    if len(ends) and ends[-1] != len(values):
+        ends = np.append(ends, len(values))
+    blocks = [pairwise_corr(values[end - window:end], min_periods) for end in ends]
+    tickers = list(returns.columns)
+    index = pd.MultiIndex.from_product([returns.index[ends - 1], tickers], names=["date", "ticker"])
+    data = np.concatenate(blocks) if blocks else np.empty((0, len(tickers)))
+    return pd.DataFrame(data, index=index, columns=tickers)
+
+
+def regime_labels(bounds: Sequence[float]) -> List[str]:
+    """Readable bucket names for ``bounds``, e.g. ``[15, 25]`` -> ``['<15', '15-25', '>=25']``."""
+    bounds = list(bounds)
+    if not bounds:
+        return ["all"]
+    labels = [f"<{bounds[0]:g}"]
+    labels += [f"{lo:g}-{hi:g}" for lo, hi in zip(bounds[:-1], bounds[1:])]
+    labels.append(f">={bounds[-1]:g}")
+    return labels
+
+
+def regime_corr(
+    returns: pd.DataFrame,
+    driver: pd.Series,
+    bounds: Sequence[float],
+    min_periods: int = DEFAULT_MIN_PERIODS
+) -> pd.DataFrame:
+    """
+    Correlation matrices of ``returns`` on the dates falling in each regime bucket of ``driver``.
+
+    ``driver`` (e.g. the VIX level) is aligned to the return dates by carrying
+    its last value forward; dates before its first value belong to no regime.
+
+    Returns:
+        A frame indexed by ``(regime, ticker)``, one N×N block per regime, plus
+        an ``observations`` column with the number of dates in the regime.
+    """
+    aligned = driver.sort_index().reindex(returns.index, method="ffill").to_numpy(dtype=np.float64)
+    buckets = np.digitize(aligned, bounds)
+    labels = regime_labels(bounds)
+    values = returns.to_numpy(dtype=np.float64)
+    tickers = list(returns.columns)
+
+    frames = []
+    for bucket, label in enumerate(labels):
+        rows = (buckets == bucket) & ~np.isnan(aligned)
+        block = pd.DataFrame(pairwise_corr(values[rows], min_periods), index=tickers, columns=tickers)
+        block["observations"] = int(rows.sum())
+        block.index = pd.MultiIndex.from_product([[label], tickers], names=["regime", "ticker"])
+        frames.append(block)
+    return pd.concat(frames)
+
+
+def top_pairs(corr: pd.DataFrame, n: int = 5, ascending: bool = False) -> List[dict]:
+    """The ``n`` most (or least) correlated distinct pairs of a square matrix."""
+    tickers = list(corr.columns)
+    upper = np.triu_indices(len(tickers), k=1)
+    values = corr.to_numpy()[upper]
+    keep = ~np.isnan(values)
+    order = np.argsort(values[keep])
+    order = order if ascending else order[::-1]
+    i, j = upper[0][keep][order[:n]], upper[1][keep][order[:n]]
+    return [
+        {"x": tickers[a], "y": tickers[b], "corr": round(float(corr.iat[a, b]), 4)}
+        for a, b in zip(i, j)
+    ]
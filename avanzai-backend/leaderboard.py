@@ -0,0 +1,179 @@
+"""
+leaderboard.py
+
+Market leaderboard materialized once per pricing snapshot version.
+
+For every universe ticker and every standard horizon (``period_returns``'s
+horizons plus year-to-date) the table holds the period return, annualized
+volatility, max drawdown and number of prices, along with the ticker's
+``asset_class`` from ``az_universe``. It is built from the snapshot's
+materialized returns as soon as they exist (see ``returns_store``) and
+stored as ``leaderboard.parquet`` next to them, so "top commodities this
+year" is a filter and a sort over about ten thousand rows instead of an LLM
+call plus a full pricing load.
+
+Horizon statistics are computed by ``returns_engine.compute_returns`` on the
+price path rebuilt from the cumulative log returns, anchored on the last
+price at or before the horizon start. Tickers without a price at the start
+of a horizon, and tickers whose prices stopped (``period_returns.STALE_DAYS``),
+have NaN statistics for it and are left out of rankings.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from period_returns import HORIZONS, YTD, horizon_windows, stale_mask
+from returns_engine import PriceMatrix, compute_returns
+from returns_store import RETURNS_DIR, SnapshotReturns, add_returns_listener, snapshot_id
+from session_io import atomic_write_bytes
+
+UNIVERSE_DB_PATH = os.getenv('UNIVERSE_DB_PATH', 'az_universe_01262025.db')
+UNIVERSE_TABLE = 'az_universe'
+UNCLASSIFIED = 'unclassified'
+
+LEADERBOARD_HORIZONS = list(HORIZONS) + [YTD]
+METRICS = ("return", "volatility", "max_drawdown")
+FILENAME = "leaderboard.parquet"
+
+
+def load_universe_classes(db_path: str = UNIVERSE_DB_PATH, table_name: str = UNIVERSE_TABLE) -> pd.DataFrame:
+    """``ticker``-indexed frame of ``name`` and ``asset_class`` from the universe database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql(f"SELECT ticker, name, asset_class FROM {table_name}", conn)
+    finally:
+        conn.close()
+    return df.drop_duplicates("ticker").set_index("ticker")
+
+
+def build_leaderboard(returns: SnapshotReturns, universe: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per ``(horizon, ticker)`` for the universe tickers present in ``returns``.
+
+    Columns: horizon, ticker, name, asset_class, start_date, end_date, return,
+    volatility, max_drawdown, observations.
+    """
+    tickers = [t for t in universe.index if t in set(returns.tickers)]
+    cols = np.asarray(returns.columns(tickers))
+    end, starts = horizon_windows(returns, LEADERBOARD_HORIZONS)
+    b = int(np.searchsorted(returns.dates, end, 'right')) - 1
+    first = returns.first_valid[cols]
+    stale = stale_mask(returns, cols, np.array([b]))[0]
+
+    frames = []
+    for horizon, start in zip(LEADERBOARD_HORIZONS, starts):
+        a = int(np.searchsorted(returns.dates, start, 'right')) - 1
+        complete = (a >= 0) & (first >= 0) & (first <= a) & ~stale
+        # Relative prices on valid days, anchored on the last price at or before the start
+        path = np.exp(returns.cumlog[max(a, 0):b + 1][:, cols])
+        path[1:][~returns.valid[max(a, 0) + 1:b + 1][:, cols]] = np.nan
+        path[:, ~complete] = np.nan
+        result = compute_returns(PriceMatrix(dates=returns.dates[max(a, 0):b + 1], tickers=tickers, values=path))
+        frames.append(pd.DataFrame({
+            "horizon": horizon,
+            "ticker": tickers,
+            "start_date": str(returns.dates[a]) if a >= 0 else None,
+            "end_date": str(returns.dates[b]),
+            "return": result.period_return,
+            "volatility": result.annualized_volatility,
+            "max_drawdown": result.max_drawdown,
+            "observations": np.where(complete, result.observations, 0)
+        }))
+
+    table = pd.concat(frames, ignore_index=True)
+    classes = universe.loc[table["ticker"]]
+    table.insert(2, "name", classes["name"].to_numpy())
+    table.insert(3, "asset_class", classes["asset_class"].fillna(UNCLASSIFIED).to_numpy())
+    return table
+
+
+# ------------------ per-snapshot storage ------------------
+_LEADERBOARDS: Dict[str, pd.DataFrame] = {}
+_LEADERBOARDS_LOCK = threading.Lock()
+
+
+def _path(returns: SnapshotReturns, root: str) -> Path:
+    return Path(root) / snapshot_id(returns.key, returns.version) / FILENAME
+
+
+def materialize_leaderboard(returns: SnapshotReturns, root: str = RETURNS_DIR,
+                            universe_db: str = UNIVERSE_DB_PATH) -> pd.DataFrame:
+    """Build and store the leaderboard of a snapshot version unless it already exists; return it."""
+    path = _path(returns, root)
+    if path.exists():
+        return _remember(returns, pd.read_parquet(path))
+    table = build_leaderboard(returns, load_universe_classes(universe_db))
+    buffer = BytesIO()
+    table.to_parquet(buffer, index=False)
+    atomic_write_bytes(path, buffer.getvalue())
+    print(f"Materialized leaderboard for {returns.key} version {returns.version}: {len(table)} rows")
+    return _remember(returns, table)
+
+
+def _remember(returns: SnapshotReturns, table: pd.DataFrame) -> pd.DataFrame:
+    with _LEADERBOARDS_LOCK:
+        # Keep only the current version of each snapshot key
+        for stale in [k for k in _LEADERBOARDS if k.startswith(f"{returns.key}@")]:
+            _LEADERBOARDS.pop(stale)
+        _LEADERBOARDS[f"{returns.key}@{returns.version}"] = table
+    return table
+
+
+def get_leaderboard(returns: SnapshotReturns, root: str = RETURNS_DIR) -> pd.DataFrame:
+    """Leaderboard of a snapshot version, from memory, disk, or built now."""
+    with _LEADERBOARDS_LOCK:
+        table = _LEADERBOARDS.get(f"{returns.key}@{returns.version}")
+    return table if table is not None else materialize_leaderboard(returns, root)
+
+
+def rank_leaderboard(
+    table: pd.DataFrame,
+    horizon: str,
+    asset_class: Optional[str] = None,
+    metric: str = "return",
+    n: int = 10,
+    bottom: bool = False
+) -> Dict[str, List[dict]]:
+    """
+    Top (or bottom) ``n`` tickers by ``metric`` over ``horizon``, per asset class.
+
+    Raises:
+        ValueError: For an unknown horizon, metric or asset class.
+    """
+    if horizon not in LEADERBOARD_HORIZONS:
+        raise ValueError(f"Unknown horizon '{horizon}'. Supported: {', '.join(LEADERBOARD_HORIZONS)}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Supported: {', '.join(METRICS)}")
+    rows = table[(table["horizon"] == horizon) & table[metric].notna()]
+    if asset_class is not None:
+        if asset_class not in set(table["asset_class"]):
+            raise ValueError(f"Unknown asset class '{asset_class}'. "
+                             f"Available: {', '.join(sorted(set(table['asset_class'])))}")
+        rows = rows[rows["asset_class"] == asset_class]
+
+    ranked = rows.sort_values(metric, ascending=bottom, kind="stable").groupby("asset_class", sort=True).head(n)
+    columns = ["ticker", "name", "return", "volatility", "max_drawdown", "observations"]
+    return {
+        group: frame[columns].round(6).astype(object).where(frame[columns].notna(), None).to_dict("records")
+        for group, frame in ranked.groupby("asset_class", sort=True)
+    }
+
+
+def _safe_materialize(returns: SnapshotReturns):
+    try:
+        materialize_leaderboard(returns)
+    except Exception as e:
+        print(f"Error materializing leaderboard for {returns.key}: {str(e)}")
+
+
+def enable_leaderboard_materialization():
+    """Build the leaderboard whenever the returns of a newly loaded snapshot version are materialized."""
+    add_returns_listener(_safe_materialize)
@@ -0,0 +1,114 @@
+"""
+period_returns.py
+
+Returns over arbitrary date windows from the cumulative log-return prefix
+index of a snapshot (``SnapshotReturns.cumlog``).
+
+The return of a ticker between dates A and B (close on A to close on B) is
+``exp(cumlog[b] - cumlog[a]) - 1``, where ``a`` and ``b`` are the last rows on
+or before A and B. Any number of tickers and windows is answered with two
+gathers and a subtraction, independent of the window length. A window that
+starts before a ticker's first price, or before the first snapshot date, is
+NaN rather than a partial-period return. So is a window ending more than
+``STALE_DAYS`` after a ticker's last price (delisted or halted): ``cumlog``
+stays flat after it, which would otherwise read as a 0% return.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from returns_store import SnapshotReturns
+
+# Standard look-back horizons (also used for session time ranges)
+HORIZONS = {
+    "1d": timedelta(days=1),
+    "1w": timedelta(weeks=1),
+    "1m": timedelta(days=30),
+    "3m": timedelta(days=90),
+    "6m": timedelta(days=180),
+    "1y": timedelta(days=365),
+    "5y": timedelta(days=365 * 5)
+}
+YTD = "ytd"
+# Calendar days a ticker's last price may lag a window's end (weekends and
+# holidays of markets closed on the snapshot's last dates)
+STALE_DAYS = 5
+
+
+def horizon_start(as_of: np.datetime64, horizon: str) -> np.datetime64:
+    """
+    Start date of ``horizon`` ending on ``as_of``; ``"ytd"`` starts on the last day of the previous year.
+
+    Raises:
+        ValueError: For an unknown horizon.
+    """
+    as_of = np.datetime64(as_of, 'D')
+    if horizon == YTD:
+        return np.datetime64(f"{as_of.astype('datetime64[Y]').astype(int) + 1970 - 1}-12-31", 'D')
+    if horizon not in HORIZONS:
+        raise ValueError(f"Unknown horizon '{horizon}'. Supported: {', '.join(list(HORIZONS) + [YTD])}")
+    return as_of - np.timedelta64(HORIZONS[horizon].days, 'D')
+
+
+def window_returns(
+    store: SnapshotReturns,
+    tickers: List[str],
+    starts: Sequence,
+    ends: Sequence
+) -> np.ndarray:
+    """
+    Simple returns of every ticker over every ``(starts[k], ends[k])`` window.
+
+    Returns:
+        A ``(windows, tickers)`` array.
+
+    Raises:
+        KeyError: If a ticker is not in the snapshot.
+    """
+    cols = np.asarray(store.columns(tickers))
+    starts = np.asarray(starts, dtype='datetime64[D]')
+    ends = np.asarray(ends, dtype='datetime64[D]')
+    a = np.searchsorted(store.dates, starts, 'right') - 1
+    b = np.searchsorted(store.dates, ends, 'right') - 1
+
+    start_log = store.cumlog[np.maximum(a, 0)][:, cols]
+    end_log = store.cumlog[np.maximum(b, 0)][:, cols]
+    values = np.expm1(end_log - start_log)
+
+    first = store.first_valid[cols]
+    incomplete = (a[:, None] < first[None, :]) | (first[None, :] < 0) | (b[:, None] < a[:, None])
+    incomplete |= stale_mask(store, cols, b)
+    values[incomplete] = np.nan
+    return values
+
+
+def stale_mask(store: SnapshotReturns, cols: np.ndarray, end_rows: np.ndarray) -> np.ndarray:
+    """``(windows, tickers)`` mask of tickers whose last price is more than ``STALE_DAYS`` before each end row."""
+    last = store.last_valid[cols]
+    last_dates = store.dates[np.maximum(last, 0)]
+    end_dates = store.dates[np.maximum(end_rows, 0)]
+    lag = end_dates[:, None] - last_dates[None, :]
+    return (last[None, :] < 0) | (lag > np.timedelta64(STALE_DAYS, 'D'))
+
+
+def horizon_windows(store: SnapshotReturns, horizons: List[str],
+                    as_of: Optional[str] = None) -> Tuple[np.datetime64, np.ndarray]:
+    """``(end date, start dates)`` of ``horizons`` ending on ``as_of`` (default: the last snapshot date)."""
+    end = np.datetime64(as_of, 'D') if as_of else store.dates[-1]
+    return end, np.array([horizon_start(end, h) for h in horizons], dtype='datetime64[D]')
+
+
+def horizon_returns(
+    store: SnapshotReturns,
+    tickers: List[str],
+    horizons: List[str],
+    as_of: Optional[str] = None
+) -> pd.DataFrame:
+    """Returns of ``tickers`` over standard ``horizons`` ending on ``as_of``, as a tickers × horizons frame."""
+    end, starts = horizon_windows(store, horizons, as_of)
+    values = window_returns(store, tickers, starts, np.full(len(starts), end))
+    return pd.DataFrame(values.T, index=pd.Index(tickers, name="ticker"), columns=horizons)
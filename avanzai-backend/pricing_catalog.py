@@ -0,0 +1,342 @@
+"""
+pricing_catalog.py
+
+Catalog of published pricing snapshots and the single resolver every pricing
+loader goes through.
+
+The catalog is a small JSON manifest (``PRICING_CATALOG_KEY`` in the pricing
+bucket) shaped like::
+
+    {
+      "aliases": {"latest": "20250601-3f2a9c1b0d4e", "analysis": "20250411-..."},
+      "snapshots": {
+        "20250601-3f2a9c1b0d4e": {
+          "version": "20250601-3f2a9c1b0d4e",
+          "key": "pricing/az_pricing_20250601-3f2a9c1b0d4e.parquet",
+          "checksum": "sha256:...", "created_at": "...",
+          "first_date": "2010-01-04", "last_date": "2025-05-30",
+          "num_rows": 3870, "tickers": ["AAPL", ...],
+          "row_groups": [{"num_rows": 256, "first_date": "...", "last_date": "..."}, ...]
+        }
+      }
+    }
+
+Snapshot files are immutable once published; moving an alias to a new version
+is the only mutation. Anything cached per snapshot (projections, returns
+matrices, leaderboards) should be keyed by :attr:`SnapshotRef.version`, which
+changes exactly when an alias moves. When no manifest exists yet the legacy
+hard-coded file names are used, so nothing breaks before the first publish.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow.parquet as pq
+
+from pricing_snapshot import (DEFAULT_BUCKET, DEFAULT_REFRESH_SECONDS, PricingSnapshotCache,
+                              create_s3_client, drop_snapshot_cache, get_snapshot_cache)
+
+CATALOG_KEY = os.getenv('PRICING_CATALOG_KEY', 'pricing/catalog.json')
+SNAPSHOT_PREFIX = 'pricing/'
+
+LATEST = 'latest'
+ANALYSIS = 'analysis'
+# Used until a catalog has been published
+LEGACY_KEYS = {
+    LATEST: 'az_pricing_latest.parquet',
+    ANALYSIS: 'az_pricing_04112025.parquet',
+}
+
+
+@dataclass(frozen=True)
+class SnapshotRef:
+    """A resolved snapshot: where it lives and the version to key caches by."""
+    name: str
+    version: str
+    key: str
+    bucket: Optional[str]
+    entry: Optional[dict] = None
+
+    @property
+    def tickers(self) -> Optional[List[str]]:
+        """Tickers in the snapshot (None for legacy, uncatalogued files)."""
+        return self.entry.get('tickers') if self.entry else None
+
+    def cache_key(self, *parts) -> str:
+        """Key for a value derived from this snapshot, e.g. ``ref.cache_key('returns', 'AAPL')``."""
+        return ":".join([self.version] + [str(p) for p in parts])
+
+
+# ------------------ manifest entries ------------------
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return ``sha256:<hex>`` of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def _format_date(value) -> Optional[str]:
+    return value.strftime('%Y-%m-%d') if value is not None and hasattr(value, 'strftime') else None
+
+
+def describe_snapshot(path: str) -> dict:
+    """
+    Build the manifest entry for a local wide pricing parquet file.
+
+    Date coverage and the row-group layout come from the footer statistics,
+    so only the checksum reads the whole file.
+    """
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    names = parquet_file.schema_arrow.names
+    date_index = names.index('date')
+
+    row_groups = []
+    for rg in range(metadata.num_row_groups):
+        stats = metadata.row_group(rg).column(date_index).statistics
+        has_stats = stats is not None and stats.has_min_max
+        row_groups.append({
+            "num_rows": metadata.row_group(rg).num_rows,
+            "first_date": _format_date(stats.min) if has_stats else None,
+            "last_date": _format_date(stats.max) if has_stats else None,
+        })
+
+    checksum = file_checksum(path)
+    created_at = datetime.now(timezone.utc)
+    return {
+        "version": f"{created_at:%Y%m%d}-{checksum.split(':')[1][:12]}",
+        "checksum": checksum,
+        "created_at": created_at.isoformat(),
+        "first_date": row_groups[0]["first_date"] if row_groups else None,
+        "last_date": row_groups[-1]["last_date"] if row_groups else None,
+        "num_rows": metadata.num_rows,
+        "tickers": [n for n in names if n != 'date'],
+        "row_groups": row_groups,
+    }
+
+
+# ------------------ catalog ------------------
+class SnapshotCatalog:
+    """Reads (with a short TTL) and publishes the pricing snapshot manifest in S3."""
+
+    def __init__(
+        self,
+        bucket: Optional[str] = DEFAULT_BUCKET,
+        key: str = CATALOG_KEY,
+        client_factory: Callable = create_s3_client,
+        ttl: int = DEFAULT_REFRESH_SECONDS
+    ):
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self._client_factory = client_factory
+        self._client = None
+        self._manifest: Optional[dict] = None
+        self._resolved: Dict[str, SnapshotRef] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def manifest(self, refresh: bool = False) -> dict:
+        """Return the manifest, re-reading it once ``ttl`` seconds have passed."""
+        with self._lock:
+            if refresh or self._manifest is None or time.time() - self._loaded_at > self.ttl:
+                self._manifest = self._read()
+                self._resolved = {}
+                self._loaded_at = time.time()
+            return self._manifest
+
+    def resolve(self, name: str) -> SnapshotRef:
+        """
+        Resolve an alias (``'latest'``, ``'analysis'``), a version, or a raw file key.
+
+        Resolutions are cached until the manifest is next re-read.
+
+        Raises:
+            ValueError: If ``name`` is none of those.
+        """
+        manifest = self.manifest()
+        ref = self._resolved.get(name)
+        if ref is not None:
+            return ref
+
+        snapshots = manifest.get('snapshots', {})
+        version = manifest.get('aliases', {}).get(name, name)
+        if version in snapshots:
+            entry = snapshots[version]
+            ref = SnapshotRef(name=name, version=version, key=self._snapshot_key(entry['key']),
+                              bucket=self.bucket, entry=entry)
+        else:
+            key = LEGACY_KEYS.get(name, name)
+            if not key.endswith('.parquet'):
+                raise ValueError(f"Unknown pricing snapshot: {name}")
+            key = self._snapshot_key(key)
+            # Uncatalogued file: version it by its ETag so caches still turn over when it changes
+            etag = self._etag(key)
+            ref = SnapshotRef(name=name, version=f"{key}@{etag}" if etag else key, key=key, bucket=self.bucket)
+
+        self._resolved[name] = ref
+        return ref
+
+    def publish(self, path: str, aliases: Optional[List[str]] = None) -> SnapshotRef:
+        """
+        Store a local pricing file as a new immutable snapshot and point ``aliases`` at it.
+
+        The file is stored as ``pricing/az_pricing_<version>.parquet``; the
+        manifest is written last, so readers switch over only once the copy is
+        complete.
+        """
+        aliases = aliases or [LATEST]
+        entry = describe_snapshot(path)
+        entry['key'] = f"{SNAPSHOT_PREFIX}az_pricing_{entry['version']}.parquet"
+        self._store_file(path, entry['key'])
+
+        with self._lock:
+            manifest = self._read()
+            manifest.setdefault('snapshots', {})[entry['version']] = entry
+            for alias in aliases:
+                manifest.setdefault('aliases', {})[alias] = entry['version']
+            self._write(manifest)
+            self._manifest = manifest
+            self._resolved = {}
+            self._loaded_at = time.time()
+
+        print(f"Published pricing snapshot {entry['version']} as {aliases}")
+        return self.resolve(aliases[0])
+
+    # ------------------ storage ------------------
+    def _snapshot_key(self, key: str) -> str:
+        return key
+
+    def _etag(self, key: str) -> Optional[str]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key).get('ETag', '').strip('"') or None
+        except Exception:
+            return None
+
+    def _store_file(self, path: str, key: str):
+        self.client.upload_file(path, self.bucket, key)
+
+    def _read(self) -> dict:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key)
+        except Exception as e:
+            if 'NoSuchKey' in str(e) or '404' in str(e):
+                return {"aliases": {}, "snapshots": {}}
+            raise
+        return json.loads(response['Body'].read())
+
+    def _write(self, manifest: dict):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps(manifest, indent=2).encode(),
+            ContentType='application/json'
+        )
+
+
+class LocalSnapshotCatalog(SnapshotCatalog):
+    """Same catalog kept in a local directory (``<root>/catalog.json``); keys resolve to local paths."""
+
+    def __init__(self, root: str = '.', ttl: int = DEFAULT_REFRESH_SECONDS):
+        super().__init__(bucket=None, key=os.path.join(root, os.path.basename(CATALOG_KEY)), ttl=ttl)
+        self.root = root
+
+    def _snapshot_key(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _etag(self, key: str) -> Optional[str]:
+        return f"{os.stat(key).st_mtime_ns:x}" if os.path.exists(key) else None
+
+    def _store_file(self, path: str, key: str):
+        target = self._snapshot_key(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.key):
+            return {"aliases": {}, "snapshots": {}}
+        with open(self.key, 'r') as f:
+            return json.load(f)
+
+    def _write(self, manifest: dict):
+        with open(f"{self.key}.tmp", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{self.key}.tmp", self.key)
+
+
+# ------------------ process-wide resolver ------------------
+_CATALOGS: Dict[str, SnapshotCatalog] = {}   # keyed by bucket, or absolute root for local catalogs
+_CATALOGS_LOCK = threading.Lock()
+
+
+def get_catalog(bucket: str = DEFAULT_BUCKET) -> SnapshotCatalog:
+    """Return the shared catalog for ``bucket``."""
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(bucket)
+        if catalog is None:
+            catalog = SnapshotCatalog(bucket=bucket)
+            _CATALOGS[bucket] = catalog
+        return catalog
+
+
+def get_local_catalog(root: str = '.') -> SnapshotCatalog:
+    """Return the shared catalog for a local directory of snapshots."""
+    root = os.path.abspath(root)
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(root)
+        if catalog is None:
+            catalog = LocalSnapshotCatalog(root)
+            _CATALOGS[root] = catalog
+        return catalog
+
+
+def resolve_snapshot(name: str = LATEST, bucket: str = DEFAULT_BUCKET) -> SnapshotRef:
+    """Resolve a snapshot alias, version or key to a :class:`SnapshotRef`; use this in every loader."""
+    return get_catalog(bucket).resolve(name)
+
+
+def resolve_local_snapshot(name: str = LATEST, root: str = '.') -> SnapshotRef:
+    """Same as :func:`resolve_snapshot` for snapshots kept on local disk; ``key`` is the file path."""
+    return get_local_catalog(root).resolve(name)
+
+
+# Alias -> key currently backing a warm snapshot cache, per bucket
+_ALIAS_KEYS: Dict[Tuple[str, str], str] = {}
+
+
+def snapshot_cache_for(name: str = LATEST, bucket: str = DEFAULT_BUCKET) -> Tuple[SnapshotRef, PricingSnapshotCache]:
+    """
+    Resolve ``name`` and return its in-memory snapshot cache, warming it in the background.
+
+    When an alias has moved to a new version, the cache of the version it
+    used to point at is dropped (unless another alias still uses it).
+    """
+    ref = resolve_snapshot(name, bucket)
+    cache = get_snapshot_cache(ref.key, bucket)
+    cache.start()
+
+    with _CATALOGS_LOCK:
+        previous = _ALIAS_KEYS.get((bucket, name))
+        _ALIAS_KEYS[(bucket, name)] = ref.key
+        still_used = previous in {k for (b, _), k in _ALIAS_KEYS.items() if b == bucket}
+    if previous and previous != ref.key and not still_used:
+        print(f"Pricing snapshot '{name}' moved to {ref.version}; dropping {previous}")
+        drop_snapshot_cache(previous, bucket)
+    return ref, cache
@@ -0,0 +1,352 @@
+"""
+pricing_dataset.py
+
+Long-format, partitioned pricing dataset kept alongside the wide az_pricing file.
+
+Layout (local directory or ``s3://bucket/prefix``)::
+
+    <root>/_index.json                       ticker -> partition, first/last date; partition -> files
+    <root>/asset_class=etf/part-0.parquet    rows (ticker, date, close) sorted by ticker, date
+    <root>/asset_class=etf/part-1.parquet    rows appended by an incremental refresh
+    <root>/asset_class=equity/part-0.parquet
+    ...
+
+Rows are only stored where a ticker actually has a close, so crypto and equity
+calendars no longer pad each other with NaNs. Files are written with small,
+sorted row groups, min/max statistics and a page index, so a reader asking for
+N tickers over a date range only touches the partitions and row groups that
+can contain them.
+
+Incremental refreshes add new ``part-N`` files and then rewrite the index, which
+is the commit point: readers only open the files the index lists, so they see
+either the previous version or the new one, never a partial append.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+INDEX_FILE = "_index.json"
+DEFAULT_ROW_GROUP_SIZE = 32_768      # roughly 8 tickers x 15 years per row group
+DEFAULT_DATA_PAGE_SIZE = 64 * 1024   # small pages so the page index can prune inside a group
+PARTITION_COLUMNS = ("asset_class", "ticker")
+
+
+def _resolve(root: str) -> Tuple[pafs.FileSystem, str]:
+    """Return the filesystem and path for a local directory or an ``s3://`` URI."""
+    if "://" in root:
+        return pafs.FileSystem.from_uri(root)
+    return pafs.LocalFileSystem(), os.path.abspath(root)
+
+
+def wide_to_long(wide: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a wide ``date`` + one-column-per-ticker frame to ``(ticker, date, close)`` rows.
+
+    Missing and non-finite closes are dropped rather than stored.
+    """
+    long_df = wide.melt(id_vars="date", var_name="ticker", value_name="close")
+    long_df = long_df[pd.notna(long_df["close"]) & (long_df["close"].abs() != float("inf"))]
+    long_df["date"] = pd.to_datetime(long_df["date"])
+    return long_df[["ticker", "date", "close"]].sort_values(["ticker", "date"], kind="stable")
+
+
+def write_long_pricing_dataset(
+    wide: pd.DataFrame,
+    root: str,
+    universe: Optional[pd.DataFrame] = None,
+    partition_by: str = "asset_class",
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+) -> str:
+    """
+    Write a wide pricing frame as a long-format dataset partitioned by asset class or ticker.
+
+    Parameters:
+        wide: Frame with a ``date`` column plus one close column per ticker.
+        root: Output directory or ``s3://`` URI.
+        universe: Frame with ``ticker`` and ``asset_class`` columns (required for
+            ``partition_by='asset_class'``; unknown tickers go to ``unclassified``).
+        partition_by: ``'asset_class'`` or ``'ticker'``.
+        row_group_size: Rows per Parquet row group.
+
+    Returns:
+        The dataset root.
+    """
+    if partition_by not in PARTITION_COLUMNS:
+        raise ValueError(f"partition_by must be one of {PARTITION_COLUMNS}")
+
+    long_df = wide_to_long(wide)
+    if partition_by == "asset_class":
+        if universe is None:
+            raise ValueError("A universe with an asset_class column is required to partition by asset_class")
+        classes = universe.drop_duplicates("ticker").set_index("ticker")["asset_class"]
+        long_df["asset_class"] = long_df["ticker"].map(classes).fillna("unclassified")
+
+    fs, base = _resolve(root)
+    fs.create_dir(base, recursive=True)
+
+    index: Dict[str, Dict[str, str]] = {}
+    files: Dict[str, List[str]] = {}
+    for part_value, part_df in long_df.groupby(partition_by, sort=True):
+        _write_part(fs, f"{base}/{partition_by}={part_value}", "part-0.parquet", part_df, row_group_size)
+        files[str(part_value)] = ["part-0.parquet"]
+        index.update(_ticker_bounds(part_df, str(part_value)))
+
+    _write_index(fs, base, {"partition_by": partition_by, "tickers": index, "files": files})
+    _INDEX_CACHE.pop(root, None)
+    return root
+
+
+def append_long_pricing(
+    wide: pd.DataFrame,
+    root: str,
+    universe: Optional[pd.DataFrame] = None,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+) -> int:
+    """
+    Append new closes to an existing dataset without touching the files already written.
+
+    Only rows after each ticker's stored ``last_date`` are kept (new tickers keep
+    all of theirs). They are written as one new ``part-N.parquet`` per affected
+    partition and published by rewriting the index.
+
+    Parameters:
+        wide: Frame with a ``date`` column plus one close column per ticker.
+        root: Existing dataset directory or ``s3://`` URI.
+        universe: Frame with ``ticker``/``asset_class`` used to place new tickers
+            when the dataset is partitioned by asset class.
+        row_group_size: Rows per Parquet row group.
+
+    Returns:
+        The number of rows appended.
+    """
+    index = load_dataset_index(root, refresh=True)
+    partition_by = index["partition_by"]
+    tickers = index["tickers"]
+
+    long_df = wide_to_long(wide)
+    last_dates = pd.to_datetime(long_df["ticker"].map(
+        {t: info["last_date"] for t, info in tickers.items()}
+    ))
+    long_df = long_df[last_dates.isna() | (long_df["date"] > last_dates)]
+    if long_df.empty:
+        return 0
+
+    if partition_by == "asset_class":
+        classes = {t: info["partition"] for t, info in tickers.items()}
+        if universe is not None:
+            for ticker, asset_class in universe.drop_duplicates("ticker")[["ticker", "asset_class"]].itertuples(index=False):
+                classes.setdefault(ticker, asset_class)
+        long_df["asset_class"] = long_df["ticker"].map(classes).fillna("unclassified")
+
+    fs, base = _resolve(root)
+    files = index.get("files") or {info["partition"]: ["part-0.parquet"] for info in tickers.values()}
+    for part_value, part_df in long_df.groupby(partition_by, sort=True):
+        part_value = str(part_value)
+        part_files = files.setdefault(part_value, [])
+        name = f"part-{len(part_files)}.parquet"
+        _write_part(fs, f"{base}/{partition_by}={part_value}", name, part_df, row_group_size)
+        part_files.append(name)
+
+        for ticker, bounds in _ticker_bounds(part_df, part_value).items():
+            if ticker in tickers:
+                bounds["first_date"] = tickers[ticker]["first_date"]
+            tickers[ticker] = bounds
+
+    _write_index(fs, base, {"partition_by": partition_by, "tickers": tickers, "files": files})
+    _INDEX_CACHE.pop(root, None)
+    return len(long_df)
+
+
+def _write_part(fs: pafs.FileSystem, part_dir: str, name: str, part_df: pd.DataFrame, row_group_size: int):
+    fs.create_dir(part_dir, recursive=True)
+    table = pa.Table.from_pandas(
+        part_df[["ticker", "date", "close"]], preserve_index=False
+    ).replace_schema_metadata(None)
+    with fs.open_output_stream(f"{part_dir}/{name}") as sink:
+        pq.write_table(
+            table,
+            sink,
+            row_group_size=row_group_size,
+            data_page_size=DEFAULT_DATA_PAGE_SIZE,
+            write_statistics=True,
+            write_page_index=True,
+            compression="zstd"
+        )
+
+
+def _ticker_bounds(part_df: pd.DataFrame, partition: str) -> Dict[str, Dict[str, str]]:
+    bounds = part_df.groupby("ticker")["date"].agg(["min", "max"])
+    return {
+        ticker: {
+            "partition": partition,
+            "first_date": row["min"].strftime("%Y-%m-%d"),
+            "last_date": row["max"].strftime("%Y-%m-%d")
+        }
+        for ticker, row in bounds.iterrows()
+    }
+
+
+def _write_index(fs: pafs.FileSystem, base: str, index: dict):
+    # Write then move so readers never load a half-written index
+    tmp_path = f"{base}/{INDEX_FILE}.tmp"
+    with fs.open_output_stream(tmp_path) as sink:
+        sink.write(json.dumps(index).encode())
+    fs.move(tmp_path, f"{base}/{INDEX_FILE}")
+
+
+# ------------------ reader ------------------
+_INDEX_CACHE: Dict[str, Tuple[tuple, dict]] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def load_dataset_index(root: str, refresh: bool = False) -> dict:
+    """
+    Load (and cache) the ``_index.json`` mapping tickers to partitions.
+
+    The cached index is reused only while the file's modification time and
+    size are unchanged, so appends written by another process (the nightly
+    refresh) are picked up on the next read.
+    """
+    fs, base = _resolve(root)
+    path = f"{base}/{INDEX_FILE}"
+    info = fs.get_file_info(path)
+    stamp = (info.mtime_ns, info.size)
+    with _INDEX_LOCK:
+        cached = _INDEX_CACHE.get(root)
+        if not refresh and cached is not None and cached[0] == stamp:
+            return cached[1]
+    with fs.open_input_stream(path) as source:
+        index = json.loads(source.read())
+    with _INDEX_LOCK:
+        _INDEX_CACHE[root] = (stamp, index)
+    return index
+
+
+def read_long_pricing(
+    root: str,
+    tickers: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> pa.Table:
+    """
+    Read ``(ticker, date, close)`` rows for ``tickers`` between two dates (inclusive).
+
+    Only the partitions holding the tickers are opened, and row groups whose
+    ticker/date statistics cannot match are skipped.
+
+    Raises:
+        ValueError: If any ticker is not in the dataset.
+    """
+    dataset, expr = _open_long(root, tickers, start_date, end_date)
+    return dataset.to_table(columns=["ticker", "date", "close"], filter=expr)
+
+
+def _open_long(
+    root: str,
+    tickers: List[str],
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> Tuple[ds.Dataset, pc.Expression]:
+    """Dataset over the partitions holding ``tickers`` (files in append order) and the row filter."""
+    index = load_dataset_index(root)
+    missing = [t for t in tickers if t not in index["tickers"]]
+    if missing:
+        raise ValueError(f"Tickers not found in pricing dataset {root}: {missing}")
+
+    partition_by = index["partition_by"]
+    partitions = sorted({index["tickers"][t]["partition"] for t in tickers})
+
+    fs, base = _resolve(root)
+    part_files = index.get("files", {})
+    files = [
+        f"{base}/{partition_by}={p}/{name}"
+        for p in partitions
+        for name in part_files.get(p, ["part-0.parquet"])
+    ]
+    dataset = ds.dataset(files, filesystem=fs, format="parquet")
+
+    date_type = dataset.schema.field("date").type
+    expr = pc.field("ticker").isin(tickers)
+    if start_date:
+        expr = expr & (pc.field("date") >= pa.scalar(pd.Timestamp(start_date), type=date_type))
+    if end_date:
+        expr = expr & (pc.field("date") <= pa.scalar(pd.Timestamp(end_date), type=date_type))
+    return dataset, expr
+
+
+def read_wide_pricing(
+    root: str,
+    tickers: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> pa.Table:
+    """
+    Same as :func:`read_long_pricing` but pivoted to the wide ``['date'] + tickers`` shape
+    the existing pricing endpoints return. Dates missing for a ticker become NaN.
+    """
+    long_table = read_long_pricing(root, tickers, start_date, end_date)
+    wide = (
+        long_table.to_pandas()
+        .pivot(index="date", columns="ticker", values="close")
+        .reindex(columns=tickers)
+        .sort_index()
+        .reset_index()
+    )
+    wide.columns.name = None
+    return pa.Table.from_pandas(wide, preserve_index=False)
+
+
+def iter_wide_pricing(
+    root: str,
+    tickers: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_rows: int = 1024
+) -> Iterator[pa.Table]:
+    """
+    Stream :func:`read_wide_pricing`'s result as tables of at most ``batch_rows`` dates.
+
+    Each ticker is scanned separately with ``Dataset.to_batches`` (rows come
+    back in date order: files are listed in append order and sorted by ticker,
+    date), and the scans are merged by date. A block of dates is emitted once
+    every unfinished ticker has been read past it, so memory stays bounded by
+    about one batch per ticker instead of the whole window.
+
+    Raises:
+        ValueError: If any ticker is not in the dataset.
+    """
+    dataset, expr = _open_long(root, tickers, start_date, end_date)
+    scans = {
+        t: dataset.to_batches(columns=["date", "close"], filter=expr & (pc.field("ticker") == t),
+                              batch_size=batch_rows)
+        for t in tickers
+    }
+    buffers = {t: pd.Series(dtype="float64") for t in tickers}
+
+    while scans or any(len(b) for b in buffers.values()):
+        # Top up every unfinished ticker whose buffer ran dry
+        for t in list(scans):
+            while not len(buffers[t]):
+                batch = next(scans[t], None)
+                if batch is None:
+                    del scans[t]
+                    break
+                if batch.num_rows:
+                    buffers[t] = batch.to_pandas().set_index("date")["close"]
+        # Dates up to the earliest last-read date of unfinished tickers are complete
+        cutoff = min((buffers[t].index[-1] for t in scans), default=None)
+        block = {t: (b if cutoff is None else b.loc[:cutoff]) for t, b in buffers.items()}
+        buffers = {t: b.iloc[len(block[t]):] for t, b in buffers.items()}
+        wide = pd.DataFrame(block).reindex(columns=tickers).sort_index().rename_axis("date").reset_index()
+        for lo in range(0, len(wide), batch_rows):
+            yield pa.Table.from_pandas(wide.iloc[lo:lo + batch_rows], preserve_index=False)
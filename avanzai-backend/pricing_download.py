@@ -0,0 +1,233 @@
+"""
+pricing_download.py
+
+Full-history pricing download for a whole universe, split into chunks.
+
+The universe is cut into fixed-size ticker chunks which are fetched
+concurrently on a bounded worker pool, each retried with exponential backoff.
+Every finished chunk is written straight to its own parquet file under a work
+directory (named after a hash of its tickers, one row group per calendar
+year) and dropped from memory, so download memory is bounded by
+``max_workers`` chunks. Rerunning with the same universe skips chunks whose
+file already exists, so a failed run resumes where it stopped. Once every
+chunk is on disk they are assembled into the wide ``date`` +
+one-column-per-ticker file the API reads, one block of ``row_group_size``
+dates at a time: each block reads only the matching rows of every chunk file
+and is written as one row group, so assembly memory is bounded by a block
+across the universe rather than the whole history.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pricing_refresh import PriceSource, YFinanceSource
+
+DEFAULT_CHUNK_SIZE = 50
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 2.0
+DEFAULT_WIDE_ROW_GROUP_SIZE = 256   # ~1 year of trading days per row group for date pruning
+
+
+class ChunkDownloadError(Exception):
+    """One or more universe chunks could not be downloaded after retrying."""
+
+    def __init__(self, failures: List[Dict[str, object]]):
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} pricing chunk(s) failed; rerun to resume the remaining chunks"
+        )
+
+
+@dataclass
+class DownloadResult:
+    """Summary of one chunked universe download."""
+    work_dir: str
+    chunks_total: int = 0
+    chunks_downloaded: int = 0
+    chunks_resumed: int = 0
+    failures: List[Dict[str, object]] = field(default_factory=list)
+
+
+def chunk_tickers(tickers: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[List[str]]:
+    """Split ``tickers`` (deduplicated, order kept) into chunks of at most ``chunk_size``."""
+    unique = list(dict.fromkeys(tickers))
+    return [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+
+
+def chunk_path(work_dir: Union[str, Path], tickers: List[str], start: str) -> Path:
+    """
+    Stable file name for a chunk, so a rerun with the same universe and start finds it.
+
+    The end date is deliberately not part of the name: a run resumed the next
+    day reuses the chunks that already finished.
+    """
+    digest = hashlib.sha1("|".join([start] + tickers).encode()).hexdigest()[:16]
+    return Path(work_dir) / f"chunk-{digest}.parquet"
+
+
+def fetch_with_retries(
+    source: PriceSource,
+    tickers: List[str],
+    start: str,
+    end: str,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff: float = DEFAULT_BACKOFF_SECONDS
+) -> pd.DataFrame:
+    """
+    Call ``source.fetch_closes`` retrying failures with exponential backoff.
+
+    A result without a single close for any of ``tickers`` counts as a failure.
+
+    Raises:
+        The last error once ``max_retries`` retries are exhausted.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            closes = source.fetch_closes(tickers, start, end)
+            if closes.reindex(columns=tickers).isna().all().all():
+                raise ValueError(f"No prices returned for any of {len(tickers)} tickers")
+            return closes
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"Chunk of {len(tickers)} tickers failed ({str(e)}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _write_chunk(closes: pd.DataFrame, tickers: List[str], path: Path):
+    closes = closes.reindex(columns=tickers).astype(np.float64)
+    closes.index = pd.to_datetime(closes.index).tz_localize(None)
+    closes = closes.sort_index()
+    table = pa.Table.from_pandas(closes.rename_axis('date').reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata(None)
+    # One row group per year so assembly can read a date block without decoding the whole chunk
+    years = closes.index.year.to_numpy()
+    bounds = np.flatnonzero(np.diff(years)) + 1
+    # Write then rename: a chunk file only exists once it is complete
+    tmp_path = path.with_suffix('.tmp')
+    with pq.ParquetWriter(tmp_path, table.schema) as writer:
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(years)]):
+            writer.write_table(table.slice(lo, hi - lo))
+    os.replace(tmp_path, path)
+
+
+def download_universe_chunks(
+    tickers: List[str],
+    work_dir: Union[str, Path],
+    source: Optional[PriceSource] = None,
+    start: str = '2010-01-01',
+    end: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff: float = DEFAULT_BACKOFF_SECONDS
+) -> DownloadResult:
+    """
+    Download closes for ``tickers`` chunk by chunk into ``work_dir``.
+
+    Chunks already present in ``work_dir`` are skipped. Failed chunks are
+    reported on the result (not raised) so the caller decides whether to
+    assemble a partial universe or rerun.
+
+    Parameters:
+        tickers: Universe tickers.
+        work_dir: Directory holding one parquet file per finished chunk.
+        source: Price source; defaults to :class:`pricing_refresh.YFinanceSource`.
+        start: History start date (YYYY-MM-DD).
+        end: Exclusive end date; defaults to today.
+        chunk_size: Tickers per chunk.
+        max_workers: Chunks fetched concurrently.
+        max_retries: Retries per chunk before it is reported as failed.
+        backoff: Initial retry delay in seconds, doubled on every retry.
+
+    Returns:
+        A :class:`DownloadResult`.
+    """
+    source = source or YFinanceSource()
+    end = end or datetime.now().strftime('%Y-%m-%d')
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    chunks = chunk_tickers(tickers, chunk_size)
+    result = DownloadResult(work_dir=str(work_dir), chunks_total=len(chunks))
+    pending = []
+    for chunk in chunks:
+        if chunk_path(work_dir, chunk, start).exists():
+            result.chunks_resumed += 1
+        else:
+            pending.append(chunk)
+    print(f"Downloading {len(pending)} of {len(chunks)} pricing chunks ({result.chunks_resumed} already done)")
+
+    def run(chunk: List[str]):
+        closes = fetch_with_retries(source, chunk, start, end, max_retries, backoff)
+        _write_chunk(closes, chunk, chunk_path(work_dir, chunk, start))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pricing-download") as executor:
+        futures = {executor.submit(run, chunk): chunk for chunk in pending}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                future.result()
+                result.chunks_downloaded += 1
+            except Exception as e:
+                print(f"Error downloading chunk starting at {chunk[0]}: {str(e)}")
+                result.failures.append({"tickers": chunk, "error_type": type(e).__name__, "error": str(e)})
+    return result
+
+
+def assemble_wide_pricing(
+    tickers: List[str],
+    work_dir: Union[str, Path],
+    parquet_path: Union[str, Path],
+    start: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    row_group_size: int = DEFAULT_WIDE_ROW_GROUP_SIZE
+) -> int:
+    """
+    Join the chunk files for ``tickers`` on date and write the wide pricing file atomically.
+
+    The file is written one block of ``row_group_size`` dates at a time, so
+    only one block of the whole universe is in memory. Chunks that are missing
+    (failed downloads) are left out.
+
+    Returns:
+        The number of dates written.
+    """
+    paths = [chunk_path(work_dir, chunk, start) for chunk in chunk_tickers(tickers, chunk_size)]
+    paths = [path for path in paths if path.exists()]
+    columns = [name for path in paths for name in pq.read_schema(path).names if name != 'date']
+    dates = np.unique(np.concatenate(
+        [pq.read_table(path, columns=['date']).column('date').to_numpy() for path in paths]
+    )) if paths else np.array([], dtype='datetime64[ns]')
+    schema = pa.schema([pa.field('date', pa.timestamp('ns'))] + [pa.field(c, pa.float64()) for c in columns])
+
+    tmp_path = f"{parquet_path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema, write_statistics=True) as writer:
+        for lo in range(0, len(dates), row_group_size):
+            block = dates[lo:lo + row_group_size]
+            frames = [
+                pq.read_table(path, filters=[('date', '>=', block[0]), ('date', '<=', block[-1])])
+                .to_pandas().set_index('date')
+                for path in paths
+            ]
+            wide = pd.concat(frames, axis=1).reindex(index=pd.DatetimeIndex(block), columns=columns)
+            arrays = [pa.array(block, type=schema.field('date').type)] + [
+                pa.array(wide[c].to_numpy(dtype=np.float64), type=pa.float64()) for c in columns
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    os.replace(tmp_path, parquet_path)
+    return len(dates)
@@ -0,0 +1,202 @@
+"""
+pricing_encoding.py
+
+Fast, NaN-safe JSON encoding for pricing and result payloads.
+
+The columnar shape ``{"dates": [...], "series": {"AAPL": [...], ...}}`` is built
+straight from Arrow/NumPy arrays instead of one Python dict per date. NaN and
++/-inf are emitted as ``null`` without going through object dtype. ``orjson``
+and ``brotli`` are used when installed; otherwise the standard library
+``json``/``gzip`` fallbacks keep the same output.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import math
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+_ARROW_STREAM_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def table_to_columnar(table: pa.Table, date_column: str = "date") -> Dict[str, Any]:
+    """
+    Build the columnar payload from an Arrow table of ``date`` + one column per series.
+
+    Series values are NumPy arrays; :func:`dumps` maps their NaN/inf to null.
+    """
+    dates = table.column(date_column)
+    if pa.types.is_timestamp(dates.type) or pa.types.is_date(dates.type):
+        dates = pc.strftime(dates, format="%Y-%m-%d")
+    series = {
+        name: table.column(name).to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        for name in table.column_names
+        if name != date_column
+    }
+    return {"dates": dates.to_pylist(), "series": series}
+
+
+def frame_to_columnar(df: pd.DataFrame, date_column: str = "date") -> Dict[str, Any]:
+    """Same as :func:`table_to_columnar` for a pandas frame with a ``date`` column."""
+    dates = df[date_column]
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = dates.dt.strftime("%Y-%m-%d")
+    series = {
+        str(name): pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+        for name in df.columns
+        if name != date_column
+    }
+    return {"dates": dates.tolist(), "series": series}
+
+
+def iter_ndjson(batches: Iterable[pa.RecordBatch], date_column: str = "date") -> Iterator[bytes]:
+    """Yield one ``{"date": ..., ticker: value, ...}`` JSON line per row, a batch at a time."""
+    for batch in batches:
+        columnar = table_to_columnar(pa.Table.from_batches([batch]), date_column)
+        names = list(columnar["series"])
+        columns = [columnar["series"][name] for name in names]
+        lines = [
+            dumps({date_column: date, **dict(zip(names, (col[i] for col in columns)))})
+            for i, date in enumerate(columnar["dates"])
+        ]
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+
+def iter_columnar_chunks(batches: Iterable[pa.RecordBatch], date_column: str = "date") -> Iterator[bytes]:
+    """Yield one columnar JSON object (see :func:`table_to_columnar`) per batch, newline-delimited."""
+    for batch in batches:
+        yield dumps(table_to_columnar(pa.Table.from_batches([batch]), date_column)) + b"\n"
+
+
+def _json_safe(obj: Any) -> Any:
+    """Stdlib fallback: replace non-finite floats and arrays with JSON-safe values."""
+    if isinstance(obj, np.ndarray):
+        values = obj.astype(object)
+        if obj.dtype.kind == "f":
+            values[~np.isfinite(obj)] = None
+        return values.tolist()
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {str(k): _json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_safe(v) for v in obj]
+    return obj
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to JSON bytes, writing NaN/inf (Python or NumPy) as null."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            default=str
+        )
+    return json.dumps(_json_safe(obj), default=str, allow_nan=False).encode()
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an ``Accept-Encoding`` header.
+
+    Returns:
+        ``'br'`` (if brotli is installed), ``'gzip'``, or None.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for token in accept_encoding.split(","):
+        name, _, params = token.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0 or accepted.get("*", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Compress ``body`` with the negotiated ``encoding`` ('br', 'gzip' or None)."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def json_response(payload: Any, request: Optional[Request] = None, status_code: int = 200) -> Response:
+    """Encode ``payload`` with :func:`dumps` and compress it per the request's Accept-Encoding."""
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = None
+    if request is not None and len(body) >= MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def accepts_arrow(request: Optional[Request]) -> bool:
+    """True if the request's Accept header asks for an Arrow IPC stream."""
+    if request is None:
+        return False
+    return ARROW_STREAM_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def iter_arrow_stream(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """
+    Encode record batches as an Arrow IPC stream, yielding one message at a time.
+
+    The schema is taken from the first batch; an empty input yields nothing.
+    Batches must not contain dictionary-encoded columns (pricing data never does).
+    """
+    started = False
+    for batch in batches:
+        if not started:
+            yield batch.schema.serialize().to_pybytes()
+            started = True
+        yield batch.serialize().to_pybytes()
+    if started:
+        yield _ARROW_STREAM_EOS
+
+
+def table_to_arrow_stream(table: pa.Table, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """Serialize a whole table as an Arrow IPC stream, optionally tagging JSON ``metadata`` on the schema."""
+    if metadata is not None:
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"avanzai": dumps(metadata)
+        })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
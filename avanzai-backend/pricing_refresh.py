@@ -0,0 +1,305 @@
+"""
+pricing_refresh.py
+
+Incremental refresh of the wide az_pricing parquet file.
+
+Instead of re-downloading every ticker since 2010, the refresh reads the last
+stored close date per ticker and fetches only the missing tail (and the full
+history of tickers new to the universe) in batches. Parquet files cannot be
+appended to in place, so the wide file is still rewritten in full, one row
+group at a time (memory stays bounded by a row group) with the source file's
+row groups and compression kept; only row groups that need fetched data are
+patched, and the new dates land in their own row group. The new version is
+written next to the target and renamed over it, so readers see either the
+old file or the new one. The long-format dataset (``pricing_dataset``) is the
+store that is truly appended to: a refresh only adds a part file per
+partition.
+
+Prices come from a :class:`PriceSource`; :class:`YFinanceSource` is the
+production source and :class:`FramePriceSource` serves a local frame or
+parquet file as a stand-in.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pricing_dataset import append_long_pricing
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_HISTORY_START = '2010-01-01'
+
+
+# ------------------ price sources ------------------
+class PriceSource(Protocol):
+    """Anything that can return daily closes for a batch of tickers."""
+
+    def fetch_closes(self, tickers: List[str], start: str, end: str) -> pd.DataFrame:
+        """
+        Return closes for ``start <= date < end`` as a frame indexed by date
+        with one float column per ticker (tickers without data may be omitted).
+        """
+        ...
+
+
+class YFinanceSource:
+    """
+    Closes from Yahoo Finance via ``yfinance`` (imported on first use).
+
+    Tickers are fetched one by one with ``yf.Ticker(...).history``, which keeps
+    its state on the ``Ticker`` instance, so concurrent calls from a worker
+    pool are safe (``yf.download`` shares module-level state and is not).
+    """
+
+    def fetch_closes(self, tickers: List[str], start: str, end: str) -> pd.DataFrame:
+        import yfinance as yf
+
+        closes = {}
+        for ticker in tickers:
+            history = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
+            if not history.empty:
+                close = history['Close']
+                # Exchange-local timestamps -> naive trading dates, as ``yf.download`` returns
+                close.index = pd.DatetimeIndex(close.index).tz_localize(None).normalize()
+                closes[ticker] = close
+        return pd.DataFrame(closes).reindex(columns=tickers)
+
+
+class FramePriceSource:
+    """Serve closes from a wide ``date`` + ticker frame or parquet file (local stand-in for yfinance)."""
+
+    def __init__(self, prices: Union[pd.DataFrame, str, Path]):
+        if not isinstance(prices, pd.DataFrame):
+            prices = pd.read_parquet(prices)
+        if 'date' in prices.columns:
+            prices = prices.set_index('date')
+        prices.index = pd.to_datetime(prices.index)
+        self.prices = prices.sort_index()
+
+    def fetch_closes(self, tickers: List[str], start: str, end: str) -> pd.DataFrame:
+        window = self.prices.loc[(self.prices.index >= start) & (self.prices.index < end)]
+        return window[[t for t in tickers if t in window.columns]]
+
+
+# ------------------ refresh ------------------
+@dataclass
+class RefreshResult:
+    """Summary of one incremental refresh."""
+    parquet_path: str
+    new_tickers: List[str] = field(default_factory=list)
+    updated_tickers: int = 0
+    new_dates: int = 0
+    batches: int = 0
+    failed_batches: List[Dict[str, object]] = field(default_factory=list)
+    dataset_rows_appended: int = 0
+
+
+def last_close_dates(parquet_path: Union[str, Path]) -> Dict[str, pd.Timestamp]:
+    """
+    Return the last date with a finite close for every ticker column in a wide pricing file.
+
+    Tickers with no data at all are omitted.
+    """
+    table = pq.read_table(parquet_path)
+    dates = table.column('date').to_numpy()
+    last_dates = {}
+    for name in table.column_names:
+        if name == 'date':
+            continue
+        values = table.column(name).to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        valid = np.flatnonzero(np.isfinite(values))
+        if len(valid):
+            last_dates[name] = pd.Timestamp(dates[valid[-1]])
+    return last_dates
+
+
+def fetch_missing_closes(
+    source: PriceSource,
+    starts: Dict[str, str],
+    end: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    result: Optional[RefreshResult] = None
+) -> pd.DataFrame:
+    """
+    Fetch closes for each ticker from its own start date, batching tickers that share one.
+
+    A failing batch is recorded on ``result`` (when given) and skipped, so one
+    bad ticker does not abort the whole refresh.
+
+    Returns:
+        A date-indexed frame with one column per ticker that returned data.
+    """
+    by_start: Dict[str, List[str]] = {}
+    for ticker, start in starts.items():
+        if start < end:
+            by_start.setdefault(start, []).append(ticker)
+
+    frames = []
+    for start, tickers in sorted(by_start.items()):
+        for i in range(0, len(tickers), batch_size):
+            batch = tickers[i:i + batch_size]
+            if result is not None:
+                result.batches += 1
+            try:
+                closes = source.fetch_closes(batch, start, end)
+            except Exception as e:
+                print(f"Error fetching closes for {len(batch)} tickers from {start}: {str(e)}")
+                if result is not None:
+                    result.failed_batches.append({"start": start, "tickers": batch, "error": str(e)})
+                continue
+            closes = closes.dropna(how='all', axis=1)
+            if not closes.empty:
+                closes.index = pd.to_datetime(closes.index).tz_localize(None)
+                frames.append(closes.astype(np.float64))
+
+    if not frames:
+        return pd.DataFrame(dtype=np.float64)
+    # Batches are disjoint in tickers, so an outer join on date simply lines them up
+    return pd.concat(frames, axis=1).sort_index()
+
+
+def write_appended_snapshot(
+    parquet_path: Union[str, Path],
+    closes: pd.DataFrame,
+    out_path: Union[str, Path]
+) -> int:
+    """
+    Write ``parquet_path`` plus ``closes`` to ``out_path``.
+
+    The whole file is rewritten (Parquet has no in-place append), row group by
+    row group with the source's compression. Row groups are decoded and
+    re-encoded unchanged unless they need data: columns of new tickers are
+    added to every row group, existing tickers are gap-filled only in row
+    groups that reach their first fetched date, and dates after the last
+    stored one are written as a new row group at the end.
+
+    Returns:
+        The number of new dates appended.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    old_schema = parquet_file.schema_arrow.remove_metadata()
+    added = [c for c in closes.columns if c not in old_schema.names]
+    existing = [c for c in closes.columns if c in old_schema.names]
+    schema = pa.schema(list(old_schema) + [pa.field(c, pa.float64()) for c in added])
+    date_type = schema.field('date').type
+    fetched_existing = closes[existing].dropna(how='all').index
+    first_fetched = fetched_existing.min() if len(fetched_existing) else None
+
+    last_stored = None
+    with pq.ParquetWriter(out_path, schema, compression=_source_compression(parquet_file)) as writer:
+        for rg in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(rg)
+            rg_dates = pd.DatetimeIndex(table.column('date').to_numpy())
+            if len(rg_dates):
+                last_stored = rg_dates.max() if last_stored is None else max(last_stored, rg_dates.max())
+            overlaps = first_fetched is not None and len(rg_dates) and rg_dates.max() >= first_fetched
+            patch_columns = added + (existing if overlaps else [])
+            if patch_columns:
+                table = _patch_row_group(table, closes[patch_columns].reindex(rg_dates), schema)
+            writer.write_table(table)
+
+        tail = closes if last_stored is None else closes.loc[closes.index > last_stored]
+        if len(tail):
+            tail = tail.reindex(columns=schema.names[1:])
+            arrays = [pa.array(tail.index.to_numpy()).cast(date_type)] + [
+                pa.array(tail[c].to_numpy(dtype=np.float64), type=schema.field(c).type)
+                for c in schema.names[1:]
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    return len(tail)
+
+
+# Parquet codec names as reported in file metadata -> ParquetWriter ``compression``
+_CODECS = {'UNCOMPRESSED': 'none', 'LZ4_RAW': 'lz4', 'LZ4': 'lz4'}
+
+
+def _source_compression(parquet_file: pq.ParquetFile) -> str:
+    """Codec of the file's first column chunk (snappy for an empty file)."""
+    if parquet_file.metadata.num_row_groups == 0:
+        return 'snappy'
+    codec = parquet_file.metadata.row_group(0).column(0).compression
+    return _CODECS.get(codec, codec.lower())
+
+
+def _patch_row_group(table: pa.Table, patch: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Fill missing closes in one row group from ``patch`` (aligned by row) and add new ticker columns."""
+    arrays = [table.column('date')]
+    for name in schema.names[1:]:
+        new_values = patch[name].to_numpy(dtype=np.float64) if name in patch.columns else None
+        if name not in table.column_names:
+            arrays.append(pa.array(new_values, type=schema.field(name).type))
+            continue
+        column = table.column(name)
+        if new_values is None:
+            arrays.append(column)
+            continue
+        old_values = column.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        merged = np.where(np.isfinite(old_values), old_values, new_values)
+        arrays.append(pa.array(merged, type=schema.field(name).type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def refresh_pricing(
+    universe: pd.DataFrame,
+    parquet_path: Union[str, Path] = 'az_pricing_latest.parquet',
+    source: Optional[PriceSource] = None,
+    start: str = DEFAULT_HISTORY_START,
+    end: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dataset_root: Optional[str] = None
+) -> RefreshResult:
+    """
+    Bring a wide pricing parquet file up to date by fetching only what it is missing.
+
+    Parameters:
+        universe: Frame with a ``ticker`` column (and ``asset_class`` for the dataset).
+        parquet_path: Existing wide pricing file to refresh in place.
+        source: Where closes come from; defaults to :class:`YFinanceSource`.
+        start: History start for tickers not yet in the file.
+        end: Exclusive end date (YYYY-MM-DD); defaults to today.
+        batch_size: Tickers per source request.
+        dataset_root: If given, also append the new closes to the long-format dataset.
+
+    Returns:
+        A :class:`RefreshResult` describing what was fetched and written.
+    """
+    source = source or YFinanceSource()
+    end = end or datetime.now().strftime('%Y-%m-%d')
+    parquet_path = str(parquet_path)
+    result = RefreshResult(parquet_path=parquet_path)
+
+    last_dates = last_close_dates(parquet_path)
+    starts = {}
+    for ticker in universe['ticker'].drop_duplicates():
+        if ticker in last_dates:
+            starts[ticker] = (last_dates[ticker] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        else:
+            starts[ticker] = start
+            result.new_tickers.append(ticker)
+    print(f"Refreshing {len(starts)} tickers ({len(result.new_tickers)} new) up to {end}")
+
+    closes = fetch_missing_closes(source, starts, end, batch_size, result)
+    result.updated_tickers = len(closes.columns)
+    if closes.empty:
+        print("Pricing already up to date")
+        return result
+
+    # Write the new version next to the target and swap it in atomically
+    tmp_path = f"{parquet_path}.tmp"
+    result.new_dates = write_appended_snapshot(parquet_path, closes, tmp_path)
+    os.replace(tmp_path, parquet_path)
+
+    if dataset_root:
+        wide = closes.rename_axis('date').reset_index()
+        result.dataset_rows_appended = append_long_pricing(wide, dataset_root, universe=universe)
+
+    print(f"Refreshed {result.updated_tickers} tickers, {result.new_dates} new dates")
+    return result
@@ -0,0 +1,314 @@
+"""
+pricing_snapshot.py
+
+Process-wide in-memory cache of the az_pricing_*.parquet snapshots stored in S3.
+
+Each (bucket, key) is downloaded once and kept as an Arrow table; every pricing
+path serves column projections from it instead of re-reading the whole file per
+request. A background thread polls ``head_object`` and hot-swaps to a new
+snapshot when the ETag / LastModified changes. Requests that already hold the
+previous snapshot keep using it until they finish.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+import boto3
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_BUCKET = os.getenv('AWS_S3_BUCKET', 'avanzaidata')
+DEFAULT_REFRESH_SECONDS = int(os.getenv('PRICING_SNAPSHOT_REFRESH_SECONDS', '300'))
+
+
+def sorted_dates(table: pa.Table, date_column: str = 'date') -> Optional[np.ndarray]:
+    """
+    Return the date column as ``datetime64`` values if it is sorted ascending, else None.
+    """
+    dates = table.column(date_column).to_numpy()
+    if len(dates) > 1 and not (dates[1:] >= dates[:-1]).all():
+        return None
+    return dates
+
+
+def slice_date_range(
+    table: pa.Table,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    dates: Optional[np.ndarray] = None,
+    date_column: str = 'date'
+) -> pa.Table:
+    """
+    Restrict ``table`` to ``start_date <= date <= end_date`` (both inclusive, optional).
+
+    A sorted date column is cut with a binary search and a zero-copy slice;
+    an unsorted one falls back to a boolean filter.
+
+    Parameters:
+        dates: Precomputed output of :func:`sorted_dates` for ``table``, if available.
+    """
+    if not start_date and not end_date:
+        return table
+    if dates is None:
+        dates = sorted_dates(table, date_column)
+    if dates is None:
+        values = table.column(date_column).to_numpy()
+        mask = np.ones(len(values), dtype=bool)
+        if start_date:
+            mask &= values >= np.datetime64(start_date)
+        if end_date:
+            mask &= values < np.datetime64(end_date) + np.timedelta64(1, 'D')
+        return table.filter(pa.array(mask))
+
+    lo = np.searchsorted(dates, np.datetime64(start_date), side='left') if start_date else 0
+    hi = (np.searchsorted(dates, np.datetime64(end_date) + np.timedelta64(1, 'D'), side='left')
+          if end_date else len(dates))
+    return table.slice(lo, max(0, hi - lo))
+
+
+def create_s3_client():
+    """
+    Create an S3 client from the standard AWS environment variables.
+
+    ``AWS_S3_ENDPOINT_URL`` points the client at a local S3 stand-in (e.g. MinIO).
+    """
+    return boto3.client('s3',
+                        region_name='us-east-1',
+                        endpoint_url=os.getenv('AWS_S3_ENDPOINT_URL') or None,
+                        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'))
+
+
+@dataclass(frozen=True)
+class PricingSnapshot:
+    """One immutable, fully decoded version of a pricing parquet file."""
+    bucket: str
+    key: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    table: pa.Table
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def version(self) -> str:
+        """Identifier that changes whenever the underlying S3 object changes."""
+        return (self.etag or self.last_modified or str(self.loaded_at)).strip('"')
+
+    @cached_property
+    def dates(self) -> Optional[np.ndarray]:
+        """Sorted ``date`` values used for binary-search date slicing (None if unsorted)."""
+        return sorted_dates(self.table)
+
+    def select(
+        self,
+        columns: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> pa.Table:
+        """
+        Project the snapshot onto ``columns`` (and a date window) without copying column data.
+
+        Raises:
+            ValueError: If any requested column is missing from the snapshot.
+        """
+        missing = [c for c in columns if c not in self.table.column_names]
+        if missing:
+            raise ValueError(f"Columns not found in {self.key}: {missing}")
+        table = slice_date_range(self.table, start_date, end_date, dates=self.dates)
+        return table.select(columns)
+
+
+class PricingSnapshotCache:
+    """Download-once cache of a single pricing parquet object with background refresh."""
+
+    def __init__(
+        self,
+        key: str,
+        bucket: str = DEFAULT_BUCKET,
+        client_factory: Callable = create_s3_client,
+        refresh_interval: int = DEFAULT_REFRESH_SECONDS
+    ):
+        self.key = key
+        self.bucket = bucket
+        self.refresh_interval = refresh_interval
+        self._client_factory = client_factory
+        self._client = None
+        self._snapshot: Optional[PricingSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def is_loaded(self) -> bool:
+        """True once a snapshot has been downloaded and can be served from memory."""
+        return self._snapshot is not None
+
+    def get(self) -> PricingSnapshot:
+        """Return the current snapshot, downloading it on first use."""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        loaded = None
+        with self._load_lock:
+            # Another request may have finished the download while we waited
+            if self._snapshot is None:
+                self._snapshot = loaded = self._download()
+            snapshot = self._snapshot
+        if loaded is not None:
+            _notify_loaded(loaded)
+        return snapshot
+
+    def select(
+        self,
+        columns: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> pa.Table:
+        """Project the current snapshot onto ``columns`` and an optional date window."""
+        return self.get().select(columns, start_date, end_date)
+
+    def refresh(self) -> bool:
+        """
+        Reload the snapshot if the S3 object changed since it was downloaded.
+
+        Returns:
+            True if a new snapshot was swapped in.
+        """
+        current = self._snapshot
+        if current is None:
+            self.get()
+            return True
+
+        head = self.client.head_object(Bucket=self.bucket, Key=self.key)
+        etag = head.get('ETag')
+        last_modified = str(head.get('LastModified')) if head.get('LastModified') else None
+        if etag == current.etag and last_modified == current.last_modified:
+            return False
+
+        with self._load_lock:
+            new_snapshot = self._download()
+            # Plain attribute swap: in-flight readers keep their reference to the old table
+            self._snapshot = new_snapshot
+        print(f"Pricing snapshot {self.key} refreshed to version {new_snapshot.version}")
+        _notify_loaded(new_snapshot)
+        return True
+
+    def start(self):
+        """Start the background thread that warms the cache and polls ETag/LastModified."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop,
+            name=f"pricing-snapshot-{self.key}",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the snapshot we have; try again next interval
+                print(f"Error refreshing pricing snapshot {self.key}: {str(e)}")
+            self._stop.wait(self.refresh_interval)
+
+    def _download(self) -> PricingSnapshot:
+        print(f"Downloading pricing snapshot from S3: {self.key}")
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key)
+        table = pq.read_table(BytesIO(response['Body'].read()))
+        last_modified = response.get('LastModified')
+        return PricingSnapshot(
+            bucket=self.bucket,
+            key=self.key,
+            etag=response.get('ETag'),
+            last_modified=str(last_modified) if last_modified else None,
+            table=table
+        )
+
+
+# ------------------ load listeners ------------------
+_LOAD_LISTENERS: List[Callable[[PricingSnapshot], None]] = []
+
+
+def add_snapshot_listener(listener: Callable[[PricingSnapshot], None]):
+    """Call ``listener(snapshot)`` whenever a snapshot version is downloaded (first load or refresh)."""
+    if listener not in _LOAD_LISTENERS:
+        _LOAD_LISTENERS.append(listener)
+
+
+def _notify_loaded(snapshot: PricingSnapshot):
+    for listener in list(_LOAD_LISTENERS):
+        try:
+            listener(snapshot)
+        except Exception as e:
+            print(f"Error in pricing snapshot listener for {snapshot.key}: {str(e)}")
+
+
+# ------------------ process-wide registry ------------------
+_CACHES: Dict[Tuple[str, str], PricingSnapshotCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_snapshot_cache(key: str, bucket: str = DEFAULT_BUCKET) -> PricingSnapshotCache:
+    """Return the shared cache for ``bucket/key``, creating it on first use."""
+    with _CACHES_LOCK:
+        cache = _CACHES.get((bucket, key))
+        if cache is None:
+            cache = PricingSnapshotCache(key=key, bucket=bucket)
+            _CACHES[(bucket, key)] = cache
+        return cache
+
+
+def peek_snapshot_cache(key: str, bucket: str = DEFAULT_BUCKET) -> Optional[PricingSnapshotCache]:
+    """Return the shared cache for ``bucket/key`` if one exists, without creating it."""
+    with _CACHES_LOCK:
+        return _CACHES.get((bucket, key))
+
+
+def drop_snapshot_cache(key: str, bucket: str = DEFAULT_BUCKET):
+    """Stop and forget the cache for ``bucket/key`` so its table can be freed."""
+    with _CACHES_LOCK:
+        cache = _CACHES.pop((bucket, key), None)
+    if cache is not None:
+        cache.stop()
+
+
+def read_snapshot_columns(
+    key: str,
+    columns: List[str],
+    bucket: str = DEFAULT_BUCKET,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> pa.Table:
+    """Convenience wrapper: project ``columns`` out of the cached ``bucket/key`` snapshot."""
+    return get_snapshot_cache(key, bucket).select(columns, start_date, end_date)
+
+
+def stop_all_snapshot_refreshers():
+    """Stop every background refresh thread (called on application shutdown)."""
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    for cache in caches:
+        cache.stop()
@@ -0,0 +1,207 @@
+"""
+returns_engine.py
+
+Vectorized returns for a date-by-ticker price matrix.
+
+Daily, log and cumulative returns, period return, annualized volatility and
+max drawdown are computed for every ticker at once with NumPy, so the whole
+universe costs about as much as one ticker did with the per-record loop.
+
+Missing, non-numeric and non-positive prices are treated as gaps: the
+return on the next valid day is measured against the last valid price, and
+statistics skip the gap instead of counting it as a zero return.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+@dataclass(frozen=True)
+class PriceMatrix:
+    """
+    Prices as a ``(dates, tickers)`` float matrix with sorted, day-resolution dates.
+
+    ``daily`` optionally carries precomputed daily simple returns aligned with
+    ``values`` (e.g. from ``returns_store``); returns-based transforms use it
+    instead of recomputing returns from the prices.
+    """
+    dates: np.ndarray
+    tickers: List[str]
+    values: np.ndarray
+    daily: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, tickers: Optional[List[str]] = None) -> "PriceMatrix":
+        """
+        Build from a frame with a ``date`` column (or a date index) and one column per ticker.
+
+        Raises:
+            KeyError: If a requested ticker has no column.
+        """
+        if 'date' in df.columns:
+            df = df.set_index('date')
+        tickers = list(df.columns) if tickers is None else list(tickers)
+        missing = [t for t in tickers if t not in df.columns]
+        if missing:
+            raise KeyError(f"Tickers not in price data: {missing}")
+        dates = pd.to_datetime(df.index, errors='coerce').values.astype('datetime64[D]')
+        values = df[tickers].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        # Unparseable dates are dropped, then rows are put in date order
+        keep = ~np.isnat(dates)
+        dates, values = dates[keep], values[keep]
+        order = np.argsort(dates, kind='stable')
+        return cls(dates=dates[order], tickers=tickers, values=values[order])
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], tickers: Optional[List[str]] = None) -> "PriceMatrix":
+        """Build from per-date records such as ``{"date": "2024-01-02", "AAPL": 185.6, ...}``."""
+        return cls.from_frame(pd.DataFrame.from_records(records), tickers)
+
+    def window(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> "PriceMatrix":
+        """Rows with ``start_date <= date <= end_date`` (both inclusive, either optional)."""
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, 'D'), 'left') if start_date else 0
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, 'D'), 'right') if end_date else len(self.dates)
+        daily = self.daily[lo:hi] if self.daily is not None else None
+        return PriceMatrix(dates=self.dates[lo:hi], tickers=self.tickers, values=self.values[lo:hi], daily=daily)
+
+    def daily_returns(self) -> np.ndarray:
+        """Daily simple returns: the precomputed ``daily`` if attached, else computed from the prices."""
+        return self.daily if self.daily is not None else compute_returns(self).daily
+
+
+@dataclass(frozen=True)
+class ReturnsResult:
+    """Per-day series are ``(dates, tickers)`` matrices; statistics are one value per ticker."""
+    dates: np.ndarray
+    tickers: List[str]
+    valid: np.ndarray
+    daily: np.ndarray
+    log: np.ndarray
+    cumulative: np.ndarray
+    period_return: np.ndarray
+    annualized_volatility: np.ndarray
+    max_drawdown: np.ndarray
+    observations: np.ndarray
+
+    def column(self, ticker: str) -> int:
+        try:
+            return self.tickers.index(ticker)
+        except ValueError:
+            raise KeyError(f"Ticker not in returns result: {ticker}")
+
+    def summary(self) -> pd.DataFrame:
+        """One row of statistics per ticker."""
+        return pd.DataFrame({
+            "period_return": self.period_return,
+            "annualized_volatility": self.annualized_volatility,
+            "max_drawdown": self.max_drawdown,
+            "observations": self.observations
+        }, index=pd.Index(self.tickers, name="ticker"))
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value of each column forward (leading NaNs stay NaN)."""
+    valid = ~np.isnan(values)
+    rows = np.where(valid, np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    # Rows before a column's first valid value index row 0, which is NaN for that column
+    return values[rows, np.arange(values.shape[1])]
+
+
+def compute_returns(matrix: PriceMatrix, periods_per_year: int = TRADING_DAYS_PER_YEAR) -> ReturnsResult:
+    """
+    Compute returns and risk statistics for every ticker of ``matrix`` in one pass.
+
+    Raises:
+        ValueError: If ``matrix`` has no rows (e.g. a date window outside the data).
+    """
+    if len(matrix.dates) == 0:
+        raise ValueError("Insufficient data after filtering.")
+    values = np.where(matrix.values > 0, matrix.values, np.nan)
+    valid = ~np.isnan(values)
+    filled = forward_fill(values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Price over the last valid price before it; NaN on gap days and the first row
+        ratio = np.full_like(values, np.nan)
+        np.divide(values[1:], filled[:-1], out=ratio[1:])
+        daily = ratio - 1
+        log = np.log(ratio)
+
+        # First valid price per ticker anchors the cumulative series
+        observations = valid.sum(axis=0)
+        first_row = np.argmax(valid, axis=0)
+        base = values[first_row, np.arange(values.shape[1])]
+        cumulative = filled / base - 1
+        period_return = cumulative[-1] if len(cumulative) else np.full(len(matrix.tickers), np.nan)
+
+        # Sample standard deviation from sums (several times faster than nanstd)
+        has_return = ~np.isnan(daily)
+        returns_count = has_return.sum(axis=0)
+        zeroed = np.where(has_return, daily, 0.0)
+        total = zeroed.sum(axis=0)
+        variance = ((zeroed * zeroed).sum(axis=0) - total * total / returns_count) / (returns_count - 1)
+        volatility = np.where(returns_count > 1, np.sqrt(np.maximum(variance, 0.0) * periods_per_year), np.nan)
+
+        running_max = np.fmax.accumulate(filled, axis=0)
+        drawdown = filled / running_max - 1
+        max_drawdown = np.full(len(matrix.tickers), np.nan)
+        has_prices = observations > 0
+        if has_prices.any():
+            max_drawdown[has_prices] = np.nanmin(drawdown[:, has_prices], axis=0)
+
+    period_return = np.where(observations > 1, period_return, np.nan)
+    return ReturnsResult(
+        dates=matrix.dates,
+        tickers=matrix.tickers,
+        valid=valid,
+        daily=daily,
+        log=log,
+        cumulative=cumulative,
+        period_return=period_return,
+        annualized_volatility=volatility,
+        max_drawdown=max_drawdown,
+        observations=observations
+    )
+
+
+def _optional_float(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def performance_report(result: ReturnsResult, ticker: str) -> Dict[str, Any]:
+    """
+    Per-ticker performance payload (the shape ``/run_calc`` returns).
+
+    The cumulative series covers the ticker's valid price dates only.
+
+    Raises:
+        ValueError: If the ticker has fewer than two valid prices.
+    """
+    col = result.column(ticker)
+    rows = np.flatnonzero(result.valid[:, col])
+    if len(rows) < 2:
+        raise ValueError("Insufficient data after filtering.")
+
+    dates = np.datetime_as_string(result.dates[rows], unit='D')
+    cumulative = result.cumulative[rows, col]
+    series = [{'date': date, 'value': value} for date, value in zip(dates.tolist(), cumulative.tolist())]
+    return {
+        "ticker": ticker,
+        "period_start": str(dates[0]),
+        "period_end": str(dates[-1]),
+        "cumulative_performance": float(cumulative[-1]),
+        "log_return": float(np.nansum(result.log[rows, col])),
+        "annualized_volatility": _optional_float(result.annualized_volatility[col]),
+        "max_drawdown": _optional_float(result.max_drawdown[col]),
+        "cumulative_series": series,
+        "cumulative_series_length": len(series),
+        "calculated_at": datetime.now().isoformat()
+    }
@@ -0,0 +1,244 @@
+"""
+returns_store.py
+
+Daily returns materialized once per pricing snapshot version and memory-mapped
+into every worker.
+
+When a snapshot is loaded, its aligned simple and log daily returns, the
+valid-price mask, each ticker's first/last valid row and the running sum of
+log returns (the prefix index behind ``period_returns``) are computed with
+``returns_engine`` and written as ``.npy`` files to
+``<PRICING_RETURNS_DIR>/<snapshot id>/``. The directory is built under a
+temporary name and renamed into place, so workers either see a complete set
+or none. Workers open the files with ``mmap_mode='r'``: the OS page cache
+holds one copy shared by every process, and analytics start from ready
+returns instead of running ``pct_change`` over 15 years of prices per request.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pricing_snapshot import PricingSnapshot, add_snapshot_listener
+from returns_engine import PriceMatrix, compute_returns
+
+RETURNS_DIR = os.getenv('PRICING_RETURNS_DIR', './pricing_returns')
+# Materialized versions kept on disk (older ones are removed after a new one is written)
+KEEP_VERSIONS = int(os.getenv('PRICING_RETURNS_KEEP_VERSIONS', '3'))
+
+ARRAYS = ("dates", "simple", "log", "valid", "first_valid", "last_valid", "cumlog")
+# Bumped whenever ARRAYS changes, so older materializations are rebuilt
+FORMAT_VERSION = 2
+
+
+def snapshot_id(key: str, version: str) -> str:
+    """File-system safe identifier of one snapshot version."""
+    return hashlib.sha1(f"{key}@{version}#{FORMAT_VERSION}".encode()).hexdigest()[:16]
+
+
+@dataclass
+class SnapshotReturns:
+    """Memory-mapped returns of one snapshot: ``(dates, tickers)`` matrices plus per-ticker bounds."""
+    key: str
+    version: str
+    tickers: List[str]
+    dates: np.ndarray
+    simple: np.ndarray
+    log: np.ndarray
+    valid: np.ndarray
+    first_valid: np.ndarray
+    last_valid: np.ndarray
+    # cumlog[t] = log(last valid price at or before row t / first valid price); 0 before the first price
+    cumlog: np.ndarray
+
+    def __post_init__(self):
+        self._columns = {t: i for i, t in enumerate(self.tickers)}
+
+    def columns(self, tickers: List[str]) -> List[int]:
+        """
+        Raises:
+            KeyError: If a ticker is not in the snapshot.
+        """
+        missing = [t for t in tickers if t not in self._columns]
+        if missing:
+            raise KeyError(f"Tickers not in snapshot returns: {missing}")
+        return [self._columns[t] for t in tickers]
+
+    def rows(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> slice:
+        """Row slice for ``start_date <= date <= end_date`` (inclusive, either optional)."""
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, 'D'), 'left') if start_date else 0
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, 'D'), 'right') if end_date else len(self.dates)
+        return slice(int(lo), int(hi))
+
+    def aligned(self, dates: np.ndarray, tickers: List[str]) -> Optional[np.ndarray]:
+        """Daily simple returns of ``tickers`` on exactly ``dates`` (None if a date or ticker is not in the snapshot)."""
+        if any(t not in self._columns for t in tickers):
+            return None
+        rows = np.searchsorted(self.dates, dates)
+        if len(rows) and (rows.max() >= len(self.dates) or not np.array_equal(self.dates[rows], dates)):
+            return None
+        return self.simple[rows][:, self.columns(tickers)]
+
+    def frame(
+        self,
+        tickers: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        log: bool = False
+    ) -> pd.DataFrame:
+        """Daily simple (or log) returns of ``tickers`` as a date-indexed frame (NaN where there is no return)."""
+        rows = self.rows(start_date, end_date)
+        source = self.log if log else self.simple
+        values = source[rows][:, self.columns(tickers)]
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.dates[rows], name="date"), columns=tickers)
+
+
+def materialize_returns(snapshot: PricingSnapshot, root: str = RETURNS_DIR) -> Path:
+    """
+    Compute and store the returns of ``snapshot`` unless they already exist; return their directory.
+
+    Every column except ``date`` is treated as a ticker.
+    """
+    root_path = Path(root)
+    target = root_path / snapshot_id(snapshot.key, snapshot.version)
+    if (target / "meta.json").exists():
+        return target
+
+    table = snapshot.table
+    tickers = [c for c in table.column_names if c != 'date']
+    dates = pd.to_datetime(table.column('date').to_numpy()).values.astype('datetime64[D]')
+    values = np.empty((table.num_rows, len(tickers)), dtype=np.float64)
+    for i, ticker in enumerate(tickers):
+        values[:, i] = pd.to_numeric(table.column(ticker).to_pandas(), errors='coerce').to_numpy(dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    result = compute_returns(PriceMatrix(dates=dates[order], tickers=tickers, values=values[order]))
+
+    any_valid = result.valid.any(axis=0)
+    first_valid = np.where(any_valid, np.argmax(result.valid, axis=0), -1)
+    last_valid = np.where(any_valid, len(result.dates) - 1 - np.argmax(result.valid[::-1], axis=0), -1)
+
+    root_path.mkdir(parents=True, exist_ok=True)
+    tmp = root_path / f".{target.name}.{uuid.uuid4().hex[:8]}.tmp"
+    tmp.mkdir()
+    arrays = {
+        "dates": result.dates,
+        "simple": result.daily,
+        "log": result.log,
+        "valid": result.valid,
+        "first_valid": first_valid,
+        "last_valid": last_valid,
+        "cumlog": np.cumsum(np.nan_to_num(result.log, nan=0.0), axis=0)
+    }
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(array))
+    # meta.json is written last: its presence marks a complete directory
+    with open(tmp / "meta.json", 'w') as f:
+        json.dump({"key": snapshot.key, "version": snapshot.version, "tickers": tickers}, f)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # Another worker materialized the same version first
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"Materialized returns for {snapshot.key} version {snapshot.version}: "
+          f"{len(result.dates)} dates x {len(tickers)} tickers")
+    _prune(root_path, keep=target.name)
+    return target
+
+
+def _prune(root: Path, keep: str):
+    """Remove all but the ``KEEP_VERSIONS`` most recent materializations (never ``keep``)."""
+    complete = sorted(
+        (p for p in root.iterdir() if p.is_dir() and (p / "meta.json").exists()),
+        key=lambda p: (p / "meta.json").stat().st_mtime,
+        reverse=True
+    )
+    for path in complete[KEEP_VERSIONS:]:
+        if path.name != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# ------------------ per-process memory maps ------------------
+_LOADED: Dict[Tuple[str, str], SnapshotReturns] = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_returns(key: str, version: str, root: str = RETURNS_DIR) -> Optional[SnapshotReturns]:
+    """Memory-map the stored returns of a snapshot version (None if not materialized yet)."""
+    cache_key = (os.path.abspath(root), snapshot_id(key, version))
+    with _LOADED_LOCK:
+        loaded = _LOADED.get(cache_key)
+    if loaded is not None:
+        return loaded
+
+    path = Path(root) / cache_key[1]
+    if not (path / "meta.json").exists():
+        return None
+    with open(path / "meta.json", 'r') as f:
+        meta = json.load(f)
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode='r') for name in ARRAYS}
+    loaded = SnapshotReturns(key=meta["key"], version=meta["version"], tickers=meta["tickers"], **arrays)
+    with _LOADED_LOCK:
+        # Keep only the maps of the versions currently in use
+        for stale in [k for k, v in _LOADED.items() if v.key == key and k != cache_key]:
+            _LOADED.pop(stale)
+        _LOADED[cache_key] = loaded
+    return loaded
+
+
+def snapshot_returns(snapshot: PricingSnapshot, root: str = RETURNS_DIR) -> SnapshotReturns:
+    """Returns of ``snapshot``, materializing them first if no worker has yet."""
+    loaded = load_returns(snapshot.key, snapshot.version, root)
+    if loaded is None:
+        materialize_returns(snapshot, root)
+        loaded = load_returns(snapshot.key, snapshot.version, root)
+    return loaded
+
+
+# ------------------ materialization listeners ------------------
+_RETURNS_LISTENERS: List[Callable[[SnapshotReturns], None]] = []
+
+
+def add_returns_listener(listener: Callable[[SnapshotReturns], None]):
+    """Call ``listener(returns)`` once the returns of a newly loaded snapshot version are available."""
+    if listener not in _RETURNS_LISTENERS:
+        _RETURNS_LISTENERS.append(listener)
+
+
+def _notify_materialized(returns: SnapshotReturns):
+    for listener in list(_RETURNS_LISTENERS):
+        try:
+            listener(returns)
+        except Exception as e:
+            print(f"Error in returns listener for {returns.key}: {str(e)}")
+
+
+def _materialize_in_background(snapshot: PricingSnapshot):
+    threading.Thread(
+        target=lambda: _safe_materialize(snapshot),
+        name=f"returns-{snapshot.key}",
+        daemon=True
+    ).start()
+
+
+def _safe_materialize(snapshot: PricingSnapshot):
+    try:
+        returns = snapshot_returns(snapshot)
+    except Exception as e:
+        print(f"Error materializing returns for {snapshot.key}: {str(e)}")
+        return
+    _notify_materialized(returns)
+
+
+def enable_returns_materialization():
+    """Materialize returns in the background whenever a pricing snapshot version is loaded."""
+    add_snapshot_listener(_materialize_in_background)
@@ -0,0 +1,131 @@
+"""
+row_group_decoder.py
+
+Decode Parquet row groups in parallel on a bounded, process-wide thread pool.
+
+Arrow releases the GIL while fetching and decoding, so fanning row groups out
+over threads uses every core on cold multi-ticker loads. Results are always
+reassembled in row-group (i.e. date) order, and failures are collected into a
+single :class:`RowGroupDecodeError` instead of being printed and skipped.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+
+DECODE_WORKERS = int(os.getenv('PRICING_DECODE_WORKERS', str(min(16, os.cpu_count() or 4))))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+class RowGroupDecodeError(Exception):
+    """One or more row groups failed to decode."""
+
+    def __init__(self, source: str, failures: List[Dict[str, object]]):
+        self.source = source
+        self.failures = failures
+        groups = ", ".join(str(f["row_group"]) for f in failures)
+        super().__init__(f"Failed to decode row group(s) {groups} of {source}")
+
+    def to_dict(self) -> Dict[str, object]:
+        """Structured form suitable for an HTTP error body."""
+        return {"message": str(self), "source": self.source, "failures": self.failures}
+
+
+def get_decode_executor() -> ThreadPoolExecutor:
+    """Return the shared decode pool (created on first use, sized by ``PRICING_DECODE_WORKERS``)."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="rowgroup-decode")
+        return _EXECUTOR
+
+
+def _failure(row_group: int, error: BaseException) -> Dict[str, object]:
+    return {"row_group": row_group, "error_type": type(error).__name__, "error": str(error)}
+
+
+def decode_row_groups(
+    read_row_group: Callable[[int], pa.Table],
+    row_groups: List[int],
+    source: str = "parquet"
+) -> pa.Table:
+    """
+    Decode ``row_groups`` concurrently and concatenate them in the given order.
+
+    Parameters:
+        read_row_group: Thread-safe callable returning one row group as a table.
+        row_groups: Row group indices, in output order.
+        source: Name used in error reports.
+
+    Raises:
+        RowGroupDecodeError: If any row group failed; lists every failure.
+    """
+    if len(row_groups) == 1:
+        # Decoded inline (no pool hand-off), but failures are reported the same way
+        try:
+            tables = [read_row_group(row_groups[0])]
+        except Exception as e:
+            raise RowGroupDecodeError(source, [_failure(row_groups[0], e)]) from e
+    else:
+        executor = get_decode_executor()
+        futures = [(rg, executor.submit(read_row_group, rg)) for rg in row_groups]
+        tables, failures = [], []
+        for rg, future in futures:
+            try:
+                tables.append(future.result())
+            except Exception as e:
+                failures.append(_failure(rg, e))
+        if failures:
+            raise RowGroupDecodeError(source, failures)
+    return pa.concat_tables(tables) if tables else pa.table({})
+
+
+def iter_decode_row_groups(
+    read_row_group: Callable[[int], pa.Table],
+    row_groups: List[int],
+    source: str = "parquet",
+    window: Optional[int] = None
+) -> Iterator[pa.Table]:
+    """
+    Yield decoded row groups in order while keeping up to ``window`` decodes in flight.
+
+    Memory stays bounded by ``window`` row groups, which suits streaming responses.
+
+    Raises:
+        RowGroupDecodeError: On the first row group that fails (with its details).
+    """
+    executor = get_decode_executor()
+    window = window or DECODE_WORKERS
+    pending: deque = deque()
+    remaining = iter(row_groups)
+
+    def submit_next() -> bool:
+        rg = next(remaining, None)
+        if rg is None:
+            return False
+        pending.append((rg, executor.submit(read_row_group, rg)))
+        return True
+
+    for _ in range(window):
+        if not submit_next():
+            break
+    try:
+        while pending:
+            rg, future = pending.popleft()
+            try:
+                table = future.result()
+            except Exception as e:
+                raise RowGroupDecodeError(source, [_failure(rg, e)]) from e
+            submit_next()
+            yield table
+    finally:
+        # Consumer stopped early or a group failed: don't leave queued work behind
+        for _, future in pending:
+            future.cancel()
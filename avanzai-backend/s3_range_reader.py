@@ -0,0 +1,336 @@
+"""
+s3_range_reader.py
+
+Read column projections out of a Parquet object in S3 with HTTP Range GETs.
+
+Instead of downloading the whole wide pricing file, the reader fetches the
+footer once, caches the parsed ``FileMetaData`` together with the byte ranges
+of every column chunk, and then only requests the (coalesced) ranges that back
+the projected columns. Any client exposing boto3's ``head_object`` and
+``get_object(..., Range=...)`` works, so a local S3 stand-in (MinIO via
+``AWS_S3_ENDPOINT_URL``, moto, or a small in-process stub) can replace S3.
+"""
+from __future__ import annotations
+
+import bisect
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import numpy as np
+
+from pricing_snapshot import DEFAULT_BUCKET, create_s3_client, slice_date_range
+from row_group_decoder import decode_row_groups, iter_decode_row_groups
+
+FOOTER_TAIL_BYTES = 64 * 1024      # first guess at footer size; most footers fit
+COALESCE_GAP_BYTES = 8 * 1024      # merge ranges separated by less than this
+MAX_FETCH_WORKERS = 8
+
+
+def coalesce_ranges(ranges: List[Tuple[int, int]], gap: int = COALESCE_GAP_BYTES) -> List[Tuple[int, int]]:
+    """
+    Merge ``(start, length)`` byte ranges that overlap or sit within ``gap`` bytes.
+
+    Returns:
+        Sorted, non-overlapping ``(start, length)`` ranges.
+    """
+    merged: List[List[int]] = []
+    for start, length in sorted(ranges):
+        end = start + length
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end - start) for start, end in merged]
+
+
+class _SparseS3File(io.RawIOBase):
+    """
+    Seekable, read-only file over an S3 object backed by prefetched byte ranges.
+
+    Reads that fall outside the prefetched ranges trigger an extra Range GET,
+    so Arrow always sees a complete file.
+    """
+
+    def __init__(self, fetch: Callable[[int, int], bytes], size: int):
+        super().__init__()
+        self._fetch = fetch
+        self._size = size
+        self._pos = 0
+        self._starts: List[int] = []
+        self._chunks: List[bytes] = []
+
+    def add(self, start: int, data: bytes):
+        i = bisect.bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._chunks.insert(i, data)
+
+    def prefetch(self, ranges: List[Tuple[int, int]]):
+        """Fetch ``ranges`` (already coalesced) concurrently into the buffer."""
+        if not ranges:
+            return
+        with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(ranges))) as pool:
+            for (start, _), data in zip(ranges, pool.map(lambda r: self._fetch(*r), ranges)):
+                self.add(start, data)
+
+    def _lookup(self, start: int, length: int) -> Optional[bytes]:
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i < 0:
+            return None
+        chunk_start, chunk = self._starts[i], self._chunks[i]
+        if start + length <= chunk_start + len(chunk):
+            offset = start - chunk_start
+            return chunk[offset:offset + length]
+        return None
+
+    # io.RawIOBase interface -------------------------------------------------
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._size + offset
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._size - self._pos
+        size = max(0, min(size, self._size - self._pos))
+        if size == 0:
+            return b""
+        data = self._lookup(self._pos, size)
+        if data is None:
+            data = self._fetch(self._pos, size)
+            self.add(self._pos, data)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@dataclass(frozen=True)
+class _FooterIndex:
+    """Parsed footer plus the byte ranges of every column chunk, per ETag."""
+    etag: Optional[str]
+    size: int
+    metadata: pq.FileMetaData
+    footer: Tuple[int, bytes]
+    # column name -> [(row group, start, length), ...]
+    chunks: Dict[str, List[Tuple[int, int, int]]]
+    # per row group (min, max) of the date column from its statistics, None if unknown
+    date_bounds: List[Optional[Tuple[np.datetime64, np.datetime64]]]
+
+
+class S3RangeReader:
+    """Projected reads of a single S3 Parquet object using Range GETs."""
+
+    def __init__(
+        self,
+        key: str,
+        bucket: str = DEFAULT_BUCKET,
+        client_factory: Callable = create_s3_client,
+        coalesce_gap: int = COALESCE_GAP_BYTES
+    ):
+        self.key = key
+        self.bucket = bucket
+        self.coalesce_gap = coalesce_gap
+        self._client_factory = client_factory
+        self._client = None
+        self._index: Optional[_FooterIndex] = None
+        self._lock = threading.Lock()
+        self.bytes_fetched = 0
+        self.requests_made = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def fetch(self, start: int, length: int) -> bytes:
+        """Issue one Range GET for ``length`` bytes starting at ``start``."""
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={start}-{start + length - 1}"
+        )
+        data = response['Body'].read()
+        with self._lock:
+            self.bytes_fetched += len(data)
+            self.requests_made += 1
+        return data
+
+    def index(self, refresh: bool = False) -> _FooterIndex:
+        """Return the cached footer index, re-reading it when the ETag changed."""
+        index = self._index
+        if index is not None and not refresh:
+            return index
+
+        head = self.client.head_object(Bucket=self.bucket, Key=self.key)
+        etag = head.get('ETag')
+        if index is not None and index.etag == etag:
+            return index
+
+        size = int(head['ContentLength'])
+        tail_len = min(size, FOOTER_TAIL_BYTES)
+        tail = self.fetch(size - tail_len, tail_len)
+        if tail[-4:] != b"PAR1":
+            raise ValueError(f"{self.key} is not a Parquet file")
+        footer_len = int.from_bytes(tail[-8:-4], "little")
+        if footer_len + 8 > tail_len:
+            # Footer larger than our first guess: fetch the rest in front of it
+            extra = footer_len + 8 - tail_len
+            tail = self.fetch(size - tail_len - extra, extra) + tail
+        footer = (size - len(tail), tail)
+
+        sparse = _SparseS3File(self.fetch, size)
+        sparse.add(*footer)
+        metadata = pq.read_metadata(sparse)
+
+        chunks: Dict[str, List[Tuple[int, int, int]]] = {}
+        date_bounds: List[Optional[Tuple[np.datetime64, np.datetime64]]] = []
+        for rg in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg)
+            date_bounds.append(None)
+            for j in range(row_group.num_columns):
+                col = row_group.column(j)
+                if col.path_in_schema == 'date' and col.statistics is not None and col.statistics.has_min_max:
+                    date_bounds[rg] = (np.datetime64(col.statistics.min), np.datetime64(col.statistics.max))
+                start = col.data_page_offset
+                if col.has_dictionary_page and 0 < col.dictionary_page_offset < start:
+                    start = col.dictionary_page_offset
+                chunks.setdefault(col.path_in_schema, []).append((rg, start, col.total_compressed_size))
+
+        index = _FooterIndex(etag=etag, size=size, metadata=metadata, footer=footer, chunks=chunks,
+                             date_bounds=date_bounds)
+        self._index = index
+        return index
+
+    def row_groups_for_dates(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[int]:
+        """Row groups whose ``date`` statistics overlap ``[start_date, end_date]`` (inclusive)."""
+        index = self.index()
+        start = np.datetime64(start_date) if start_date else None
+        end = np.datetime64(end_date) + np.timedelta64(1, 'D') if end_date else None
+        row_groups = []
+        for rg, bounds in enumerate(index.date_bounds):
+            if bounds is not None:
+                rg_min, rg_max = bounds
+                if (start is not None and rg_max < start) or (end is not None and rg_min >= end):
+                    continue
+            row_groups.append(rg)
+        return row_groups
+
+    def read(
+        self,
+        columns: List[str],
+        row_groups: Optional[List[int]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> pa.Table:
+        """
+        Read ``columns`` (optionally restricted to ``row_groups``) fetching only their column chunks.
+
+        With a date window, row groups outside it are skipped using the
+        ``date`` column statistics and the remaining rows are cut to the window.
+        Row groups are fetched and decoded in parallel on the shared decode pool
+        and reassembled in file order.
+
+        Raises:
+            ValueError: If any requested column is missing from the file.
+            RowGroupDecodeError: If any row group failed to fetch or decode.
+        """
+        self._check_columns(columns)
+        if row_groups is None:
+            row_groups = self.row_groups_for_dates(start_date, end_date)
+        if not row_groups:
+            return self._read_row_groups(columns, [], start_date, end_date)
+        return decode_row_groups(
+            lambda rg: self._read_row_groups(columns, [rg], start_date, end_date),
+            row_groups,
+            source=self.key
+        )
+
+    def iter_row_groups(
+        self,
+        columns: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        window: Optional[int] = None
+    ):
+        """
+        Yield ``columns`` one row group at a time, in file order.
+
+        Up to ``window`` upcoming row groups (default: one per decode worker)
+        are fetched and decoded in the background while the current one is
+        consumed.
+        """
+        self._check_columns(columns)
+        yield from iter_decode_row_groups(
+            lambda rg: self._read_row_groups(columns, [rg], start_date, end_date),
+            self.row_groups_for_dates(start_date, end_date),
+            source=self.key,
+            window=window
+        )
+
+    def _check_columns(self, columns: List[str]):
+        missing = [c for c in columns if c not in self.index().chunks]
+        if missing:
+            raise ValueError(f"Columns not found in {self.key}: {missing}")
+
+    def _read_row_groups(
+        self,
+        columns: List[str],
+        row_groups: List[int],
+        start_date: Optional[str],
+        end_date: Optional[str]
+    ) -> pa.Table:
+        index = self.index()
+        wanted = set(row_groups)
+        ranges = [
+            (start, length)
+            for column in columns
+            for rg, start, length in index.chunks[column]
+            if rg in wanted
+        ]
+        sparse = _SparseS3File(self.fetch, index.size)
+        sparse.add(*index.footer)
+        sparse.prefetch(coalesce_ranges(ranges, self.coalesce_gap))
+
+        parquet_file = pq.ParquetFile(sparse, metadata=index.metadata)
+        table = parquet_file.read_row_groups(row_groups, columns=columns)
+        if 'date' in columns:
+            table = slice_date_range(table, start_date, end_date)
+        return table
+
+
+# ------------------ process-wide registry ------------------
+_READERS: Dict[Tuple[str, str], S3RangeReader] = {}
+_READERS_LOCK = threading.Lock()
+
+
+def get_range_reader(key: str, bucket: str = DEFAULT_BUCKET) -> S3RangeReader:
+    """Return the shared range reader for ``bucket/key`` (footer cached across requests)."""
+    with _READERS_LOCK:
+        reader = _READERS.get((bucket, key))
+        if reader is None:
+            reader = S3RangeReader(key=key, bucket=bucket)
+            _READERS[(bucket, key)] = reader
+        return reader
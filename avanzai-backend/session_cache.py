@@ -0,0 +1,94 @@
+"""
+session_cache.py
+
+In-process LRU cache of decoded session DataFrames, bounded by bytes.
+
+Agent loops hit the same session's ``pricing_data.parquet`` several times a
+second; decoding it once and serving the frame from memory removes the
+repeated parse. Each entry carries a version stamp supplied by the caller
+(``SessionManager`` combines a per-file save counter with the file's mtime and
+size), so a frame is never served after ``save_dataframe`` replaced it, even
+when another worker process wrote the file.
+
+Cached frames are shared between callers and must be treated as read-only.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_MAX_BYTES = int(os.getenv('SESSION_FRAME_CACHE_BYTES', str(512 * 1024 ** 2)))
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Memory held by a frame, including its index and object (string) columns."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class SessionFrameCache:
+    """LRU cache of ``(session_id, data_type) -> DataFrame`` with a byte budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Hashable, pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str, data_type: str, version: Hashable) -> Optional[pd.DataFrame]:
+        """Return the cached frame if it was stored with ``version``; a stale entry is dropped."""
+        key = (str(session_id), data_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, session_id: str, data_type: str, version: Hashable, df: pd.DataFrame):
+        """Cache ``df`` under ``version``, evicting least recently used frames to stay within budget."""
+        key = (str(session_id), data_type)
+        size = frame_nbytes(df)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, df, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, session_id: str, data_type: Optional[str] = None):
+        """Drop one frame of a session, or all of them."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == str(session_id) and (data_type is None or key[1] == data_type):
+                    self._drop(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _drop(self, key: Tuple[str, str]):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
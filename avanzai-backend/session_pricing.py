@@ -0,0 +1,141 @@
+"""
+session_pricing.py
+
+Columnar, date-indexed pricing store for a session.
+
+Each ticker a session has looked at is kept as its own small parquet file
+(``date`` + one close column) under ``<session>/pricing/``. Adding a ticker
+writes only that ticker's column; reading several tickers is one vectorized
+outer join on date. This replaces the single ``pricing_data.json`` of
+per-date records, which had to be merged row by row and rewritten in full
+every time a ticker was added.
+
+New tickers are now referenced from the shared pricing snapshot instead of
+copied (see ``session_reference``); this store is still read for sessions
+that already hold columns.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORE_DIR = "pricing"
+LEGACY_FILE = "pricing_data.json"
+
+
+def _column_file_name(ticker: str) -> str:
+    # Tickers contain characters such as '^' and '=' but never path separators
+    return f"{ticker.replace('/', '_')}.parquet"
+
+
+class SessionPricingStore:
+    """Per-session store of pricing columns, one file per ticker."""
+
+    def __init__(self, session_path: Path):
+        self.session_path = Path(session_path)
+        self.path = self.session_path / STORE_DIR
+        self._migrate_legacy()
+
+    def tickers(self) -> List[str]:
+        """Tickers currently stored, in the order they were added."""
+        index = self._read_index()
+        return list(index)
+
+    def has(self, ticker: str) -> bool:
+        return ticker in self._read_index()
+
+    def add(self, table: pa.Table) -> List[Path]:
+        """
+        Persist the ticker columns of a ``date`` + tickers table that are not stored yet.
+
+        Columns already in the store are left untouched.
+
+        Returns:
+            The files that were written (new column files and the index), for
+            storage accounting.
+        """
+        index = self._read_index()
+        new_tickers = [c for c in table.column_names if c != 'date' and c not in index]
+        if not new_tickers:
+            return []
+
+        written = []
+        self.path.mkdir(parents=True, exist_ok=True)
+        for ticker in new_tickers:
+            file_name = _column_file_name(ticker)
+            tmp_path = self.path / f"{file_name}.tmp"
+            pq.write_table(table.select(['date', ticker]), tmp_path)
+            os.replace(tmp_path, self.path / file_name)
+            index[ticker] = file_name
+            written.append(self.path / file_name)
+        self._write_index(index)
+        return written + [self._index_path()]
+
+    def load(self, tickers: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Return a date-indexed frame with one column per ticker (all stored tickers by default).
+
+        Columns are outer-joined on date, so a date missing for one ticker is NaN there.
+
+        Raises:
+            KeyError: If a requested ticker is not in the store.
+        """
+        index = self._read_index()
+        tickers = list(index) if tickers is None else tickers
+        missing = [t for t in tickers if t not in index]
+        if missing:
+            raise KeyError(f"Tickers not in session pricing store: {missing}")
+
+        frames = [
+            pq.read_table(self.path / index[t]).to_pandas().set_index('date')
+            for t in tickers
+        ]
+        if not frames:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name='date'))
+        frame = pd.concat(frames, axis=1, join='outer').sort_index()
+        frame.index.name = 'date'
+        return frame
+
+    # ------------------ index ------------------
+    def _index_path(self) -> Path:
+        return self.path / "_index.json"
+
+    def _read_index(self) -> Dict[str, str]:
+        if not self._index_path().exists():
+            return {}
+        with open(self._index_path(), 'r') as f:
+            return json.load(f)
+
+    def _write_index(self, index: Dict[str, str]):
+        tmp_path = self.path / "_index.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _migrate_legacy(self):
+        """Convert a session's old ``pricing_data.json`` into column files, once."""
+        legacy_path = self.session_path / LEGACY_FILE
+        if not legacy_path.exists() or self._index_path().exists():
+            return
+        try:
+            with open(legacy_path, 'r') as f:
+                legacy = json.load(f)
+            records = pd.DataFrame(legacy.get('data', []))
+            if not records.empty:
+                records['date'] = pd.to_datetime(records['date'])
+                for ticker in legacy.get('tickers', []):
+                    if ticker in records.columns:
+                        column = records[['date', ticker]].dropna().sort_values('date')
+                        column[ticker] = column[ticker].astype(np.float64)
+                        self.add(pa.Table.from_pandas(column, preserve_index=False))
+            legacy_path.unlink()
+            print(f"Migrated {legacy_path} to the columnar session pricing store")
+        except Exception as e:
+            print(f"Error migrating legacy session pricing data: {str(e)}")
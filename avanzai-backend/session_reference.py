@@ -0,0 +1,109 @@
+"""
+session_reference.py
+
+Copy-free session pricing: a session keeps a reference to the shared pricing
+snapshot (snapshot version + tickers + date window) instead of a private copy
+of the prices.
+
+References are stored in the session metadata and resolved lazily. A warm
+in-memory snapshot cache for the referenced file is sliced without copying;
+otherwise only the referenced columns and date window are fetched with S3
+Range GETs. Catalogued snapshots are immutable files, so a reference keeps
+returning the same prices after the ``analysis``/``latest`` alias has moved
+on. Uncatalogued legacy keys are mutable and resolve to their current
+contents: their ETag is checked on every resolve (see :meth:`PricingReference.tag`)
+so neither a cached footer nor a cached frame outlives an overwrite. Only
+user-uploaded ``custom`` data is still materialized per session.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, replace
+from typing import List, Optional, Tuple
+
+import pyarrow as pa
+
+from pricing_catalog import SnapshotRef
+from pricing_snapshot import peek_snapshot_cache
+from s3_range_reader import get_range_reader
+
+
+@dataclass(frozen=True)
+class PricingReference:
+    """The slice of a shared pricing snapshot a session works with."""
+    version: str
+    key: str
+    bucket: str
+    tickers: Tuple[str, ...]
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    # Catalogued snapshot files never change; legacy keys may be overwritten in place
+    immutable: bool = False
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        ref: SnapshotRef,
+        tickers: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> "PricingReference":
+        """
+        Reference ``tickers`` in the snapshot ``ref`` currently resolves to.
+
+        Raises:
+            ValueError: If the snapshot's manifest entry lists its tickers and
+                some requested ones are not among them.
+        """
+        known = ref.tickers
+        if known is not None:
+            missing = [t for t in tickers if t not in set(known)]
+            if missing:
+                raise ValueError(f"Tickers not in pricing snapshot {ref.version}: {missing}")
+        return cls(version=ref.version, key=ref.key, bucket=ref.bucket, tickers=tuple(tickers),
+                   start_date=start_date, end_date=end_date, immutable=ref.entry is not None)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PricingReference":
+        return cls(**{**data, "tickers": tuple(data["tickers"])})
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "tickers": list(self.tickers)}
+
+    def with_tickers(self, tickers: List[str]) -> "PricingReference":
+        """Same snapshot and window with ``tickers`` added (existing order kept)."""
+        added = [t for t in tickers if t not in self.tickers]
+        return replace(self, tickers=self.tickers + tuple(added)) if added else self
+
+    def tag(self) -> Optional[str]:
+        """Current ETag of a mutable (legacy) key, None for immutable snapshots; part of cache versions."""
+        if self.immutable:
+            return None
+        return get_range_reader(self.key, self.bucket).index(refresh=True).etag
+
+    def resolve(self, tickers: Optional[List[str]] = None) -> pa.Table:
+        """
+        Return ``date`` plus the referenced tickers (or the ``tickers`` subset) as an Arrow table.
+
+        Raises:
+            KeyError: If a requested ticker is not part of the reference.
+        """
+        tickers = list(self.tickers) if tickers is None else tickers
+        missing = [t for t in tickers if t not in self.tickers]
+        if missing:
+            raise KeyError(f"Tickers not in session pricing reference: {missing}")
+        columns = ['date'] + tickers
+
+        cache = peek_snapshot_cache(self.key, self.bucket)
+        warm = cache.get() if cache is not None and cache.is_loaded else None
+        reader = get_range_reader(self.key, self.bucket)
+        if self.immutable:
+            if warm is not None:
+                return warm.select(columns, self.start_date, self.end_date)
+            reader.index()
+        else:
+            # A mutable key is checked against its current ETag: the footer is
+            # re-read after an overwrite and an outdated warm copy is skipped
+            index = reader.index(refresh=True)
+            if warm is not None and warm.etag == index.etag:
+                return warm.select(columns, self.start_date, self.end_date)
+        return reader.read(columns, start_date=self.start_date, end_date=self.end_date)
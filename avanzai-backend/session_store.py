@@ -0,0 +1,259 @@
+"""
+session_store.py
+
+SQLite (WAL mode) backend for session metadata, summaries, ticker holdings,
+request statistics and artifact records.
+
+:class:`SQLiteSessionDocuments` is a drop-in replacement for
+``session_io.SessionDocuments``: the session summary and metadata are still
+handled as JSON documents by ``SessionManager``, but each one is stored as a
+row and every update is a single ``BEGIN IMMEDIATE`` transaction, so
+concurrent writers (threads or worker processes) never lose updates. The
+fields worth querying across sessions are written to indexed columns and side
+tables on each update, which answers "which sessions hold AAPL" or "largest
+sessions" without opening a file. Parquet stays the format for bulk frames.
+
+Documents that only exist as JSON files (sessions created before the store)
+are imported the first time they are read.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_documents (
+    session_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (session_id, name)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT,
+    last_updated TEXT,
+    last_accessed TEXT,
+    last_cleanup TEXT,
+    total_files INTEGER DEFAULT 0,
+    total_size_bytes INTEGER DEFAULT 0,
+    total_requests INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_size ON sessions (total_size_bytes);
+CREATE INDEX IF NOT EXISTS idx_sessions_accessed ON sessions (last_accessed);
+CREATE TABLE IF NOT EXISTS session_tickers (
+    session_id TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (session_id, ticker, source)
+);
+CREATE INDEX IF NOT EXISTS idx_session_tickers_ticker ON session_tickers (ticker);
+CREATE TABLE IF NOT EXISTS session_requests (
+    session_id TEXT NOT NULL,
+    operation_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (session_id, operation_type)
+);
+CREATE TABLE IF NOT EXISTS session_artifacts (
+    session_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    recorded_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (session_id, path)
+);
+"""
+
+SUMMARY = "session_summary"
+METADATA = "metadata"
+
+
+class SQLiteSessionDocuments:
+    """Session documents and cross-session indexes in one SQLite database."""
+
+    def __init__(self, db_path: Path, dump_kwargs: Optional[Dict[str, Any]] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.dump_kwargs = dump_kwargs or {}
+        self._local = threading.local()
+        self._locks: Dict[Hashable, threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the single writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # ------------------ SessionDocuments interface ------------------
+    def lock(self, *key: Hashable) -> threading.RLock:
+        """In-process lock for work that is not a single document update (e.g. fetching a ticker)."""
+        key = tuple(str(k) for k in key)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    def read(self, session_id: str, path: Path) -> Optional[dict]:
+        """Return the document stored for ``path``'s name, importing the JSON file if only that exists."""
+        row = self._connect().execute(
+            "SELECT body FROM session_documents WHERE session_id = ? AND name = ?",
+            (str(session_id), Path(path).stem)
+        ).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        if Path(path).exists():
+            return self.update(session_id, path, lambda current: current or self._load_file(path))
+        return None
+
+    def update(self, session_id: str, path: Path, mutate: Callable[[Optional[dict]], dict]) -> Optional[dict]:
+        """Apply ``mutate`` to the document inside one write transaction and refresh the indexes."""
+        session_id, name = str(session_id), Path(path).stem
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT body FROM session_documents WHERE session_id = ? AND name = ?",
+                (session_id, name)
+            ).fetchone()
+            document = mutate(json.loads(row[0]) if row is not None else None)
+            if document is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO session_documents (session_id, name, body) VALUES (?, ?, ?)",
+                    (session_id, name, json.dumps(document, **self.dump_kwargs))
+                )
+                self._index(conn, session_id, name, document)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return document
+
+    def flush(self, path: Optional[Path] = None):
+        """Nothing to flush: every update is committed immediately."""
+
+    def discard(self, session_id: str):
+        """Remove every row belonging to a session."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("session_documents", "sessions", "session_tickers",
+                          "session_requests", "session_artifacts"):
+                conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (str(session_id),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ------------------ artifacts ------------------
+    def record_artifact(self, session_id: str, relative_path: str, size_bytes: int):
+        """Record (or update) a file written into a session."""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO session_artifacts (session_id, path, size_bytes) VALUES (?, ?, ?)",
+            (str(session_id), relative_path, size_bytes)
+        )
+
+    def delete_artifact(self, session_id: str, relative_path: str):
+        self._connect().execute(
+            "DELETE FROM session_artifacts WHERE session_id = ? AND path = ?",
+            (str(session_id), relative_path)
+        )
+
+    def replace_artifacts(self, session_id: str, sizes: Dict[str, int]):
+        """Replace a session's artifact records with ``{relative path: size}`` (after a directory rescan)."""
+        session_id = str(session_id)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM session_artifacts WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                "INSERT INTO session_artifacts (session_id, path, size_bytes) VALUES (?, ?, ?)",
+                [(session_id, relative, size) for relative, size in sizes.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ------------------ cross-session queries ------------------
+    def sessions_holding(self, ticker: str) -> List[str]:
+        """Sessions that hold ``ticker`` in their pricing data or metadata."""
+        rows = self._connect().execute(
+            "SELECT DISTINCT session_id FROM session_tickers WHERE ticker = ? ORDER BY session_id",
+            (ticker,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def largest_sessions(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Sessions ordered by stored bytes, largest first.
+
+        Sizes are summed from ``session_artifacts``, which every file write and
+        delete updates, rather than read from the summary document's counters.
+        """
+        rows = self._connect().execute(
+            "SELECT a.session_id, SUM(a.size_bytes) AS size_bytes, COUNT(*), s.last_accessed "
+            "FROM session_artifacts a LEFT JOIN sessions s ON s.session_id = a.session_id "
+            "GROUP BY a.session_id ORDER BY size_bytes DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            {"session_id": r[0], "total_size_bytes": r[1], "total_files": r[2], "last_accessed": r[3]}
+            for r in rows
+        ]
+
+    def request_counts(self) -> Dict[str, int]:
+        """Requests by operation type summed over all sessions."""
+        rows = self._connect().execute(
+            "SELECT operation_type, SUM(count) FROM session_requests GROUP BY operation_type"
+        ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    # ------------------ indexing ------------------
+    @staticmethod
+    def _load_file(path: Path) -> Optional[dict]:
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _index(self, conn: sqlite3.Connection, session_id: str, name: str, document: dict):
+        conn.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+        if name == SUMMARY:
+            storage = document.get("storage", {})
+            statistics = document.get("statistics", {})
+            conn.execute(
+                "UPDATE sessions SET created_at = ?, last_updated = ?, last_cleanup = ?, "
+                "total_files = ?, total_size_bytes = ?, total_requests = ? WHERE session_id = ?",
+                (document.get("created_at"), document.get("last_updated"), storage.get("last_cleanup"),
+                 storage.get("total_files", 0), storage.get("total_size_bytes", 0),
+                 statistics.get("total_requests", 0), session_id)
+            )
+            tickers = document.get("data_holdings", {}).get("pricing_data", {}).get("tickers", {})
+            self._replace_tickers(conn, session_id, "summary", list(tickers))
+            conn.execute("DELETE FROM session_requests WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                "INSERT INTO session_requests (session_id, operation_type, count) VALUES (?, ?, ?)",
+                [(session_id, op, count) for op, count in statistics.get("requests_by_type", {}).items()]
+            )
+        elif name == METADATA:
+            conn.execute(
+                "UPDATE sessions SET last_accessed = COALESCE(?, last_accessed) WHERE session_id = ?",
+                (document.get("last_accessed"), session_id)
+            )
+            tickers = document.get("tickers") or []
+            self._replace_tickers(conn, session_id, "metadata", [t for t in tickers if isinstance(t, str)])
+
+    @staticmethod
+    def _replace_tickers(conn: sqlite3.Connection, session_id: str, source: str, tickers: List[str]):
+        conn.execute("DELETE FROM session_tickers WHERE session_id = ? AND source = ?", (session_id, source))
+        conn.executemany(
+            "INSERT OR IGNORE INTO session_tickers (session_id, ticker, source) VALUES (?, ?, ?)",
+            [(session_id, ticker, source) for ticker in tickers]
+        )
@@ -0,0 +1,221 @@
+"""
+transforms.py
+
+Registry of vectorized time-series transforms used by ``process_stock_data``.
+
+Each transform maps a date-by-ticker :class:`~returns_engine.PriceMatrix` to a
+matrix of the same shape plus one summary value per ticker, in a single
+NumPy pass over all tickers. New analyses are added by registering a
+function with :func:`register_transform`, not by adding per-ticker loops to
+the request path.
+
+Rolling transforms are computed with ``window`` extra rows of history before
+the requested start date, so their first reported values are already
+complete. Returns-based transforms use the matrix's precomputed daily
+returns (materialized per snapshot by ``returns_store``) when attached. A
+rolling statistic needs at least half a window of valid observations,
+otherwise it is NaN.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from returns_engine import TRADING_DAYS_PER_YEAR, PriceMatrix, compute_returns, forward_fill
+
+DEFAULT_WINDOW = 63
+DEFAULT_BENCHMARK = "SPY"
+
+
+@dataclass
+class TransformParams:
+    window: int = DEFAULT_WINDOW
+    benchmark: Optional[str] = None
+
+
+@dataclass
+class TransformOutput:
+    """``values`` is ``(dates, tickers)``; ``summary`` holds one number per ticker."""
+    values: np.ndarray
+    summary: Dict[str, float]
+    summary_label: str
+
+
+@dataclass(frozen=True)
+class TransformSpec:
+    name: str
+    description: str
+    fn: Callable[[PriceMatrix, TransformParams], TransformOutput]
+    rolling: bool = False
+    needs_benchmark: bool = False
+    decimals: int = 4   # rounding of the values and summary in API responses
+
+
+TRANSFORMS: Dict[str, TransformSpec] = {}
+
+
+def register_transform(name: str, description: str, rolling: bool = False, needs_benchmark: bool = False,
+                       decimals: int = 4):
+    """Decorator adding a transform to :data:`TRANSFORMS` under ``name``."""
+    def decorator(fn: Callable[[PriceMatrix, TransformParams], TransformOutput]):
+        TRANSFORMS[name] = TransformSpec(name, description, fn, rolling, needs_benchmark, decimals)
+        return fn
+    return decorator
+
+
+def describe_transforms() -> Dict[str, str]:
+    return {name: spec.description for name, spec in TRANSFORMS.items()}
+
+
+@dataclass
+class TransformResult:
+    name: str
+    dates: np.ndarray
+    tickers: List[str]
+    values: np.ndarray
+    summary: Dict[str, float] = field(default_factory=dict)
+    summary_label: str = "values"
+
+
+def run_transform(
+    name: str,
+    matrix: PriceMatrix,
+    tickers: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    params: Optional[TransformParams] = None
+) -> TransformResult:
+    """
+    Apply transform ``name`` to ``tickers`` of ``matrix`` over ``[start_date, end_date]``.
+
+    ``matrix`` may contain extra columns (e.g. the benchmark) and extra
+    history, which rolling transforms use as warm-up.
+
+    Raises:
+        ValueError: For an unknown transform, a missing benchmark, or fewer than two rows in range.
+    """
+    spec = TRANSFORMS.get(name)
+    if spec is None:
+        raise ValueError(f"Transformation type '{name}' not supported. Supported types: {', '.join(TRANSFORMS)}")
+    params = params or TransformParams()
+
+    columns = list(tickers)
+    if spec.needs_benchmark:
+        params.benchmark = params.benchmark or DEFAULT_BENCHMARK
+        if params.benchmark not in matrix.tickers:
+            raise ValueError(f"Benchmark {params.benchmark} not found in the session's pricing data")
+        columns.append(params.benchmark)
+
+    in_range = matrix.window(start_date, end_date)
+    if len(in_range.dates) < 2:
+        raise ValueError("Insufficient data after date filtering. Need at least two data points.")
+    lo = np.searchsorted(matrix.dates, in_range.dates[0], 'left')
+    warmup = min(lo, params.window) if spec.rolling else 0
+    hi = lo + len(in_range.dates)
+
+    index = [matrix.tickers.index(t) for t in columns]
+    daily = matrix.daily[lo - warmup:hi][:, index] if matrix.daily is not None else None
+    subset = PriceMatrix(dates=matrix.dates[lo - warmup:hi], tickers=columns,
+                         values=matrix.values[lo - warmup:hi][:, index], daily=daily)
+    output = spec.fn(subset, params)
+
+    values = output.values[warmup:, :len(tickers)]
+    summary = {t: output.summary[t] for t in tickers if t in output.summary}
+    return TransformResult(name, subset.dates[warmup:], list(tickers), values, summary, output.summary_label)
+
+
+# ------------------ helpers ------------------
+def _rolling_sums(x: np.ndarray, window: int):
+    """Rolling ``(count, sum, sum of squares)`` over rows, ignoring NaNs."""
+    valid = ~np.isnan(x)
+    zeroed = np.where(valid, x, 0.0)
+    stacked = np.stack([valid.astype(np.float64), zeroed, zeroed * zeroed])
+    prefix = np.zeros((3, x.shape[0] + 1, x.shape[1]))
+    np.cumsum(stacked, axis=1, out=prefix[:, 1:])
+    sums = prefix[:, window:] - prefix[:, :-window] if x.shape[0] >= window else prefix[:, :0]
+    out = np.full((3,) + x.shape, np.nan)
+    out[:, window - 1:] = sums
+    # Rows before a full window use everything seen so far
+    head = min(window - 1, x.shape[0])
+    out[:, :head] = prefix[:, 1:head + 1]
+    return out[0], out[1], out[2]
+
+
+def _rolling_mean_std(x: np.ndarray, window: int):
+    count, total, squares = _rolling_sums(x, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = (squares - total * mean) / (count - 1)
+        std = np.sqrt(np.maximum(variance, 0.0))
+    enough = count >= max(2, window // 2 + 1)
+    return np.where(enough, mean, np.nan), np.where(enough, std, np.nan)
+
+
+def _last_valid(values: np.ndarray, tickers: List[str]) -> Dict[str, float]:
+    last = forward_fill(values)[-1] if len(values) else np.full(len(tickers), np.nan)
+    return {t: float(v) for t, v in zip(tickers, last) if not np.isnan(v)}
+
+
+# ------------------ transforms ------------------
+@register_transform("cumulative_performance", "Growth of 100 invested on the first date", decimals=2)
+def cumulative_performance(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    values = 100 * (compute_returns(matrix).cumulative + 1)
+    return TransformOutput(values, _last_valid(values, matrix.tickers), "cumulative_returns")
+
+
+@register_transform("drawdown", "Decline from the running peak price (0 at a new high)")
+def drawdown(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    filled = forward_fill(np.where(matrix.values > 0, matrix.values, np.nan))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = filled / np.fmax.accumulate(filled, axis=0) - 1
+    summary = {t: float(np.nanmin(values[:, i])) for i, t in enumerate(matrix.tickers)
+               if not np.isnan(values[:, i]).all()}
+    return TransformOutput(values, summary, "max_drawdown")
+
+
+@register_transform("rolling_volatility", "Annualized standard deviation of daily returns over the window",
+                    rolling=True)
+def rolling_volatility(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    _, std = _rolling_mean_std(matrix.daily_returns(), params.window)
+    values = std * np.sqrt(TRADING_DAYS_PER_YEAR)
+    return TransformOutput(values, _last_valid(values, matrix.tickers), "latest_volatility")
+
+
+@register_transform("rolling_sharpe", "Annualized mean over standard deviation of daily returns (risk-free rate 0)",
+                    rolling=True)
+def rolling_sharpe(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    mean, std = _rolling_mean_std(matrix.daily_returns(), params.window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(std > 0, mean / std * np.sqrt(TRADING_DAYS_PER_YEAR), np.nan)
+    return TransformOutput(values, _last_valid(values, matrix.tickers), "latest_sharpe")
+
+
+@register_transform("rolling_beta", "Beta of daily returns to the benchmark (last column) over the window",
+                    rolling=True, needs_benchmark=True)
+def rolling_beta(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    daily = matrix.daily_returns()
+    bench = daily[:, -1:]
+    # Only days where both the ticker and the benchmark have a return count
+    paired = ~np.isnan(daily) & ~np.isnan(bench)
+    x = np.where(paired, bench, np.nan)
+    y = np.where(paired, daily, np.nan)
+    count, sum_x, sum_xx = _rolling_sums(x, params.window)
+    _, sum_y, _ = _rolling_sums(y, params.window)
+    _, sum_xy, _ = _rolling_sums(np.where(paired, bench * daily, np.nan), params.window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_xy - sum_x * sum_y / count
+        variance = sum_xx - sum_x * sum_x / count
+        values = np.where((count >= max(2, params.window // 2 + 1)) & (variance > 0), covariance / variance, np.nan)
+    return TransformOutput(values, _last_valid(values, matrix.tickers), "latest_beta")
+
+
+@register_transform("zscore", "Distance of the price from its rolling mean in rolling standard deviations",
+                    rolling=True)
+def zscore(matrix: PriceMatrix, params: TransformParams) -> TransformOutput:
+    prices = np.where(matrix.values > 0, matrix.values, np.nan)
+    mean, std = _rolling_mean_std(prices, params.window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(std > 0, (prices - mean) / std, np.nan)
+    return TransformOutput(values, _last_valid(values, matrix.tickers), "latest_zscore")